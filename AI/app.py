@@ -6,12 +6,15 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
+import asyncio
+import time
 import uvicorn
 import os
 import yaml
 from pathlib import Path
 
 from src.orchestrator import RAGPipeline, PipelineConfig
+from src.admission import AdmissionController, Overloaded
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -29,8 +32,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global pipeline instance
+# Global pipeline instance and its admission controller
 pipeline = None
+admission = None
+
+# Admitted /query runs by coalescing key; identical requests await them
+# without holding admission capacity or queue slots
+in_flight: Dict[Any, asyncio.Future] = {}
+coalesced_requests = 0
 
 class QueryRequest(BaseModel):
     query: str
@@ -55,19 +64,51 @@ def load_config(config_path: str = "config.yml") -> Dict[str, Any]:
 
 def initialize_pipeline():
     """Initialize the RAG pipeline."""
-    global pipeline
+    global pipeline, admission
     try:
         config_dict = load_config()
         pipeline = RAGPipeline(PipelineConfig(**config_dict))
+        admission = AdmissionController(
+            capacity=pipeline.config.admission_capacity,
+            max_queue=pipeline.config.admission_max_queue,
+            queue_timeout=pipeline.config.admission_queue_timeout,
+            method_costs=pipeline.config.admission_method_costs
+        )
         print("RAG pipeline initialized successfully")
     except Exception as e:
         print(f"Failed to initialize RAG pipeline: {e}")
         pipeline = None
 
+def preload_pipeline():
+    """
+    Load the embedding model weights and map an up-to-date vector index.
+    
+    Called from the gunicorn master (see gunicorn.conf.py) before workers are
+    forked, so model weights and index pages are shared copy-on-write instead
+    of being loaded once per worker. Nothing is embedded or built here: with
+    the Chroma store, or a missing or stale mmap index, each worker builds the
+    index after fork (run ``python -m src --build-index`` before deploying to
+    avoid that).
+    """
+    initialize_pipeline()
+    if pipeline is not None:
+        pipeline.preload()
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the pipeline on startup."""
-    initialize_pipeline()
+    """Initialize the pipeline on startup and warm it up in the background."""
+    if pipeline is None:
+        initialize_pipeline()
+    if pipeline is not None:
+        # Components load lazily; warming them off the event loop lets the
+        # server accept requests (and health checks) immediately.
+        app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(pipeline.warm_up))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled connections to the LLM provider."""
+    if pipeline is not None:
+        await pipeline.http_pool.aclose()
 
 @app.get("/")
 async def root():
@@ -81,9 +122,17 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
+    components = pipeline.component_status() if pipeline is not None else {}
     return {
         "status": "healthy",
-        "pipeline_initialized": pipeline is not None
+        "pipeline_initialized": pipeline is not None,
+        "pipeline_ready": bool(components) and all(
+            state in ("ready", "disabled") for state in components.values()
+        ),
+        "components": components,
+        "caches": pipeline.cache_stats() if pipeline is not None else {},
+        "coalescing": pipeline.single_flight.stats() if pipeline is not None else {},
+        "timestamp": time.time()
     }
 
 @app.post("/query", response_model=QueryResponse)
@@ -95,27 +144,90 @@ async def process_query(request: QueryRequest):
             detail="RAG pipeline not initialized. Please check the configuration."
         )
     
+    global coalesced_requests
+    
+    # Prepare configuration
+    config_dict = load_config()
+    if request.config_override:
+        config_dict.update(request.config_override)
+    
+    # Override method if specified
+    if request.method != "basic":
+        config_dict["transformation_method"] = request.method
+    
+    # Identical requests join the run already admitted for them, so a burst of
+    # the same question costs one admission instead of being shed
+    key = pipeline.coalescing_key(request.query, config_dict) if pipeline.config.coalesce_requests else None
+    flight = in_flight.get(key) if key is not None else None
+    if flight is not None:
+        coalesced_requests += 1
+        result = await asyncio.shield(flight)
+        return QueryResponse(**pipeline.shared_result(result, request.query))
+    
+    if key is not None:
+        flight = in_flight[key] = asyncio.get_running_loop().create_future()
     try:
-        # Prepare configuration
-        config_dict = load_config()
-        if request.config_override:
-            config_dict.update(request.config_override)
-        
-        # Override method if specified
-        if request.method != "basic":
-            config_dict["transformation_method"] = request.method
-        
-        # Run pipeline
-        result = pipeline.run_pipeline(request.query, config_dict)
-        
-        return QueryResponse(**result)
-        
+        result = await admit_and_run(request, config_dict)
+    except BaseException as e:
+        if flight is not None:
+            if isinstance(e, Exception):
+                flight.set_exception(e)
+                flight.exception()  # Retrieved here so a flight without followers does not warn
+            else:
+                flight.cancel()
+        raise
+    finally:
+        if key is not None:
+            del in_flight[key]
+    
+    if flight is not None:
+        flight.set_result(result)
+    return QueryResponse(**result)
+
+async def admit_and_run(request: QueryRequest, config_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a query once admission control lets it in."""
+    # Shed load up front instead of letting requests time out in a pile-up
+    method = request.method
+    if method == "basic" and request.config_override:
+        method = request.config_override.get("transformation_method", method)
+    try:
+        async with admission.admit(method):
+            return await run_query(request.query, config_dict)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Server busy: {e.reason}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def run_query(query: str, config_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Run an admitted query through the pipeline."""
+    try:
+        # Run pipeline off the event loop so concurrent requests overlap
+        return await asyncio.to_thread(pipeline.run_pipeline, query, config_dict)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing query: {str(e)}"
         )
 
+@app.get("/metrics")
+async def metrics():
+    """Admission, LLM, connection pool, coalescing and cache metrics for this worker process."""
+    return {
+        "pid": os.getpid(),
+        "admission": admission.stats() if admission is not None else {},
+        "llm": pipeline.llm_scheduler.stats() if pipeline is not None else {},
+        "http_pool": pipeline.http_pool.stats() if pipeline is not None else {},
+        "coalescing": {
+            **pipeline.single_flight.stats(),
+            "api_coalesced": coalesced_requests,
+            "api_in_flight": len(in_flight)
+        } if pipeline is not None else {},
+        "caches": pipeline.cache_stats() if pipeline is not None else {},
+        "timestamp": time.time()
+    }
+
 @app.get("/methods")
 async def get_available_methods():
     """Get available query transformation methods."""
@@ -126,7 +238,9 @@ async def get_available_methods():
             "rag_fusion",
             "decomposition",
             "step_back",
-            "hyde"
+            "hyde",
+            "corrective",
+            "auto"
         ]
     }
 
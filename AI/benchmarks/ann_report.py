@@ -0,0 +1,113 @@
+"""
+Recall@k vs latency report for the ANN search backends.
+
+Every backend is compared against exact search on the same queries. Queries
+are stored chunk vectors with added noise, so no embedding model is needed.
+
+Usage (from the AI directory):
+    python -m benchmarks.ann_report --index-dir .rag_cache/vectors
+    python -m benchmarks.ann_report --synthetic 1000000 --dim 384 --nprobe 8,16,32 --ef 32,64,128
+"""
+
+import argparse
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from src.ann import ExactSearcher, build_searcher
+from src.vector_index import FlatIndexWriter, FlatVectorIndex
+
+
+def build_synthetic_index(index_dir: str, count: int, dim: int, clusters: int = 1000, seed: int = 0) -> FlatVectorIndex:
+    """Write a clustered random corpus (similar in shape to real embeddings) in batches."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    with FlatIndexWriter(index_dir, dtype="float16") as writer:
+        for start in range(0, count, 100_000):
+            size = min(100_000, count - start)
+            labels = rng.integers(clusters, size=size)
+            vectors = centers[labels] + 2.0 * rng.normal(size=(size, dim)).astype(np.float32)
+            texts = [f"chunk {i}" for i in range(start, start + size)]
+            writer.add(texts, [{"source": "synthetic"}] * size, vectors)
+    return writer.index
+
+
+def sample_queries(index: FlatVectorIndex, n: int, noise: float = 0.8, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(len(index), min(n, len(index)), replace=False))
+    vectors = np.asarray(index.vectors[ids], dtype=np.float32)
+    return vectors + noise * rng.normal(size=vectors.shape).astype(np.float32) / np.sqrt(index.dim)
+
+
+def run(searcher, queries: np.ndarray, k: int) -> tuple:
+    """Return (result ids per query, latencies in ms)."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = searcher.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({chunk_id for chunk_id, _ in hits})
+    return results, np.asarray(latencies)
+
+
+def report_row(name: str, build_s: float, results: List[set], truth: List[set], latencies: np.ndarray, k: int) -> str:
+    recall = np.mean([len(got & expected) / k for got, expected in zip(results, truth)])
+    return (
+        f"| {name:<24} | {build_s:8.2f} | {recall:8.3f} | {latencies.mean():8.2f} "
+        f"| {np.percentile(latencies, 50):8.2f} | {np.percentile(latencies, 99):8.2f} |"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall@k vs latency report")
+    parser.add_argument("--index-dir", help="Existing mmap index (see vector_store: mmap)")
+    parser.add_argument("--synthetic", type=int, default=100_000, help="Synthetic corpus size when no index is given")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=4, help="Results per query")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF clusters (default sqrt(n))")
+    parser.add_argument("--nprobe", default="1,4,8,16,32", help="Comma-separated IVF nprobe values")
+    parser.add_argument("--ef", default="16,32,64,128", help="Comma-separated HNSW ef values")
+    parser.add_argument("--hnsw-m", type=int, default=16, help="HNSW graph degree")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.index_dir:
+            index = FlatVectorIndex(args.index_dir)
+        else:
+            print(f"Building synthetic index with {args.synthetic} x {args.dim} vectors...")
+            index = build_synthetic_index(f"{tmp_dir}/vectors", args.synthetic, args.dim)
+            
+        queries = sample_queries(index, args.queries)
+        truth, exact_latencies = run(ExactSearcher(index), queries, args.k)
+        
+        print(f"\n{len(index)} chunks, dim {index.dim}, {len(queries)} queries, recall@{args.k}\n")
+        print("| backend                  | build s  | recall   | mean ms  | p50 ms   | p99 ms   |")
+        print("|--------------------------|----------|----------|----------|----------|----------|")
+        print(report_row("exact", 0.0, truth, truth, exact_latencies, args.k))
+        
+        start = time.perf_counter()
+        ivf = build_searcher(index, "ivf", {"nlist": args.nlist})
+        build_s = time.perf_counter() - start
+        for nprobe in map(int, args.nprobe.split(",")):
+            ivf.nprobe = nprobe
+            results, latencies = run(ivf, queries, args.k)
+            print(report_row(f"ivf nlist={ivf.nlist} nprobe={nprobe}", build_s, results, truth, latencies, args.k))
+            
+        try:
+            start = time.perf_counter()
+            hnsw = build_searcher(index, "hnsw", {"m": args.hnsw_m})
+            build_s = time.perf_counter() - start
+        except ImportError:
+            print("\nhnsw skipped: install hnswlib to include it")
+            return
+        for ef in map(int, args.ef.split(",")):
+            hnsw.ef = ef
+            results, latencies = run(hnsw, queries, args.k)
+            print(report_row(f"hnsw m={args.hnsw_m} ef={ef}", build_s, results, truth, latencies, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Chunking speed report: character splitter vs token-aware chunker.
+
+Replicates the policy corpus ``--scale`` times and times each splitter over
+it, reporting chunk counts and token sizes measured with the same tokenizer.
+The "recursive tokens" row is the notebook's splitter (rag/rag_ecosystem.py:
+``RecursiveCharacterTextSplitter.from_tiktoken_encoder`` with 200/20), so run
+with the tiktoken encoding available; without it the row re-tokenizes with the
+fallback word-piece count instead and the sizes are only approximate.
+
+Usage (from the AI directory):
+    python -m benchmarks.chunker_report --scale 100 --chunk-tokens 200
+"""
+
+import argparse
+import time
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.chunking import TokenChunker
+from src.ingest import discover_files, read_documents
+
+
+def load_corpus(path: str, scale: int):
+    docs = list(read_documents(discover_files(path)))
+    return [
+        Document(page_content=doc.page_content, metadata={"source": f"{doc.metadata['source']}#{i}"})
+        for i in range(scale)
+        for doc in docs
+    ]
+
+
+def measure(name: str, splitter, docs, chunker: TokenChunker):
+    start = time.perf_counter()
+    chunks = splitter.split_documents(docs)
+    elapsed = time.perf_counter() - start
+    # Token sizes are measured on a sample to keep the report itself fast
+    sizes = [chunker.count_tokens(chunk.page_content) for chunk in chunks[:2000]]
+    print(
+        f"| {name:<34} | {elapsed:8.2f} | {len(chunks):8d} "
+        f"| {sum(sizes) / max(len(sizes), 1):8.1f} | {max(sizes, default=0):8d} |"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunker benchmark")
+    parser.add_argument("--documents-path", default="rag/uptiq_hr_policies", help="Corpus directory")
+    parser.add_argument("--scale", type=int, default=100, help="Times to replicate the corpus")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Character splitter chunk size")
+    parser.add_argument("--chunk-overlap", type=int, default=20, help="Character splitter overlap")
+    parser.add_argument("--chunk-tokens", type=int, default=200, help="Token chunk size")
+    parser.add_argument("--overlap-tokens", type=int, default=20, help="Token overlap")
+    parser.add_argument("--encoding", default="cl100k_base", help="tiktoken encoding")
+    args = parser.parse_args()
+    
+    docs = load_corpus(args.documents_path, args.scale)
+    characters = sum(len(doc.page_content) for doc in docs)
+    chunker = TokenChunker(args.chunk_tokens, args.overlap_tokens, args.encoding)
+    tokenizer = args.encoding if chunker.encoding is not None else "fallback word-piece"
+    
+    print(f"\n{len(docs)} documents, {characters:,} characters, tokenizer: {tokenizer}\n")
+    print("| splitter                           | seconds  | chunks   | avg tok  | max tok  |")
+    print("|------------------------------------|----------|----------|----------|----------|")
+    measure(
+        f"recursive chars={args.chunk_size}",
+        RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, add_start_index=True),
+        docs,
+        chunker
+    )
+    # Token-sized recursive splitting: every candidate piece is re-tokenized
+    # to measure its length
+    if chunker.encoding is not None:
+        recursive_tokens = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=args.encoding,
+            chunk_size=args.chunk_tokens,
+            chunk_overlap=args.overlap_tokens
+        )
+    else:
+        recursive_tokens = RecursiveCharacterTextSplitter(
+            chunk_size=args.chunk_tokens,
+            chunk_overlap=args.overlap_tokens,
+            length_function=chunker.count_tokens
+        )
+    measure(f"recursive tokens={args.chunk_tokens}", recursive_tokens, docs, chunker)
+    measure(f"token chunker tokens={args.chunk_tokens}", chunker, docs, chunker)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Connection reuse report: per-pipeline LLM clients vs the shared HTTP pool.
+
+Runs concurrent requests against the local stub chat-completions server, each
+making the LLM calls of one pipeline method (multi-query: generate queries,
+then answer; decomposition: sub-questions, one answer per sub-question, then
+the final answer). "per-pipeline" builds a fresh ChatGroq for every request, as
+separate pipelines or CLI runs do (on a private pool closed afterwards, so
+connections are not reused across requests); "shared pool" gives every client the
+process-wide HTTPClientPool. Counts come from the stub, so they are the TCP
+connections the server actually accepted.
+
+Usage (from the AI directory):
+    python -m benchmarks.http_pool_report --requests 32 --concurrency 8
+    python -m benchmarks.http_pool_report --delay 0.05 --mode async
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_groq import ChatGroq
+
+from benchmarks.stub_llm_server import StubLLMServer
+from src.http_pool import HTTPClientPool
+
+# LLM calls made by one request of each method
+FAN_OUT = {
+    "multi_query": 2,
+    "decomposition": 5,
+}
+
+
+def make_client(url: str, pool: HTTPClientPool) -> ChatGroq:
+    return ChatGroq(
+        model="stub-model",
+        api_key="stub",
+        base_url=url,
+        max_retries=0,
+        timeout=30,
+        http_client=pool.sync_client,
+        http_async_client=pool.async_client
+    )
+
+
+def run_sync(url: str, pool: Optional[HTTPClientPool], calls: int, requests: int, concurrency: int) -> List[float]:
+    shared = make_client(url, pool) if pool else None
+    
+    def request(i: int) -> float:
+        private = None if shared else HTTPClientPool()
+        llm = shared or make_client(url, private)
+        start = time.perf_counter()
+        for call in range(calls):
+            llm.invoke(f"request {i} call {call}")
+        elapsed = time.perf_counter() - start
+        if private:
+            private.close()
+        return elapsed
+        
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(request, range(requests)))
+    finally:
+        if pool:
+            pool.close()
+
+
+def run_async(url: str, pool: Optional[HTTPClientPool], calls: int, requests: int, concurrency: int) -> List[float]:
+    async def main() -> List[float]:
+        shared = make_client(url, pool) if pool else None
+        limit = asyncio.Semaphore(concurrency)
+        
+        async def request(i: int) -> float:
+            async with limit:
+                private = None if shared else HTTPClientPool()
+                llm = shared or make_client(url, private)
+                start = time.perf_counter()
+                # Sub-questions of one request fan out concurrently
+                await asyncio.gather(*(llm.ainvoke(f"request {i} call {call}") for call in range(calls)))
+                elapsed = time.perf_counter() - start
+                if private:
+                    await private.aclose()
+                return elapsed
+                
+        try:
+            return await asyncio.gather(*(request(i) for i in range(requests)))
+        finally:
+            if pool:
+                await pool.aclose()
+                
+    return asyncio.run(main())
+
+
+def measure(label: str, method: str, run: Callable, pool: Optional[HTTPClientPool], args) -> int:
+    with StubLLMServer(delay=args.delay) as stub:
+        start = time.perf_counter()
+        latencies = run(stub.url, pool, FAN_OUT[method], args.requests, args.concurrency)
+        wall = time.perf_counter() - start
+        requests, connections = stub.requests, stub.connections
+        
+    print(
+        f"| {label:<12} | {method:<13} | {requests:>8} | {connections:>11} | "
+        f"{requests / connections:>9.1f} | {np.percentile(latencies, 50) * 1000:>8.1f} | {wall:>6.2f}s |"
+    )
+    return connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM HTTP connection reuse report")
+    parser.add_argument("--requests", type=int, default=32, help="Pipeline requests per run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--delay", type=float, default=0.02, help="Stub response delay in seconds")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="invoke or ainvoke")
+    parser.add_argument("--max-connections", type=int, default=32, help="Pool connection limit")
+    args = parser.parse_args()
+    
+    run = run_sync if args.mode == "sync" else run_async
+    print(f"\n{args.requests} requests, {args.concurrency} concurrent, {args.mode} calls\n")
+    print("| clients      | method        | requests | connections | req/conn  | p50 ms   | wall    |")
+    print("|--------------|---------------|----------|-------------|-----------|----------|---------|")
+    for method in FAN_OUT:
+        measure("per-pipeline", method, run, None, args)
+        pool = HTTPClientPool(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+        connections = measure("shared pool", method, run, pool, args)
+        stats = pool.stats()
+        limit = args.concurrency * (FAN_OUT[method] if args.mode == "async" else 1)
+        verdict = "reused" if connections <= min(limit, args.max_connections) else "NOT reused"
+        print(
+            f"|   pool: {stats['connections_opened']} opened for {stats['requests']} requests, "
+            f"reuse rate {stats['reuse_rate']:.2f} ({verdict}) |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Recall@k and latency report: dense MiniLM retrieval vs late interaction.
+
+Chunks the policy corpus, indexes it once as one vector per chunk (dense) and
+once as compressed per-token embeddings (late interaction), and runs a fixed
+set of policy questions against both. A hit is a result from the policy file
+that answers the question, or from ``sample_policies.txt``, which holds abridged
+copies of every policy. ``--scale`` replicates the corpus to measure
+latency on a larger index.
+
+Usage (from the AI directory):
+    python -m benchmarks.late_interaction_report --k 4
+    python -m benchmarks.late_interaction_report --scale 50 --nprobe 2,4,8
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.ingest import discover_files, read_documents
+from src.late_interaction import LateInteractionIndex, SentenceTransformerTokenEncoder
+
+# Abridged copies of every policy; a match there counts as relevant
+SAMPLE_POLICIES = "sample_policies.txt"
+
+# Question -> policy file that answers it
+QUERIES = [
+    ("How many annual leave days do employees get?", "leave_policy.txt"),
+    ("When is a medical certificate needed for sick leave?", "leave_policy.txt"),
+    ("Can unused leave be encashed?", "leave_policy.txt"),
+    ("How long is maternity leave?", "leave_policy.txt"),
+    ("On which date is salary credited?", "payroll_and_compensation_policy.txt"),
+    ("How is overtime compensated?", "payroll_and_compensation_policy.txt"),
+    ("What deductions are made from the salary?", "payroll_and_compensation_policy.txt"),
+    ("How often are performance reviews held?", "performance_review_policy.txt"),
+    ("What happens during a performance improvement plan?", "performance_review_policy.txt"),
+    ("What are the criteria for promotion?", "performance_review_policy.txt"),
+    ("Who is eligible to work from home?", "work_from_home_policy.txt"),
+    ("Are internet expenses reimbursed for remote work?", "work_from_home_policy.txt"),
+    ("How often must passwords be changed?", "it_and_security_policy.txt"),
+    ("How do I report a phishing email?", "it_and_security_policy.txt"),
+    ("Can I install unapproved software on my laptop?", "it_and_security_policy.txt"),
+    ("What is the dress code?", "employee_code_of_conduct.txt"),
+    ("How should a conflict of interest be disclosed?", "employee_code_of_conduct.txt"),
+    ("What disciplinary actions can be taken?", "employee_code_of_conduct.txt"),
+]
+
+
+def load_chunks(path: str, scale: int, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    docs = list(read_documents(discover_files(path)))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_documents(docs)
+    return [chunk for _ in range(scale) for chunk in chunks]
+
+
+def measure(name: str, search: Callable[[str, int], List[int]], chunks: List[Document], k: int):
+    """Time ``search`` over the query set and count queries with a relevant hit."""
+    hits, latencies = 0, []
+    for query, expected in QUERIES:
+        start = time.perf_counter()
+        ids = search(query, k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(os.path.basename(chunks[i].metadata["source"]) in (expected, SAMPLE_POLICIES) for i in ids)
+    print(
+        f"| {name:<30} | {hits / len(QUERIES):8.2f} "
+        f"| {np.median(latencies) * 1000:8.2f} | {np.percentile(latencies, 95) * 1000:8.2f} |"
+    )
+
+
+def dense_search(embeddings, matrix: np.ndarray) -> Callable[[str, int], List[int]]:
+    def search(query: str, k: int) -> List[int]:
+        scores = matrix @ np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        return np.argsort(-scores)[:k].tolist()
+    return search
+
+
+def late_search(index: LateInteractionIndex, encoder, nprobe: int, candidates: int) -> Callable[[str, int], List[int]]:
+    def search(query: str, k: int) -> List[int]:
+        return [chunk_id for chunk_id, _ in index.search(encoder.encode_query(query), k, nprobe, candidates)]
+    return search
+
+
+def parse_ints(value: str) -> Tuple[int, ...]:
+    return tuple(int(part) for part in value.split(","))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Late-interaction benchmark")
+    parser.add_argument("--documents-path", default="rag/uptiq_hr_policies", help="Corpus directory")
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2", help="Sentence-transformers model")
+    parser.add_argument("--scale", type=int, default=1, help="Times to replicate the corpus")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Chunk size in characters")
+    parser.add_argument("--chunk-overlap", type=int, default=20, help="Chunk overlap in characters")
+    parser.add_argument("--k", type=int, default=4, help="Results per query")
+    parser.add_argument("--nprobe", default="2,4,8", help="Comma-separated centroids probed per query token")
+    parser.add_argument("--candidates", type=int, default=64, help="Chunks rescored exactly")
+    args = parser.parse_args()
+    
+    chunks = load_chunks(args.documents_path, args.scale, args.chunk_size, args.chunk_overlap)
+    texts = [chunk.page_content for chunk in chunks]
+    embeddings = HuggingFaceEmbeddings(model_name=args.embedding_model)
+    encoder = SentenceTransformerTokenEncoder.from_embeddings(embeddings)
+    
+    start = time.perf_counter()
+    matrix = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    dense_seconds = time.perf_counter() - start
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        index = LateInteractionIndex.write(os.path.join(tmp, "late_interaction"), encoder.encode(texts))
+        late_seconds = time.perf_counter() - start
+        
+        print(f"\n{len(chunks)} chunks, {index.n_tokens} tokens, {len(index.centroids)} centroids")
+        print(f"dense:            {matrix.nbytes / 1e6:8.2f} MB float32, built in {dense_seconds:.1f}s")
+        print(f"late interaction: {index.nbytes / 1e6:8.2f} MB compressed, built in {late_seconds:.1f}s\n")
+        print(f"| retriever                      | recall@{args.k:<2}| p50 ms   | p95 ms   |")
+        print("|--------------------------------|----------|----------|----------|")
+        measure("dense MiniLM", dense_search(embeddings, matrix), chunks, args.k)
+        measure("late interaction exhaustive", late_search(index, encoder, 0, args.candidates), chunks, args.k)
+        for nprobe in parse_ints(args.nprobe):
+            measure(
+                f"late interaction nprobe={nprobe}",
+                late_search(index, encoder, nprobe, args.candidates),
+                chunks,
+                args.k
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Local OpenAI-compatible chat-completions server for exercising LLM clients.
+
+Answers every ``POST .../chat/completions`` (the path Groq and OpenAI clients
+use) with a fixed reply and can simulate rate limiting (429 with Retry-After)
+and slow responses. Requests and TCP connections are counted, so retries,
+hedging and connection reuse can be checked without network access.
+
+Usage (from the AI directory):
+    python -m benchmarks.stub_llm_server --port 8900 --delay 0.2 --rate-limit-every 5
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Sequence
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        stub: StubLLMServer = self.server.stub
+        number = stub._next_request()
+        
+        if stub._rate_limited(number):
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                       {"Retry-After": str(stub.retry_after)})
+            return
+            
+        time.sleep(stub._delay(number))
+        model = json.loads(body or b"{}").get("model", "stub")
+        self._send(200, {
+            "id": f"chatcmpl-stub-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": stub.reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        })
+        
+    def _send(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent fan-out opens connections in bursts; the default backlog is 5
+    request_queue_size = 128
+    
+    def get_request(self):
+        request = super().get_request()
+        self.stub._count_connection()
+        return request
+        
+    def handle_error(self, request, client_address):
+        # Clients that gave up (timeouts, losing hedges) close the socket mid-reply
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class StubLLMServer:
+    """Chat-completions stub running on a background thread."""
+    
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        reply: str = "stub answer",
+        delay: float = 0.0,
+        delays: Sequence[float] = (),
+        rate_limit_first: int = 0,
+        rate_limit_every: int = 0,
+        retry_after: float = 0
+    ):
+        """
+        Initialize the stub (call start() or use it as a context manager).
+        
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            reply: Assistant message returned by every successful request
+            delay: Seconds to wait before answering
+            delays: Per-request delays overriding ``delay`` for the first requests
+            rate_limit_first: Answer the first N requests with 429
+            rate_limit_every: Answer every Nth request with 429 (0 disables)
+            retry_after: Retry-After seconds sent with 429 responses
+        """
+        self.reply = reply
+        self.delay = delay
+        self.delays = list(delays)
+        self.rate_limit_first = rate_limit_first
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+        
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+        
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+        
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+        
+    def __exit__(self, *exc):
+        self.stop()
+        
+    def _next_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+            
+    def _count_connection(self):
+        with self._lock:
+            self.connections += 1
+            
+    def _rate_limited(self, number: int) -> bool:
+        limited = number <= self.rate_limit_first or (
+            self.rate_limit_every > 0 and number % self.rate_limit_every == 0
+        )
+        if limited:
+            with self._lock:
+                self.rate_limited += 1
+        return limited
+        
+    def _delay(self, number: int) -> float:
+        return self.delays[number - 1] if number <= len(self.delays) else self.delay
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8900, help="Port to bind")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before each answer")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on 429")
+    args = parser.parse_args()
+    
+    stub = StubLLMServer(
+        args.host,
+        args.port,
+        delay=args.delay,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after
+    )
+    print(f"Serving chat completions on {stub.url} (Ctrl+C to stop)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+        print(f"{stub.requests} requests, {stub.rate_limited} rate limited, {stub.connections} connections")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Gunicorn settings for multi-worker deployments of the RAG API.
+
+The app is imported and the embedding model weights and an up-to-date
+memory-mapped index are loaded once in the master process; workers are forked
+afterwards and share those pages. Indexes are never built in the master (see
+app.preload_pipeline).
+
+Usage: gunicorn app:app -c gunicorn.conf.py
+"""
+
+import os
+
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+preload_app = True
+
+
+def when_ready(server):
+    """Load shared read-only state in the master before workers are forked."""
+    import app
+    
+    app.preload_pipeline()
@@ -20,14 +20,18 @@ def load_config(config_path: str) -> Dict[str, Any]:
 def main():
     """Main CLI entry point."""
     parser = argparse.ArgumentParser(description="RAG Pipeline CLI")
-    parser.add_argument("--query", required=True, help="Query to process")
+    parser.add_argument("--query", help="Query to process")
     parser.add_argument("--config", default="config.yml", help="Configuration file path")
     parser.add_argument("--output", help="Output file path (JSON)")
     parser.add_argument("--method", choices=[
-        "basic", "multi_query", "rag_fusion", "decomposition", "step_back", "hyde"
+        "basic", "multi_query", "rag_fusion", "decomposition", "step_back", "hyde", "corrective", "auto"
     ], default="basic", help="Query transformation method")
+    parser.add_argument("--build-index", action="store_true",
+                        help="Build the document index and routing targets, then exit")
     
     args = parser.parse_args()
+    if not args.query and not args.build_index:
+        parser.error("--query is required unless --build-index is given")
     
     # Load configuration
     try:
@@ -43,6 +47,16 @@ def main():
     # Create pipeline
     pipeline = RAGPipeline(PipelineConfig(**config_dict))
     
+    if args.build_index:
+        pipeline.indexer.create_vectorstore()
+        pipeline.indexer.build_routing_targets()
+        if pipeline.config.raptor_mode:
+            pipeline.indexer.build_raptor_tree()
+        if pipeline.config.late_interaction:
+            pipeline.indexer.build_late_interaction_index()
+        print("Index build complete")
+        return
+    
     # Run pipeline
     result = pipeline.run_pipeline(args.query, config_dict)
     
@@ -0,0 +1,171 @@
+"""
+Admission control for the RAG API.
+
+Each request costs a number of units depending on its transformation method
+(decomposition fans out into several LLM calls, basic retrieval into one).
+Requests run while the units in use stay within ``capacity``; the rest wait in
+a bounded FIFO queue. A full queue is rejected at once (429) and a request that
+waits longer than ``queue_timeout`` gives up (503), both with a Retry-After
+estimate, so overload sheds load quickly instead of piling up timeouts.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_METHOD_COSTS = {
+    "basic": 1,
+    "auto": 1,
+    "corrective": 1,
+    "hyde": 2,
+    "step_back": 2,
+    "multi_query": 2,
+    "rag_fusion": 2,
+    "decomposition": 4,
+}
+
+
+class Overloaded(Exception):
+    """A request was shed; ``status_code`` is 429 (queue full) or 503 (queue timeout)."""
+    
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("cost", "future", "enqueued")
+    
+    def __init__(self, cost: int, future: asyncio.Future):
+        self.cost = cost
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class AdmissionController:
+    """Weighted concurrency limiter with a bounded queue, for use on one event loop."""
+    
+    def __init__(
+        self,
+        capacity: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0,
+        method_costs: Optional[Dict[str, int]] = None,
+        window: int = 1000
+    ):
+        """
+        Initialize the controller.
+        
+        Args:
+            capacity: Cost units that may run at once
+            max_queue: Requests allowed to wait; further requests get 429
+            queue_timeout: Seconds a request may wait before it gets 503
+            method_costs: Cost per transformation method (unknown methods cost 1)
+            window: Recent requests kept for queue-time percentiles
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.method_costs = {**DEFAULT_METHOD_COSTS, **(method_costs or {})}
+        self.in_use = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._queue_times: Deque[float] = deque(maxlen=window)
+        self._service_time: Optional[float] = None
+        
+    def cost(self, method: Optional[str]) -> int:
+        """Units a request of this method holds; never more than the capacity."""
+        return max(1, min(self.capacity, int(self.method_costs.get(method or "basic", 1))))
+        
+    @asynccontextmanager
+    async def admit(self, method: Optional[str]):
+        """
+        Hold capacity for one request while the block runs.
+        
+        Raises:
+            Overloaded: When the queue is full or the wait times out
+        """
+        cost = self.cost(method)
+        await self._acquire(cost)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            # Exponential moving average of service time for Retry-After
+            self._service_time = elapsed if self._service_time is None else 0.9 * self._service_time + 0.1 * elapsed
+            self.in_use -= cost
+            self._wake()
+            
+    async def _acquire(self, cost: int):
+        if not self._waiters and self.in_use + cost <= self.capacity:
+            self.in_use += cost
+            self._admit(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded(429, self.retry_after(cost), "admission queue is full")
+            
+        waiter = _Waiter(cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the wait ended; hand the units back
+                self.in_use -= cost
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._wake()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            raise Overloaded(503, self.retry_after(cost), "timed out waiting for capacity") from None
+        self._admit(time.perf_counter() - waiter.enqueued)
+        
+    def _admit(self, queue_time: float):
+        self.admitted += 1
+        self._queue_times.append(queue_time)
+        
+    def _wake(self):
+        """Grant queued requests in FIFO order while the head fits."""
+        while self._waiters and self.in_use + self._waiters[0].cost <= self.capacity:
+            waiter = self._waiters.popleft()
+            if waiter.future.done():
+                continue
+            self.in_use += waiter.cost
+            waiter.future.set_result(None)
+            
+    def retry_after(self, cost: int = 1) -> int:
+        """Seconds until the queue ahead of a new request is likely to drain."""
+        service = self._service_time if self._service_time is not None else 1.0
+        queued = sum(waiter.cost for waiter in self._waiters) + cost
+        return max(1, min(60, math.ceil(service * queued / self.capacity)))
+        
+    def stats(self) -> Dict[str, Any]:
+        """Current load, rejection counts and queue-time percentiles (seconds)."""
+        queue_times: List[float] = list(self._queue_times)
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "queue_time_p50": round(float(np.percentile(queue_times, 50)), 4) if queue_times else 0.0,
+            "queue_time_p95": round(float(np.percentile(queue_times, 95)), 4) if queue_times else 0.0,
+            "queue_time_max": round(max(queue_times), 4) if queue_times else 0.0,
+            "service_time_avg": round(self._service_time, 4) if self._service_time is not None else None
+        }
@@ -0,0 +1,260 @@
+"""
+Approximate nearest-neighbour search for RAG pipeline.
+
+Searchers wrap a ``FlatVectorIndex`` and trade recall for latency:
+
+- ``exact``: brute-force scan of the mapped vectors (the recall reference)
+- ``ivf``: inverted file over spherical k-means clusters, probing ``nprobe``
+  lists per query and scoring only their members exactly
+- ``hnsw``: graph index from the optional ``hnswlib`` package, tuned by ``ef``
+
+IVF and HNSW structures are saved next to the vector files, so they are built
+once per index and rebuilt together with it. Unlike the vectors they are not
+memory-mapped: each process loads its own copy into memory (the IVF lists take
+8 bytes per chunk; the HNSW graph roughly ``m * 8`` bytes per chunk plus a
+copy of the vectors). Workers forked after the searcher is loaded, as with
+gunicorn's ``preload_app``, share those pages copy-on-write; otherwise every
+worker holds a private copy.
+"""
+
+import math
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_index import FlatVectorIndex, SEARCH_BLOCK_ROWS
+
+
+ANN_BACKENDS = ("exact", "ivf", "hnsw")
+
+
+def kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Spherical k-means on unit vectors.
+    
+    Returns:
+        Unit-length float32 centroids, one row per cluster
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, min(n_clusters, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Re-seed empty clusters with random points so every list is used
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1.0, norms)
+        
+    return centroids.astype(np.float32)
+
+
+class ExactSearcher:
+    """Brute-force search over every vector; the reference for recall."""
+    
+    backend = "exact"
+    
+    def __init__(self, index: FlatVectorIndex):
+        self.index = index
+        
+    def search(self, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        return self.index.search(query_vector, k)
+
+
+class IVFSearcher:
+    """Inverted-file search over k-means clusters of the index vectors."""
+    
+    backend = "ivf"
+    
+    def __init__(
+        self,
+        index: FlatVectorIndex,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        train_size: int = 256,
+        seed: int = 0,
+        build: bool = True
+    ):
+        """
+        Load the IVF lists from the index directory, building them if missing.
+        
+        Args:
+            index: Opened vector index
+            nlist: Number of clusters (defaults to sqrt of the chunk count)
+            nprobe: Clusters scanned per query; higher is slower and more accurate
+            train_size: Training points sampled per cluster for k-means
+            seed: Random seed for sampling and initialization
+            build: Build missing lists; when False a missing file raises FileNotFoundError
+        """
+        self.index = index
+        self.nlist = nlist or max(1, int(math.sqrt(len(index))))
+        self.nprobe = nprobe
+        
+        path = index.index_dir / f"ivf-{self.nlist}.npz"
+        try:
+            with np.load(path) as data:
+                self.centroids, self.ids, self.offsets = data["centroids"], data["ids"], data["offsets"]
+            # A small index may have fewer clusters than requested (see _build)
+            self.nlist = len(self.centroids)
+        except (OSError, KeyError, ValueError):
+            if not build:
+                raise FileNotFoundError(f"No saved IVF lists at {path}")
+            self._build(train_size, seed)
+            _save_quietly(path, lambda p: np.savez(p, centroids=self.centroids, ids=self.ids, offsets=self.offsets))
+            
+    def _build(self, train_size: int, seed: int):
+        count = len(self.index)
+        if count == 0:
+            self.centroids = np.zeros((0, self.index.dim), dtype=np.float32)
+            self.ids, self.offsets = np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+            return
+            
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(count, min(count, self.nlist * train_size), replace=False))
+        self.centroids = kmeans(np.asarray(self.index.vectors[sample], dtype=np.float32), self.nlist, seed=seed)
+        self.nlist = len(self.centroids)
+        
+        assignments = np.empty(count, dtype=np.int32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.index.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+            
+        self.ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        self.offsets = np.searchsorted(assignments[self.ids], np.arange(self.nlist + 1)).astype(np.int64)
+        
+    def search(self, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        if len(self.index) == 0 or k <= 0:
+            return []
+            
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        
+        nprobe = min(self.nprobe, self.nlist)
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.sort(np.concatenate([self.ids[self.offsets[c]:self.offsets[c + 1]] for c in probe]))
+        if len(candidates) == 0:
+            return []
+            
+        scores = np.asarray(self.index.vectors[candidates], dtype=np.float32) @ query
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+
+class HNSWSearcher:
+    """
+    Graph-based search using ``hnswlib`` (optional dependency).
+    
+    hnswlib keeps the graph and its own float32 copy of the vectors on the
+    process heap, so it is only shared between workers forked after loading.
+    """
+    
+    backend = "hnsw"
+    
+    def __init__(
+        self,
+        index: FlatVectorIndex,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef: int = 64,
+        seed: int = 0,
+        build: bool = True
+    ):
+        """
+        Load the HNSW graph from the index directory, building it if missing.
+        
+        Args:
+            index: Opened vector index
+            m: Graph out-degree; higher improves recall at the cost of memory
+            ef_construction: Candidate list size while building
+            ef: Candidate list size while searching
+            seed: Random seed for level assignment
+            build: Build a missing graph; when False a missing file raises FileNotFoundError
+        """
+        import hnswlib
+        
+        self.index = index
+        self.graph = hnswlib.Index(space="ip", dim=index.dim)
+        path = index.index_dir / f"hnsw-m{m}-ef{ef_construction}.bin"
+        if path.exists():
+            self.graph.load_index(str(path), max_elements=len(index))
+        elif not build:
+            raise FileNotFoundError(f"No saved HNSW graph at {path}")
+        else:
+            self.graph.init_index(max_elements=max(1, len(index)), M=m, ef_construction=ef_construction, random_seed=seed)
+            for start in range(0, len(index), SEARCH_BLOCK_ROWS):
+                block = np.asarray(index.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                self.graph.add_items(block, np.arange(start, start + len(block)))
+            _save_quietly(path, self.graph.save_index)
+        self.ef = ef
+        
+    @property
+    def ef(self) -> int:
+        return self._ef
+        
+    @ef.setter
+    def ef(self, value: int):
+        self._ef = value
+        self.graph.set_ef(value)
+        
+    def search(self, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        k = min(k, len(self.index))
+        if k <= 0:
+            return []
+            
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        if self.ef < k:
+            self.ef = k
+        labels, distances = self.graph.knn_query(query, k=k)
+        # The "ip" space reports 1 - inner product as the distance
+        return [(int(label), float(1.0 - distance)) for label, distance in zip(labels[0], distances[0])]
+
+
+def build_searcher(
+    index: FlatVectorIndex,
+    backend: str = "exact",
+    params: Optional[Dict[str, Any]] = None,
+    build: bool = True
+):
+    """
+    Create a searcher for ``index``.
+    
+    Args:
+        index: Opened vector index
+        backend: One of ``ANN_BACKENDS``
+        params: Backend keyword arguments (e.g. nlist/nprobe or m/ef_construction/ef)
+        build: Build missing search structures; when False only saved ones are
+            loaded and a missing one raises FileNotFoundError
+    """
+    params = params or {}
+    if backend == "exact":
+        return ExactSearcher(index)
+    if backend == "ivf":
+        return IVFSearcher(index, build=build, **params)
+    if backend == "hnsw":
+        return HNSWSearcher(index, build=build, **params)
+    raise ValueError(f"Unknown ANN backend: {backend}. Choose from {', '.join(ANN_BACKENDS)}")
+
+
+def _save_quietly(path: Path, save) -> None:
+    """Persist a search structure atomically; read-only index dirs are tolerated."""
+    tmp_path = path.with_name(f".{os.getpid()}.{path.name}")
+    try:
+        save(str(tmp_path))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not save {path.name}: {e}")
@@ -0,0 +1,218 @@
+"""
+Chunking strategies for RAG pipeline.
+
+``TokenChunker`` tokenizes each document once and chooses chunk boundaries on
+token offsets with binary searches over precomputed paragraph and sentence
+breaks, so chunk sizes match the LLM's token budget instead of a character
+count. ``SectionChunker`` splits documents at their section headings.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Iterable, List, Tuple
+
+import numpy as np
+
+from .lazy_imports import LazyImport
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+DocumentClass = LazyImport("langchain_core.documents", "Document")
+
+# Approximate word-piece tokens, used when the tiktoken encoding is unavailable
+FALLBACK_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_ASCII_WORD = np.zeros(128, dtype=bool)
+_ASCII_WORD[[ord(c) for c in "0123456789_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"]] = True
+_ASCII_SPACE = np.zeros(128, dtype=bool)
+_ASCII_SPACE[[ord(c) for c in " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"]] = True
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+SENTENCE_BREAK = re.compile(r"[.!?:;]\s+|\n\s*")
+HEADING_PATTERN = re.compile(r"^(?:#{1,6}\s+|\d+\.\s+)(.+)$")
+HEADING_LINE = re.compile(r"^[ \t]*(?:#{1,6}[ \t]+|\d+\.[ \t]+)(.+)$", re.MULTILINE)
+
+
+def fallback_token_offsets(text: str) -> np.ndarray:
+    """
+    Start offsets of ``FALLBACK_TOKEN_PATTERN`` matches, computed without a regex.
+    
+    Characters are classified as word / space / other with lookup tables (ASCII)
+    or once per distinct code point (everything else); a token starts at every
+    "other" character and at the first character of each run of word characters.
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    word = np.zeros(len(codes), dtype=bool)
+    space = np.zeros(len(codes), dtype=bool)
+    ascii_mask = codes < 128
+    word[ascii_mask] = _ASCII_WORD[codes[ascii_mask]]
+    space[ascii_mask] = _ASCII_SPACE[codes[ascii_mask]]
+    if not ascii_mask.all():
+        others = ~ascii_mask
+        unique, inverse = np.unique(codes[others], return_inverse=True)
+        chars = [chr(code) for code in unique.tolist()]
+        word[others] = np.array([char.isalnum() for char in chars])[inverse]
+        space[others] = np.array([char.isspace() for char in chars])[inverse]
+    
+    word_start = word & ~np.concatenate(([False], word[:-1]))
+    return np.flatnonzero(word_start | ~(word | space))
+
+
+class TokenChunker:
+    """Split documents into chunks of at most ``chunk_tokens`` tokens."""
+    
+    def __init__(
+        self,
+        chunk_tokens: int = 200,
+        overlap_tokens: int = 20,
+        encoding_name: str = "cl100k_base",
+        min_fill: float = 0.5
+    ):
+        """
+        Initialize the chunker.
+        
+        Args:
+            chunk_tokens: Maximum tokens per chunk
+            overlap_tokens: Tokens repeated from the end of the previous chunk
+            encoding_name: tiktoken encoding used to count tokens
+            min_fill: A chunk may end early at a paragraph or sentence break,
+                but not before this fraction of ``chunk_tokens``
+        """
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+            
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_fill = min_fill
+        self.encoding = None
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"Warning: Could not load tokenizer {encoding_name}: {e}")
+            print("Chunk sizes will use an approximate word-piece count")
+            
+    def token_offsets(self, text: str) -> np.ndarray:
+        """Return the character offset at which each token starts."""
+        if self.encoding is None:
+            return fallback_token_offsets(text)
+            
+        tokens = self.encoding.encode_ordinary(text)
+        if not tokens:
+            return np.zeros(0, dtype=np.int64)
+        token_bytes = self.encoding.decode_tokens_bytes(tokens)
+        lengths = np.fromiter(map(len, token_bytes), dtype=np.int64, count=len(token_bytes))
+        byte_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # Map each UTF-8 byte to the character it belongs to; a token that
+        # starts mid-character is attributed to that character
+        data = np.frombuffer(b"".join(token_bytes), dtype=np.uint8)
+        char_of_byte = np.cumsum((data & 0xC0) != 0x80) - 1
+        return char_of_byte[byte_starts]
+        
+    def split_text(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Compute chunk spans for ``text``.
+        
+        Returns:
+            List of (start, end) character offsets
+        """
+        starts = self.token_offsets(text)
+        n_tokens = len(starts)
+        if n_tokens == 0:
+            return []
+            
+        # Token index at which each paragraph / sentence begins
+        paragraphs = np.searchsorted(starts, [m.end() for m in PARAGRAPH_BREAK.finditer(text)])
+        sentences = np.searchsorted(starts, [m.end() for m in SENTENCE_BREAK.finditer(text)])
+        bounds = np.append(starts, len(text))
+        min_tokens = max(1, int(self.chunk_tokens * self.min_fill))
+        
+        spans = []
+        start = 0
+        while start < n_tokens:
+            limit = start + self.chunk_tokens
+            end = n_tokens
+            if limit < n_tokens:
+                end = limit
+                for breaks in (paragraphs, sentences):
+                    i = np.searchsorted(breaks, limit, side="right") - 1
+                    if i >= 0 and breaks[i] >= start + min_tokens:
+                        end = int(breaks[i])
+                        break
+            spans.append((int(bounds[start]), int(bounds[end])))
+            if end >= n_tokens:
+                break
+            start = max(end - self.overlap_tokens, start + 1)
+        return spans
+        
+    def split_documents(self, docs: Iterable[Document]) -> List[Document]:
+        """Split documents, recording each chunk's character span as ``start_index``."""
+        chunks = []
+        for doc in docs:
+            text = doc.page_content
+            for start, end in self.split_text(text):
+                piece = text[start:end]
+                stripped = piece.strip()
+                if not stripped:
+                    continue
+                metadata = dict(doc.metadata)
+                metadata["start_index"] = start + (len(piece) - len(piece.lstrip()))
+                chunks.append(DocumentClass(page_content=stripped, metadata=metadata))
+        return chunks
+        
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the chunker's tokenizer."""
+        return len(self.token_offsets(text))
+
+
+class SectionChunker:
+    """Split documents into sections that start at heading lines."""
+    
+    def __init__(self, max_chars: int = 4000):
+        """
+        Initialize the chunker.
+        
+        Args:
+            max_chars: Sections longer than this are split at paragraph breaks
+        """
+        self.max_chars = max_chars
+        
+    def split_text(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Compute section spans for ``text``.
+        
+        Returns:
+            List of (start, end, heading) with the heading empty for the preamble
+        """
+        headings = [(m.start(), m.group(1).strip()) for m in HEADING_LINE.finditer(text)]
+        if not headings or headings[0][0] > 0:
+            headings.insert(0, (0, ""))
+        ends = [start for start, _ in headings[1:]] + [len(text)]
+        
+        spans = []
+        for (start, heading), end in zip(headings, ends):
+            while end - start > self.max_chars:
+                breaks = [m.end() for m in PARAGRAPH_BREAK.finditer(text, start + 1, start + self.max_chars)]
+                cut = breaks[-1] if breaks else start + self.max_chars
+                spans.append((start, cut, heading))
+                start = cut
+            spans.append((start, end, heading))
+        return spans
+        
+    def split_documents(self, docs: Iterable[Document]) -> List[Document]:
+        """Split documents into sections with ``start_index`` and heading metadata."""
+        sections = []
+        for doc in docs:
+            text = doc.page_content
+            title = next((line.strip().lstrip("# ") for line in text.splitlines() if line.strip()), "")
+            for start, end, heading in self.split_text(text):
+                piece = text[start:end]
+                stripped = piece.strip()
+                if not stripped:
+                    continue
+                metadata = dict(doc.metadata)
+                metadata["start_index"] = start + (len(piece) - len(piece.lstrip()))
+                metadata["title"] = title
+                metadata["section"] = heading
+                sections.append(DocumentClass(page_content=stripped, metadata=metadata))
+        return sections
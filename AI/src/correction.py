@@ -0,0 +1,153 @@
+"""
+Corrective retrieval (CRAG) for RAG pipeline.
+
+Retrieved chunks are graded locally by the embedding similarity between the
+query and each chunk, so grading costs one small embedding call instead of an
+LLM call per chunk. Chunk embeddings are cached by chunk, so chunks seen by an
+earlier grade (the wider search overlaps the first, and popular chunks recur
+across requests) are not embedded again. The best grade picks one of three
+actions:
+
+- correct: the best chunk clears ``correct_threshold``; irrelevant chunks are
+  dropped and the pipeline answers right away (the fast path)
+- ambiguous: a wider candidate set is retrieved for the same query and the
+  best-graded chunks are kept (no LLM call)
+- incorrect: nothing clears ``incorrect_threshold``; the query is rewritten by
+  the LLM once and retrieved again
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+CORRECT = "correct"
+AMBIGUOUS = "ambiguous"
+INCORRECT = "incorrect"
+
+
+class RelevanceGrader:
+    """Grade retrieved chunks by cosine similarity to the query."""
+    
+    def __init__(
+        self,
+        embeddings,
+        correct_threshold: float = 0.45,
+        incorrect_threshold: float = 0.25,
+        cache_size: int = 4096
+    ):
+        """
+        Initialize the grader.
+        
+        Args:
+            embeddings: Local embedding model (shared with the indexer)
+            correct_threshold: Best grade at or above which retrieval is trusted
+            incorrect_threshold: Grades below this mark a chunk as irrelevant
+            cache_size: Chunk embeddings kept, least recently used evicted first
+        """
+        if incorrect_threshold > correct_threshold:
+            raise ValueError("incorrect_threshold must not exceed correct_threshold")
+        self.embeddings = embeddings
+        self.correct_threshold = correct_threshold
+        self.incorrect_threshold = incorrect_threshold
+        self.cache_size = cache_size
+        self.embedded = 0
+        self.cache_hits = 0
+        self._cache: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def grade(self, query: str, docs: Sequence[Document], query_embedding=None) -> np.ndarray:
+        """Return the cosine similarity of each document to the query."""
+        if not docs:
+            return np.zeros(0, dtype=np.float32)
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(query)
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        doc_vectors = self._document_vectors(docs)
+        norms = np.linalg.norm(doc_vectors, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        return doc_vectors @ query_vector / np.where(norms == 0, 1.0, norms)
+        
+    def _document_vectors(self, docs: Sequence[Document]) -> np.ndarray:
+        """Embeddings of ``docs``, embedding only chunks missing from the cache in one call."""
+        keys = [_document_key(doc) for doc in docs]
+        with self._lock:
+            vectors = {key: self._cache[key] for key in keys if key in self._cache}
+            for key in vectors:
+                self._cache.move_to_end(key)
+        
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if missing:
+            texts = {key: doc.page_content for key, doc in zip(keys, docs)}
+            embedded = self.embeddings.embed_documents([texts[key] for key in missing])
+            vectors.update(zip(missing, np.asarray(embedded, dtype=np.float32)))
+            with self._lock:
+                for key in missing:
+                    self._cache[key] = vectors[key]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        with self._lock:
+            self.embedded += len(missing)
+            self.cache_hits += len(keys) - len(missing)
+        return np.stack([vectors[key] for key in keys])
+        
+    def action(self, grades: np.ndarray) -> str:
+        """Choose the corrective action for a set of grades."""
+        best = float(grades.max()) if len(grades) else 0.0
+        if best >= self.correct_threshold:
+            return CORRECT
+        if best >= self.incorrect_threshold:
+            return AMBIGUOUS
+        return INCORRECT
+        
+    def select(self, docs: Sequence[Document], grades: np.ndarray, k: int) -> Tuple[List[Document], List[float]]:
+        """
+        Keep up to ``k`` distinct documents, best grade first.
+        
+        Documents below ``incorrect_threshold`` are dropped unless nothing
+        passes, in which case the best ones are kept so generation still has
+        context to work with.
+        """
+        order = np.argsort(-grades, kind="stable")
+        passing = [i for i in order if grades[i] >= self.incorrect_threshold] or list(order)
+        selected, seen = [], set()
+        for i in passing:
+            key = _document_key(docs[i])
+            if key in seen:
+                continue
+            seen.add(key)
+            selected.append(i)
+            if len(selected) >= k:
+                break
+        return [docs[i] for i in selected], [float(grades[i]) for i in selected]
+
+
+def retrieval_confidence(docs: Sequence[Document], grades: np.ndarray) -> Dict[str, Any]:
+    """
+    Summarize how confident a single retrieval looks.
+    
+    Returns:
+        Dictionary with the top grade, the gap to the runner-up, and the
+        fraction of results from the same source file as the top result
+    """
+    if len(grades) == 0:
+        return {"top_score": 0.0, "score_gap": 0.0, "source_agreement": 0.0}
+    
+    order = np.argsort(-grades, kind="stable")
+    top = float(grades[order[0]])
+    gap = top - float(grades[order[1]]) if len(order) > 1 else top
+    sources = [_document_key(docs[i])[1] for i in order]
+    known = [source for source in sources if source is not None]
+    agreement = known.count(sources[0]) / len(known) if sources[0] is not None else 1.0
+    return {"top_score": round(top, 3), "score_gap": round(gap, 3), "source_agreement": round(agreement, 3)}
+
+
+def _document_key(doc: Document) -> Tuple[str, Optional[str], Optional[int]]:
+    metadata = getattr(doc, "metadata", None)
+    metadata = metadata if isinstance(metadata, dict) else {}
+    return doc.page_content, metadata.get("source"), metadata.get("start_index")
@@ -4,20 +4,158 @@ Generation module for RAG pipeline.
 Handles response generation using LLMs and prompt templates.
 """
 
-from typing import Dict, Any, List
-from langchain import hub
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.documents import Document
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple, Union
+
+from .lazy_imports import LazyImport
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Prompt and parser classes import langchain_core.language_models, which
+# eagerly tries to import transformers; defer them until a chain is built.
+StrOutputParser = LazyImport("langchain_core.output_parsers", "StrOutputParser")
+ChatPromptTemplate = LazyImport("langchain_core.prompts", "ChatPromptTemplate")
+RunnablePassthrough = LazyImport("langchain_core.runnables", "RunnablePassthrough")
+hub = LazyImport("langchain.hub")
+
+
+class ContextBuilder:
+    """Packs retrieved chunks into a deduplicated, token-budgeted context."""
+    
+    # Chunks separated by at most this many characters count as adjacent
+    MAX_ADJACENT_GAP = 4
+    
+    def __init__(self, max_tokens: int = 1200, encoding_name: str = "cl100k_base"):
+        """
+        Initialize the context builder.
+        
+        Args:
+            max_tokens: Token budget for the packed context
+            encoding_name: tiktoken encoding used to measure the budget
+        """
+        self.max_tokens = max_tokens
+        self.encoding = None
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"Warning: Could not load tokenizer {encoding_name}: {e}")
+            print("Context budget will use an approximate word-piece count")
+    
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in text."""
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return len(re.findall(r"\w+|[^\w\s]", text))
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text down to at most ``max_tokens`` tokens."""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text)[:max_tokens])
+        pieces = list(re.finditer(r"\w+|[^\w\s]", text))
+        if len(pieces) <= max_tokens:
+            return text
+        return text[:pieces[max_tokens - 1].end()] if max_tokens > 0 else ""
+    
+    def build(
+        self,
+        docs: List[Union[Document, Tuple[Document, float]]],
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Build a prompt context from retrieved documents.
+        
+        Overlapping and adjacent chunks from the same source are merged into one
+        passage, duplicates are dropped, passages are ordered by score (or by
+        retrieval rank when no score is available) and added until the token
+        budget is spent.
+        
+        Args:
+            docs: Documents, or (document, score) pairs, in retrieval order
+            max_tokens: Optional budget overriding ``self.max_tokens``
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        passages = self._merge_passages(docs)
+        passages.sort(key=lambda passage: passage["score"], reverse=True)
+        
+        separator_tokens = self.count_tokens("\n\n")
+        selected, used, seen = [], 0, set()
+        for passage in passages:
+            text = passage["text"].strip()
+            if not text or text in seen or any(text in kept for kept in selected):
+                continue
+            
+            cost = self.count_tokens(text) + (separator_tokens if selected else 0)
+            if used + cost > budget:
+                if selected:
+                    continue
+                # Always return something: trim the best passage to the budget
+                text = self.truncate(text, budget)
+                cost = self.count_tokens(text)
+            
+            selected.append(text)
+            seen.add(text)
+            used += cost
+        
+        return "\n\n".join(selected)
+    
+    def _merge_passages(self, docs) -> List[Dict[str, Any]]:
+        """Merge chunks whose character spans overlap or touch within a source."""
+        spans: Dict[Any, List[Dict[str, Any]]] = {}
+        passages = []
+        
+        for rank, item in enumerate(docs):
+            doc, score = item if isinstance(item, tuple) else (item, None)
+            metadata = getattr(doc, "metadata", None)
+            metadata = metadata if isinstance(metadata, dict) else {}
+            if score is None:
+                score = metadata.get("score", 1.0 / (rank + 1))
+            
+            passage = {"text": doc.page_content, "score": float(score)}
+            start = metadata.get("start_index")
+            if isinstance(start, int) and start >= 0 and "source" in metadata:
+                passage["start"] = start
+                passage["end"] = start + len(doc.page_content)
+                spans.setdefault(metadata["source"], []).append(passage)
+            else:
+                passages.append(passage)
+        
+        for source_passages in spans.values():
+            source_passages.sort(key=lambda passage: passage["start"])
+            current = source_passages[0]
+            for passage in source_passages[1:]:
+                overlap = current["end"] - passage["start"]
+                if overlap < -self.MAX_ADJACENT_GAP:
+                    passages.append(current)
+                    current = passage
+                    continue
+                if passage["end"] > current["end"]:
+                    # Splitters drop the whitespace between adjacent chunks
+                    current["text"] += passage["text"][overlap:] if overlap >= 0 else "\n" + passage["text"]
+                    current["end"] = passage["end"]
+                current["score"] = max(current["score"], passage["score"])
+            passages.append(current)
+        
+        return passages
 
 
 class ResponseGenerator:
     """Handles response generation for RAG pipeline."""
     
-    def __init__(self, llm):
-        """Initialize with an LLM instance."""
+    def __init__(self, llm, context_builder: Optional[ContextBuilder] = None):
+        """
+        Initialize with an LLM instance.
+        
+        Args:
+            llm: LLM used for generation
+            context_builder: Optional builder that packs documents into a
+                token-budgeted context; documents are joined as-is without one
+        """
         self.llm = llm
+        self.context_builder = context_builder
         self.prompt_rag = hub.pull("rlm/rag-prompt")
     
     def generate_response(self, context: str, question: str) -> str:
@@ -36,8 +174,10 @@ class ResponseGenerator:
         context = self.format_documents(docs)
         return self.generate_response(context, question)
     
-    def format_documents(self, docs: List[Document]) -> str:
+    def format_documents(self, docs: List[Document], max_tokens: Optional[int] = None) -> str:
         """Format documents for use in prompts."""
+        if self.context_builder is not None:
+            return self.context_builder.build(docs, max_tokens)
         return "\n\n".join(doc.page_content for doc in docs)
     
     def generate_decomposed_response(self, sub_questions: List[str], sub_answers: List[str], original_question: str) -> str:
@@ -69,8 +209,10 @@ Use these to synthesize an answer to the original question: {question}
     
     def generate_step_back_response(self, normal_context: List[Document], step_back_context: List[Document], question: str) -> str:
         """Generate response using both normal and step-back context."""
-        normal_context_str = self.format_documents(normal_context)
-        step_back_context_str = self.format_documents(step_back_context)
+        # Both contexts share one prompt, so split the budget between them
+        half_budget = self.context_builder.max_tokens // 2 if self.context_builder else None
+        normal_context_str = self.format_documents(normal_context, half_budget)
+        step_back_context_str = self.format_documents(step_back_context, half_budget)
         
         template = """You are an AI assistant trained on HR policies of Uptiq. I am going to ask you a question. Your response should be comprehensive and not contradicted with the following context if they are relevant. Otherwise, ignore them if they are not relevant.
 
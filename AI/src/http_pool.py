@@ -0,0 +1,187 @@
+"""
+Shared HTTP connection pool for LLM clients.
+
+Every ChatGroq instance would otherwise open its own httpx clients, so each new
+pipeline (and each CLI run that builds several) pays fresh TCP and TLS
+handshakes. A pool holds one sync and one async httpx client with tunable
+limits and keep-alive; ``shared_pool`` returns the same pool for the same
+settings anywhere in the process, so all LLM backends reuse warm connections.
+Connection opens and TLS handshakes are counted through httpx's trace hook.
+
+The async client binds its connections to the event loop that first uses it,
+so share it only within one loop (as in the API server).
+"""
+
+import importlib.util
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+from .lazy_imports import LazyImport
+
+httpx = LazyImport("httpx")
+
+
+class HTTPClientPool:
+    """Lazily created sync/async httpx clients with connection metrics."""
+    
+    def __init__(
+        self,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        keepalive_expiry: float = 60.0,
+        http2: bool = False,
+        connect_timeout: float = 5.0
+    ):
+        """
+        Initialize the pool (clients are created on first use).
+        
+        Args:
+            max_connections: Connections open at once per client
+            max_keepalive_connections: Idle connections kept for reuse
+            keepalive_expiry: Seconds an idle connection is kept
+            http2: Multiplex requests over HTTP/2 (needs the ``h2`` package)
+            connect_timeout: Seconds allowed to open a connection
+        """
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("Warning: HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+        self._sync_client = None
+        self._async_client = None
+        self._pid = os.getpid()
+        
+    def _client_options(self) -> Dict[str, Any]:
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            # Per-request timeouts come from the LLM client; this bounds connecting
+            "timeout": httpx.Timeout(None, connect=self.connect_timeout),
+            "http2": self.http2,
+            "follow_redirects": True
+        }
+        
+    def _check_fork(self):
+        """Connections never cross a fork; a child process starts with fresh clients."""
+        if self._pid != os.getpid():
+            self._sync_client = self._async_client = None
+            self._pid = os.getpid()
+            
+    @property
+    def sync_client(self):
+        """The shared ``httpx.Client``."""
+        with self._lock:
+            self._check_fork()
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(
+                    event_hooks={"request": [self._on_request]},
+                    **self._client_options()
+                )
+            return self._sync_client
+            
+    @property
+    def async_client(self):
+        """The shared ``httpx.AsyncClient``."""
+        with self._lock:
+            self._check_fork()
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(
+                    event_hooks={"request": [self._on_async_request]},
+                    **self._client_options()
+                )
+            return self._async_client
+            
+    def _on_request(self, request):
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.requests += 1
+            
+    async def _on_async_request(self, request):
+        request.extensions["trace"] = self._async_trace
+        with self._lock:
+            self.requests += 1
+            
+    def _trace(self, event: str, info: Dict[str, Any]):
+        if event in ("connection.connect_tcp.complete", "connection.connect_unix_socket.complete"):
+            with self._lock:
+                self.connections_opened += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+                
+    async def _async_trace(self, event: str, info: Dict[str, Any]):
+        self._trace(event, info)
+        
+    @staticmethod
+    def _pool_state(client) -> Tuple[int, int]:
+        """(open, idle) connections held by a client's transport."""
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", None) or [])
+        return len(connections), sum(1 for conn in connections if conn.is_idle())
+        
+    def stats(self) -> Dict[str, Any]:
+        """Requests, connections opened and reused, and connections currently held."""
+        with self._lock:
+            clients = [client for client in (self._sync_client, self._async_client) if client is not None]
+            requests, opened = self.requests, self.connections_opened
+            tls_handshakes = self.tls_handshakes
+        states = [self._pool_state(client) for client in clients]
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "tls_handshakes": tls_handshakes,
+            "reuse_rate": round(1 - opened / requests, 3) if requests else 0.0,
+            "open_connections": sum(open_ for open_, _ in states),
+            "idle_connections": sum(idle for _, idle in states),
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "http2": self.http2
+        }
+        
+    def close(self):
+        """Close the sync client; the async client is closed by ``aclose``."""
+        with self._lock:
+            client, self._sync_client = self._sync_client, None
+        if client is not None:
+            client.close()
+            
+    async def aclose(self):
+        """Close both clients."""
+        self.close()
+        with self._lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.aclose()
+
+
+_shared_pools: Dict[Tuple, HTTPClientPool] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_pool(**settings) -> HTTPClientPool:
+    """
+    Return the process-wide pool for these settings, creating it on first use.
+    
+    Args:
+        **settings: Keyword arguments for HTTPClientPool
+        
+    Returns:
+        The same HTTPClientPool for equal settings
+    """
+    key = tuple(sorted(settings.items()))
+    with _shared_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = _shared_pools[key] = HTTPClientPool(**settings)
+        return pool
@@ -2,16 +2,43 @@
 Indexing module for RAG pipeline.
 
 Handles document loading, chunking, and vector store creation.
+
+Index builds stream the corpus (discover -> read -> chunk -> embed -> write) in
+fixed-size batches, so peak memory does not grow with the number of files.
 """
 
+from __future__ import annotations
+
+import hashlib
+import json
 import os
+import threading
+import uuid
 from pathlib import Path
-from typing import List, Optional
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .ann import build_searcher
+from .chunking import HEADING_PATTERN, SectionChunker, TokenChunker
+from .ingest import DEFAULT_EXTENSIONS, batched, discover_files, read_documents, relative_name
+from .late_interaction import LateInteractionIndex, LateInteractionRetriever, SentenceTransformerTokenEncoder
+from .lazy_imports import LazyImport
+from .raptor import RaptorRetriever, RaptorTree
+from .summarization import Summarizer
+from .vector_index import FlatIndexWriter, FlatVectorIndex, FlatIndexRetriever, index_lock
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+DirectoryLoader = LazyImport("langchain_community.document_loaders", "DirectoryLoader")
+TextLoader = LazyImport("langchain_community.document_loaders", "TextLoader")
+RecursiveCharacterTextSplitter = LazyImport("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+Chroma = LazyImport("langchain_community.vectorstores", "Chroma")
+HuggingFaceEmbeddings = LazyImport("langchain_huggingface", "HuggingFaceEmbeddings")
+MultiVectorRetriever = LazyImport("langchain.retrievers.multi_vector", "MultiVectorRetriever")
+InMemoryStore = LazyImport("langchain_core.stores", "InMemoryStore")
+DocumentClass = LazyImport("langchain_core.documents", "Document")
 
 
 class DocumentIndexer:
@@ -22,7 +49,31 @@ class DocumentIndexer:
         documents_path: str,
         chunk_size: int = 200,
         chunk_overlap: int = 20,
-        embedding_model: str = "all-MiniLM-L6-v2"
+        embedding_model: str = "all-MiniLM-L6-v2",
+        cache_dir: Optional[str] = None,
+        vector_store: str = "chroma",
+        vector_dtype: str = "float16",
+        vector_quantization: Optional[str] = None,
+        ann_backend: str = "exact",
+        ann_params: Optional[Dict[str, Any]] = None,
+        document_extensions: Sequence[str] = DEFAULT_EXTENSIONS,
+        recursive: bool = True,
+        ingest_workers: int = 4,
+        ingest_batch_size: int = 64,
+        chunker: str = "recursive",
+        chunk_tokens: int = 200,
+        chunk_overlap_tokens: int = 20,
+        chunk_encoding: str = "cl100k_base",
+        index_mode: str = "chunks",
+        summarizer: Optional[Summarizer] = None,
+        section_max_chars: int = 4000,
+        raptor_mode: Optional[str] = None,
+        raptor_branching: int = 6,
+        raptor_max_levels: int = 3,
+        raptor_summarizer: Optional[Summarizer] = None,
+        late_interaction: bool = False,
+        late_interaction_params: Optional[Dict[str, Any]] = None,
+        token_encoder=None
     ):
         """
         Initialize the document indexer.
@@ -32,13 +83,95 @@ class DocumentIndexer:
             chunk_size: Size of text chunks
             chunk_overlap: Overlap between chunks
             embedding_model: HuggingFace embedding model name
+            cache_dir: Directory for index-time artifacts such as the corpus
+                manifest and routing centroids (disabled when None)
+            vector_store: "chroma" for an in-memory Chroma collection, or "mmap"
+                for a flat index in ``cache_dir`` shared read-only by all workers
+            vector_dtype: Storage dtype of vectors in the mmap index
+            vector_quantization: "int8" to scan quantized codes and rescore the
+                shortlist in float32, or None for an exact scan
+            ann_backend: Search backend for the mmap index: "exact", "ivf"
+                or "hnsw" (see ``src.ann``)
+            ann_params: Build and search parameters for the ANN backend
+            document_extensions: File types to index (see ``src.ingest.LOADERS``)
+            recursive: Whether to index subdirectories of ``documents_path``
+            ingest_workers: Threads used to read files while indexing
+            ingest_batch_size: Chunks embedded and written per batch
+            chunker: "recursive" to split on characters (chunk_size/chunk_overlap)
+                or "token" to split on tokens (chunk_tokens/chunk_overlap_tokens)
+            chunk_tokens: Maximum tokens per chunk for the token chunker
+            chunk_overlap_tokens: Token overlap between chunks for the token chunker
+            chunk_encoding: tiktoken encoding used by the token chunker
+            index_mode: "chunks" embeds chunk text; "sections" splits documents
+                at headings, embeds a summary of each section and returns the
+                full section text for matches
+            summarizer: Summarizer for section mode (extractive when None)
+            section_max_chars: Sections longer than this are split at paragraphs
+            raptor_mode: "collapsed" or "tree" to retrieve from a RAPTOR summary
+                tree built over the chunks (see ``src.raptor``); None disables it
+            raptor_branching: Target number of children per tree summary node
+            raptor_max_levels: Maximum number of summary levels in the tree
+            raptor_summarizer: Summarizer for tree clusters (extractive when None)
+            late_interaction: Retrieve with ColBERT-style MaxSim over per-token
+                embeddings (see ``src.late_interaction``) instead of one vector
+                per chunk
+            late_interaction_params: Index and search parameters: n_centroids,
+                nprobe and candidates
+            token_encoder: Per-token encoder (token outputs of the embedding
+                model when None)
         """
         self.documents_path = documents_path
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.embedding_model = embedding_model
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+        self.cache_dir = cache_dir
+        self.vector_store = vector_store
+        self.vector_dtype = vector_dtype
+        self.vector_quantization = vector_quantization
+        self.ann_backend = ann_backend
+        self.ann_params = dict(ann_params or {})
+        self.searcher = None
+        self.document_extensions = tuple(document_extensions)
+        self.recursive = recursive
+        self.ingest_workers = ingest_workers
+        self.ingest_batch_size = ingest_batch_size
+        self.chunker = chunker
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.chunk_encoding = chunk_encoding
+        self.index_mode = index_mode
+        self.section_max_chars = section_max_chars
+        self.summarizer = summarizer
+        if index_mode == "sections" and summarizer is None:
+            self.summarizer = Summarizer("extractive")
+        self.docstore = None
+        self.raptor_mode = raptor_mode
+        self.raptor_branching = raptor_branching
+        self.raptor_max_levels = raptor_max_levels
+        self.raptor_summarizer = raptor_summarizer or Summarizer("extractive")
+        self.raptor_tree: Optional[RaptorTree] = None
+        self.late_interaction = late_interaction
+        self.late_interaction_params = dict(late_interaction_params or {})
+        self.token_encoder = token_encoder
+        self.late_interaction_index: Optional[LateInteractionIndex] = None
+        self._embeddings = None
+        self._embeddings_lock = threading.Lock()
         self.vectorstore = None
+        self.manifest: List[Dict[str, Any]] = []
+        self.route_centroids: Dict[str, np.ndarray] = {}
+        
+    @property
+    def embeddings(self):
+        """The embedding model, loaded on first use so constructing an indexer stays cheap."""
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    self._embeddings = HuggingFaceEmbeddings(model_name=self.embedding_model)
+        return self._embeddings
+    
+    @embeddings.setter
+    def embeddings(self, embeddings):
+        self._embeddings = embeddings
         
     def load_documents(self) -> List[Document]:
         """Load documents from the specified directory."""
@@ -55,39 +188,472 @@ class DocumentIndexer:
         docs = loader.load()
         print(f"Loaded {len(docs)} documents")
         for i, doc in enumerate(docs):
-            filename = os.path.basename(doc.metadata['source'])
+            filename = self.source_name(doc.metadata['source'])
             print(f"{i+1}. {filename}: {len(doc.page_content)} characters")
         
         return docs
     
-    def chunk_documents(self, docs: List[Document]) -> List[Document]:
-        """Split documents into chunks."""
-        text_splitter = RecursiveCharacterTextSplitter(
+    def iter_documents(self) -> Iterator[Document]:
+        """Stream documents from ``documents_path``, reading files on a thread pool."""
+        if not os.path.exists(self.documents_path):
+            raise FileNotFoundError(f"Documents path not found: {self.documents_path}")
+        
+        files = discover_files(self.documents_path, self.document_extensions, self.recursive)
+        return read_documents(files, max_workers=self.ingest_workers)
+    
+    def _make_splitter(self):
+        if self.index_mode == "sections":
+            return SectionChunker(self.section_max_chars)
+        if self.chunker == "token":
+            return TokenChunker(self.chunk_tokens, self.chunk_overlap_tokens, self.chunk_encoding)
+        return RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap
+            chunk_overlap=self.chunk_overlap,
+            add_start_index=True
         )
-        splits = text_splitter.split_documents(docs)
+    
+    def chunk_documents(self, docs: List[Document]) -> List[Document]:
+        """Split documents into chunks."""
+        splits = self._make_splitter().split_documents(docs)
         print(f"Created {len(splits)} chunks")
         return splits
     
-    def create_vectorstore(self, docs: Optional[List[Document]] = None) -> Chroma:
-        """Create or load vector store."""
-        if docs is None:
-            docs = self.load_documents()
+    def iter_chunks(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """Split documents lazily, one document at a time."""
+        text_splitter = self._make_splitter()
+        for doc in docs:
+            yield from text_splitter.split_documents([doc])
+    
+    def _representations(self, chunks: List[Document]) -> List[str]:
+        """Text to embed for each chunk: the chunk itself or its section summary."""
+        if self.index_mode != "sections":
+            return [chunk.page_content for chunk in chunks]
         
-        chunks = self.chunk_documents(docs)
+        summaries = self.summarizer.summarize([chunk.page_content for chunk in chunks])
+        return [
+            f"{chunk.metadata.get('title', '')} - {chunk.metadata.get('section') or 'Overview'}: {summary}"
+            for chunk, summary in zip(chunks, summaries)
+        ]
+    
+    def create_vectorstore(self, docs: Optional[Iterable[Document]] = None):
+        """
+        Create or load vector store.
         
-        self.vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings
-        )
+        Args:
+            docs: Documents to index; streamed from ``documents_path`` when None.
+                The mmap backend iterates them twice (hash, then embed), so pass
+                a list rather than a one-shot iterator.
+        """
+        if self.vector_store == "mmap":
+            if not self.cache_dir:
+                raise ValueError("The mmap vector store requires cache_dir")
+            self.manifest = self.build_manifest(self.iter_documents() if docs is None else docs)
+            # Workers starting together on a stale index build it (and its ANN
+            # structure) once; the rest wait for the lock and map the result
+            with index_lock(str(Path(self.cache_dir) / "vectors.lock")):
+                self.vectorstore = self._load_or_build_flat_index(docs)
+                self.searcher = self._create_searcher(self.vectorstore)
+            return self.vectorstore
+        elif self.ann_backend != "exact":
+            print(f"Warning: ann_backend '{self.ann_backend}' requires vector_store 'mmap'; Chroma uses its own index")
+        
+        entries: List[Dict[str, Any]] = []
+        documents = self._collect_manifest(self.iter_documents() if docs is None else docs, entries)
+        self.vectorstore = Chroma(embedding_function=self.embeddings)
+        self.docstore = InMemoryStore() if self.index_mode == "sections" else None
+        count = 0
+        for batch in batched(self.iter_chunks(documents), self.ingest_batch_size):
+            if self.docstore is None:
+                self.vectorstore.add_documents(batch)
+            else:
+                # Summaries are searched; the docstore maps them back to sections
+                ids = [str(uuid.uuid4()) for _ in batch]
+                summaries = [
+                    DocumentClass(page_content=text, metadata={**section.metadata, "doc_id": doc_id})
+                    for text, section, doc_id in zip(self._representations(batch), batch, ids)
+                ]
+                self.vectorstore.add_documents(summaries)
+                self.docstore.mset(list(zip(ids, batch)))
+            count += len(batch)
+        self.manifest = self._sort_manifest(entries)
         
-        print("Vector store created successfully")
+        print(f"Vector store created successfully with {count} chunks from {len(entries)} files")
         return self.vectorstore
     
+    def _collect_manifest(self, docs: Iterable[Document], entries: List[Dict[str, Any]]) -> Iterator[Document]:
+        """Pass documents through, recording a manifest entry for each."""
+        for doc in docs:
+            entries.append(self._manifest_entry(doc))
+            yield doc
+    
+    def load_vectorstore(self) -> Optional[FlatVectorIndex]:
+        """
+        Map an existing, up-to-date mmap index without building or embedding anything.
+        
+        Saved ANN structures are loaded too; a missing one is left for
+        create_vectorstore to build.
+        
+        Returns:
+            The mapped index, or None when the store is Chroma or the index
+            (or its ANN structure) is missing or stale
+        """
+        if self.vector_store != "mmap" or not self.cache_dir:
+            return None
+        self.manifest = self.build_manifest(self.iter_documents())
+        index = self._open_current_flat_index()
+        if index is None:
+            return None
+        try:
+            searcher = build_searcher(index, self.ann_backend, self.ann_params, build=False)
+        except (FileNotFoundError, ImportError):
+            return None
+        self.vectorstore, self.searcher = index, searcher
+        return index
+    
+    def _open_current_flat_index(self) -> Optional[FlatVectorIndex]:
+        """Map the on-disk index if it matches the corpus and storage settings."""
+        index_dir = Path(self.cache_dir) / "vectors"
+        try:
+            index = FlatVectorIndex(str(index_dir))
+            if (
+                index.info.get("fingerprint") == self._manifest_fingerprint()
+                and index.info["dtype"] == self.vector_dtype
+                and index.quantization == self.vector_quantization
+            ):
+                print(f"Memory-mapped {len(index)} chunks from {index_dir}")
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+    
+    def _load_or_build_flat_index(self, docs: Optional[Iterable[Document]]) -> FlatVectorIndex:
+        """Map the on-disk index, rebuilding it first if the corpus changed (call under ``index_lock``)."""
+        index = self._open_current_flat_index()
+        if index is not None:
+            return index
+        
+        index_dir = Path(self.cache_dir) / "vectors"
+        fingerprint = self._manifest_fingerprint()
+        chunks = self.iter_chunks(self.iter_documents() if docs is None else docs)
+        with FlatIndexWriter(
+            str(index_dir),
+            dtype=self.vector_dtype,
+            quantization=self.vector_quantization,
+            extra_info={"fingerprint": fingerprint, "embedding_model": self.embedding_model}
+        ) as writer:
+            for batch in batched(chunks, self.ingest_batch_size):
+                # Section mode stores the section text but embeds its summary
+                texts = [chunk.page_content for chunk in batch]
+                vectors = self.embeddings.embed_documents(self._representations(batch))
+                writer.add(texts, [chunk.metadata for chunk in batch], vectors)
+        
+        index = writer.index
+        print(f"Wrote memory-mapped index with {len(index)} chunks to {index_dir}")
+        return index
+    
+    def _create_searcher(self, index: FlatVectorIndex):
+        """Build or load the configured ANN searcher, falling back to exact search."""
+        try:
+            searcher = build_searcher(index, self.ann_backend, self.ann_params)
+        except ImportError as e:
+            print(f"Warning: ANN backend '{self.ann_backend}' unavailable ({e.name}); using exact search")
+            return build_searcher(index, "exact")
+        print(f"Using {searcher.backend} search over {len(index)} chunks")
+        return searcher
+    
+    def source_name(self, source: str) -> str:
+        """Routing name of a file: its path relative to ``documents_path``."""
+        return relative_name(source, self.documents_path)
+    
+    def build_manifest(self, docs: Iterable[Document]) -> List[Dict[str, Any]]:
+        """
+        Describe every indexed file for routing.
+        
+        Each entry records the file name (its path relative to ``documents_path``,
+        so same-named files in different folders stay apart), a short
+        description made of the title and section headings, and a content hash
+        used to invalidate caches.
+        """
+        return self._sort_manifest([self._manifest_entry(doc) for doc in docs])
+    
+    def _manifest_entry(self, doc: Document) -> Dict[str, Any]:
+        lines = [line.strip() for line in doc.page_content.splitlines() if line.strip()]
+        title = lines[0].lstrip("# ") if lines else ""
+        headings = [m.group(1) for m in map(HEADING_PATTERN.match, lines[1:]) if m]
+        description = f"{title}: {'; '.join(headings)}" if headings else title
+        
+        return {
+            "source": doc.metadata["source"],
+            "file_name": self.source_name(doc.metadata["source"]),
+            "description": description[:300],
+            "sha256": hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+        }
+    
+    @staticmethod
+    def _sort_manifest(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Order entries by source path and drop the path itself."""
+        return [
+            {key: value for key, value in entry.items() if key != "source"}
+            for entry in sorted(entries, key=lambda entry: entry["source"])
+        ]
+    
+    def build_route_centroids(self) -> Dict[str, np.ndarray]:
+        """
+        Compute one unit-length centroid embedding per source file.
+        
+        Reuses the chunk embeddings already stored in the vector store, so no
+        extra embedding calls are made. The centroids back local logical routing.
+        
+        Returns:
+            Mapping of file name (see ``source_name``) to its normalized float32 centroid
+        """
+        if self.vectorstore is None:
+            self.create_vectorstore()
+        
+        if isinstance(self.vectorstore, FlatVectorIndex):
+            centroids = self.vectorstore.source_centroids(self.source_name)
+            self.route_centroids = centroids
+            print(f"Computed routing centroids for {len(centroids)} files")
+            return centroids
+        
+        stored = self.vectorstore.get(include=["embeddings", "metadatas"])
+        vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+        sources = [self.source_name(meta["source"]) for meta in stored["metadatas"]]
+        
+        centroids = {}
+        for source in sorted(set(sources)):
+            mask = np.fromiter((name == source for name in sources), dtype=bool, count=len(sources))
+            centroid = vectors[mask].mean(axis=0)
+            centroids[source] = centroid / (np.linalg.norm(centroid) or 1.0)
+        
+        self.route_centroids = centroids
+        print(f"Computed routing centroids for {len(centroids)} files")
+        return centroids
+    
+    def build_routing_targets(self):
+        """
+        Return the corpus manifest and per-file routing centroids.
+        
+        Centroids are cached in ``cache_dir`` next to the manifest and reused as
+        long as the corpus contents, chunking and embedding model are unchanged.
+        
+        Returns:
+            Tuple of (manifest entries, centroid mapping)
+        """
+        if self.vectorstore is None:
+            self.create_vectorstore()
+        
+        fingerprint = self._manifest_fingerprint()
+        centroids = self._load_routing_cache(fingerprint)
+        if centroids is None:
+            centroids = self.build_route_centroids()
+            self._save_routing_cache(fingerprint, centroids)
+        else:
+            self.route_centroids = centroids
+            print(f"Loaded routing centroids for {len(centroids)} files from cache")
+        
+        return self.manifest, centroids
+    
+    def _manifest_fingerprint(self) -> str:
+        """Hash everything the routing artifacts depend on."""
+        key = {
+            "files": [(entry["file_name"], entry["sha256"]) for entry in self.manifest],
+            "embedding_model": self.embedding_model,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap
+        }
+        if self.chunker != "recursive":
+            key["chunker"] = [self.chunker, self.chunk_tokens, self.chunk_overlap_tokens, self.chunk_encoding]
+        if self.index_mode != "chunks":
+            key["index_mode"] = [self.index_mode, self.section_max_chars, self.summarizer.variant]
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    def _load_routing_cache(self, fingerprint: str) -> Optional[Dict[str, np.ndarray]]:
+        """Load cached centroids if they were built from the same corpus."""
+        if not self.cache_dir:
+            return None
+        
+        routing_dir = Path(self.cache_dir) / "routing"
+        try:
+            with open(routing_dir / "manifest.json", "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["fingerprint"] != fingerprint:
+                return None
+            matrix = np.load(routing_dir / "centroids.npy")
+        except (OSError, ValueError, KeyError):
+            return None
+        
+        names = [entry["file_name"] for entry in cached["files"]]
+        return dict(zip(names, matrix))
+    
+    def _save_routing_cache(self, fingerprint: str, centroids: Dict[str, np.ndarray]):
+        """Persist the manifest and centroids so restarts skip recomputation."""
+        if not self.cache_dir:
+            return
+        
+        routing_dir = Path(self.cache_dir) / "routing"
+        routing_dir.mkdir(parents=True, exist_ok=True)
+        files = [entry for entry in self.manifest if entry["file_name"] in centroids]
+        if not files:
+            return
+        
+        np.save(routing_dir / "centroids.npy", np.stack([centroids[entry["file_name"]] for entry in files]))
+        with open(routing_dir / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "files": files}, f, indent=2)
+    
+    def build_raptor_tree(self) -> RaptorTree:
+        """
+        Return the RAPTOR summary tree over the indexed chunks.
+        
+        The tree is saved in ``cache_dir`` and reused while the corpus, chunking
+        and tree settings are unchanged. Clustering is seeded, so a rebuild
+        forms the same clusters and finds their summaries in the summarizer's
+        cache; an interrupted build resumes where it stopped.
+        """
+        if self.vectorstore is None:
+            self.create_vectorstore()
+        
+        tree_dir = Path(self.cache_dir) / "raptor" if self.cache_dir else None
+        fingerprint = self._raptor_fingerprint()
+        if tree_dir is not None:
+            try:
+                tree = RaptorTree.load(str(tree_dir))
+                if tree.info.get("fingerprint") == fingerprint:
+                    print(f"Loaded RAPTOR tree with {len(tree)} nodes from {tree_dir}")
+                    self.raptor_tree = tree
+                    return tree
+            except (OSError, ValueError, KeyError):
+                pass
+        
+        texts, metadatas, vectors = self._leaf_chunks()
+        tree = RaptorTree.build(
+            texts,
+            metadatas,
+            vectors,
+            self.embeddings,
+            self.raptor_summarizer,
+            branching=self.raptor_branching,
+            max_levels=self.raptor_max_levels,
+            info={"fingerprint": fingerprint}
+        )
+        if tree_dir is not None:
+            try:
+                tree.save(str(tree_dir))
+            except OSError as e:
+                print(f"Warning: Could not save RAPTOR tree: {e}")
+        print(f"Built RAPTOR tree with {len(tree)} nodes over {len(texts)} chunks")
+        self.raptor_tree = tree
+        return tree
+    
+    def _leaf_chunks(self):
+        """Texts, metadata and embeddings of every indexed chunk."""
+        if isinstance(self.vectorstore, FlatVectorIndex):
+            index = self.vectorstore
+            texts = [index.get_text(i) for i in range(len(index))]
+            metadatas = [index.get_metadata(i) for i in range(len(index))]
+            return texts, metadatas, np.asarray(index.vectors, dtype=np.float32)
+        
+        stored = self.vectorstore.get(include=["embeddings", "metadatas", "documents"])
+        texts, metadatas = stored["documents"], stored["metadatas"]
+        if self.docstore is not None:
+            # Leaves are the full sections, embedded by their summaries
+            sections = self.docstore.mget([metadata["doc_id"] for metadata in metadatas])
+            texts = [section.page_content for section in sections]
+            metadatas = [section.metadata for section in sections]
+        return texts, metadatas, np.asarray(stored["embeddings"], dtype=np.float32)
+    
+    def _raptor_fingerprint(self) -> str:
+        """Hash the corpus fingerprint together with the tree settings."""
+        key = [
+            self._manifest_fingerprint(),
+            self.raptor_branching,
+            self.raptor_max_levels,
+            self.raptor_summarizer.variant
+        ]
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+    
+    def build_late_interaction_index(self) -> LateInteractionIndex:
+        """
+        Return the per-token index over the indexed chunks, building it if stale.
+        
+        Chunk ids follow the vector store's order, so matches are materialized
+        from the same texts and metadata as dense results.
+        """
+        if self.vectorstore is None:
+            self.create_vectorstore()
+        if not self.cache_dir:
+            raise ValueError("Late-interaction retrieval requires cache_dir")
+        
+        index_dir = Path(self.cache_dir) / "late_interaction"
+        n_centroids = self.late_interaction_params.get("n_centroids")
+        fingerprint = hashlib.sha256(
+            json.dumps([self._manifest_fingerprint(), n_centroids]).encode("utf-8")
+        ).hexdigest()
+        try:
+            index = LateInteractionIndex(str(index_dir))
+            if index.info.get("fingerprint") == fingerprint:
+                print(f"Memory-mapped {index.n_tokens} token embeddings from {index_dir}")
+                self.late_interaction_index = index
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        
+        encoder = self._token_encoder()
+        texts, _, _ = self._leaf_chunks()
+        token_vectors = (
+            vectors
+            for batch in batched(texts, self.ingest_batch_size)
+            for vectors in encoder.encode(batch)
+        )
+        index = LateInteractionIndex.write(
+            str(index_dir),
+            token_vectors,
+            n_centroids=n_centroids,
+            extra_info={"fingerprint": fingerprint, "embedding_model": self.embedding_model}
+        )
+        print(f"Wrote late-interaction index with {index.n_tokens} tokens ({index.nbytes / 1e6:.1f} MB) to {index_dir}")
+        self.late_interaction_index = index
+        return index
+    
+    def _token_encoder(self):
+        if self.token_encoder is None:
+            self.token_encoder = SentenceTransformerTokenEncoder.from_embeddings(self.embeddings)
+        return self.token_encoder
+    
+    def _chunk_document_getter(self):
+        """Map chunk ids (in vector store order) to documents."""
+        if isinstance(self.vectorstore, FlatVectorIndex):
+            return self.vectorstore.get_document
+        
+        texts, metadatas, _ = self._leaf_chunks()
+        
+        def get_document(chunk_id: int, score: Optional[float] = None) -> Document:
+            metadata = dict(metadatas[chunk_id])
+            if score is not None:
+                metadata["score"] = score
+            return DocumentClass(page_content=texts[chunk_id], metadata=metadata)
+        return get_document
+    
     def get_retriever(self, k: int = 4):
         """Get a retriever from the vector store."""
         if self.vectorstore is None:
             self.create_vectorstore()
         
+        if self.raptor_mode:
+            tree = self.raptor_tree or self.build_raptor_tree()
+            return RaptorRetriever(tree, self.embeddings, k=k, mode=self.raptor_mode)
+        if self.late_interaction:
+            index = self.late_interaction_index or self.build_late_interaction_index()
+            return LateInteractionRetriever(
+                index,
+                self._token_encoder(),
+                self._chunk_document_getter(),
+                k=k,
+                nprobe=self.late_interaction_params.get("nprobe", 4),
+                candidates=self.late_interaction_params.get("candidates", 64)
+            )
+        if isinstance(self.vectorstore, FlatVectorIndex):
+            return FlatIndexRetriever(self.vectorstore, self.embeddings, k=k, searcher=self.searcher)
+        if self.docstore is not None:
+            return MultiVectorRetriever(vectorstore=self.vectorstore, docstore=self.docstore, search_kwargs={"k": k})
         return self.vectorstore.as_retriever(search_kwargs={"k": k})
@@ -0,0 +1,160 @@
+"""
+Streaming ingest for RAG pipeline.
+
+Discovers files under a directory tree and reads them lazily, one document at a
+time, with pluggable per-extension loaders. File reads run on a small thread
+pool with a bounded number of files in flight, so memory use depends on the
+largest file rather than the size of the corpus.
+"""
+
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+from .lazy_imports import LazyImport
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+DocumentClass = LazyImport("langchain_core.documents", "Document")
+
+T = TypeVar("T")
+
+# Extension (lower case, with dot) -> function returning the file's text
+LOADERS: Dict[str, Callable[[Path], str]] = {}
+
+DEFAULT_EXTENSIONS = (".txt", ".md", ".pdf", ".docx")
+
+
+def register_loader(*extensions: str):
+    """
+    Register a text loader for one or more file extensions.
+    
+    Example:
+        @register_loader(".html", ".htm")
+        def load_html(path: Path) -> str:
+            ...
+    """
+    def decorator(func: Callable[[Path], str]) -> Callable[[Path], str]:
+        for extension in extensions:
+            LOADERS[extension.lower()] = func
+        return func
+    return decorator
+
+
+@register_loader(".txt", ".md", ".markdown")
+def load_text(path: Path) -> str:
+    """Load a plain text or Markdown file."""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@register_loader(".pdf")
+def load_pdf(path: Path) -> str:
+    """Load the text layer of a PDF (requires ``pypdf``)."""
+    from pypdf import PdfReader
+    
+    reader = PdfReader(str(path))
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+@register_loader(".docx")
+def load_docx(path: Path) -> str:
+    """Load the paragraphs of a Word document (requires ``python-docx``)."""
+    import docx
+    
+    return "\n\n".join(paragraph.text for paragraph in docx.Document(str(path)).paragraphs)
+
+
+def discover_files(
+    root: str,
+    extensions: Sequence[str] = DEFAULT_EXTENSIONS,
+    recursive: bool = True
+) -> Iterator[Path]:
+    """
+    Yield files under ``root`` with a supported extension, in a stable order.
+    
+    Args:
+        root: Directory to search
+        extensions: File extensions to include
+        recursive: Whether to descend into subdirectories
+    """
+    wanted = {extension.lower() for extension in extensions}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".")) if recursive else []
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            if path.suffix.lower() in wanted:
+                yield path
+
+
+def relative_name(source: str, root: str) -> str:
+    """
+    Name a file by its path relative to ``root``, with ``/`` separators.
+    
+    Files with the same name in different subdirectories stay distinct; a
+    source outside ``root`` falls back to its base name.
+    """
+    relative = os.path.relpath(source, root)
+    if relative.startswith(os.pardir):
+        return os.path.basename(source)
+    return Path(relative).as_posix()
+
+
+def load_file(path: Path) -> Optional[Document]:
+    """Read one file into a document, or return None if it cannot be loaded."""
+    loader = LOADERS.get(path.suffix.lower())
+    if loader is None:
+        return None
+    try:
+        text = loader(path)
+    except ImportError as e:
+        print(f"Warning: Skipping {path}: missing optional dependency ({e.name})")
+        return None
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        print(f"Warning: Skipping {path}: {e}")
+        return None
+    return DocumentClass(page_content=text, metadata={"source": str(path)})
+
+
+def read_documents(paths: Iterable[Path], max_workers: int = 4) -> Iterator[Document]:
+    """
+    Load files on a thread pool and yield documents in input order.
+    
+    At most ``2 * max_workers`` files are read ahead of the consumer.
+    """
+    if max_workers <= 1:
+        for path in paths:
+            doc = load_file(path)
+            if doc is not None:
+                yield doc
+        return
+        
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest") as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(load_file, path))
+            if len(pending) >= 2 * max_workers:
+                doc = pending.popleft().result()
+                if doc is not None:
+                    yield doc
+        while pending:
+            doc = pending.popleft().result()
+            if doc is not None:
+                yield doc
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Group an iterable into lists of at most ``size`` items."""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,331 @@
+"""
+Late-interaction (ColBERT-style) retrieval for RAG pipeline.
+
+Every chunk is stored as one embedding per token, and a query scores a chunk
+with MaxSim: each query token takes its best match among the chunk's tokens and
+the matches are averaged. Token embeddings are compressed to the id of their
+nearest k-means centroid plus an int8 residual with a float16 scale.
+
+Search runs in two stages:
+
+1. Candidates: each query token probes its ``nprobe`` nearest centroids, and
+   every chunk with a token in a probed centroid is scored approximately from
+   centroid similarities alone.
+2. Rescoring: the best ``candidates`` chunks are scored exactly with their
+   decompressed token embeddings.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .ann import kmeans
+from .vector_index import SEARCH_BLOCK_ROWS, quantize_int8
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+LATE_INTERACTION_FORMAT_VERSION = 1
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def default_centroid_count(n_tokens: int) -> int:
+    """Power of two near ``4 * sqrt(n_tokens)``, at most one per token."""
+    if n_tokens <= 1:
+        return 1
+    return max(1, min(n_tokens, 2 ** round(math.log2(4 * math.sqrt(n_tokens)))))
+
+
+class SentenceTransformerTokenEncoder:
+    """Per-token embeddings from a sentence-transformers model."""
+    
+    def __init__(self, model, batch_size: int = 32):
+        """
+        Initialize the encoder.
+        
+        Args:
+            model: ``SentenceTransformer`` instance
+            batch_size: Texts encoded per forward pass
+        """
+        self.model = model
+        self.batch_size = batch_size
+        
+    @classmethod
+    def from_embeddings(cls, embeddings, **kwargs) -> "SentenceTransformerTokenEncoder":
+        """Reuse the model already loaded by a ``HuggingFaceEmbeddings`` instance."""
+        return cls(embeddings._client, **kwargs)
+        
+    def encode(self, texts: List[str]) -> List[np.ndarray]:
+        """Return a unit-length (n_tokens, dim) float32 array per text."""
+        outputs = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            output_value="token_embeddings",
+            convert_to_numpy=False
+        )
+        return [_normalize(output.float().cpu().numpy()) for output in outputs]
+        
+    def encode_query(self, text: str) -> np.ndarray:
+        return self.encode([text])[0]
+
+
+class LateInteractionIndex:
+    """Read-only compressed token-embedding index, memory-mapped from disk."""
+    
+    def __init__(self, index_dir: str):
+        """
+        Open an index written by ``LateInteractionIndex.write``.
+        
+        Args:
+            index_dir: Directory containing the index files
+        """
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "info.json", "r", encoding="utf-8") as f:
+            self.info: Dict[str, Any] = json.load(f)
+        if self.info.get("format_version") != LATE_INTERACTION_FORMAT_VERSION:
+            raise ValueError(f"Unsupported late-interaction index format in {index_dir}")
+            
+        def load(name: str) -> np.ndarray:
+            return np.load(self.index_dir / f"{name}.npy", mmap_mode="r")
+            
+        self.centroids = np.asarray(load("centroids"), dtype=np.float32)
+        self.codes = load("codes")
+        self.residuals = load("residuals")
+        self.scales = load("scales")
+        self.offsets = np.asarray(load("offsets"), dtype=np.int64)
+        self.centroid_offsets = np.asarray(load("centroid_offsets"), dtype=np.int64)
+        self.centroid_chunks = load("centroid_chunks")
+        self.count = len(self.offsets) - 1
+        
+    def __len__(self) -> int:
+        return self.count
+        
+    @property
+    def n_tokens(self) -> int:
+        return int(self.offsets[-1])
+        
+    @property
+    def nbytes(self) -> int:
+        """Size of the token storage (codes, residuals and scales)."""
+        return self.codes.nbytes + self.residuals.nbytes + self.scales.nbytes
+        
+    @classmethod
+    def write(
+        cls,
+        index_dir: str,
+        token_vectors: Iterable[np.ndarray],
+        n_centroids: Optional[int] = None,
+        train_size: int = 64,
+        seed: int = 0,
+        extra_info: Optional[Dict[str, Any]] = None
+    ) -> "LateInteractionIndex":
+        """
+        Compress per-chunk token embeddings and write them to ``index_dir``.
+        
+        Args:
+            index_dir: Output directory (replaced atomically)
+            token_vectors: One (n_tokens, dim) array per chunk, in chunk-id order
+            n_centroids: Number of k-means centroids (see ``default_centroid_count``)
+            train_size: Training tokens sampled per centroid
+            seed: Random seed for sampling and k-means
+            extra_info: Extra values stored in ``info.json``
+        """
+        arrays = [_normalize(vectors).astype(np.float16) for vectors in token_vectors]
+        dim = next((array.shape[1] for array in arrays if array.ndim == 2 and len(array)), 1)
+        # Chunks need at least one token so every chunk has a MaxSim score
+        arrays = [array if len(array) else np.zeros((1, dim), dtype=np.float16) for array in arrays]
+        lengths = np.array([len(array) for array in arrays], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        tokens = np.concatenate(arrays) if arrays else np.zeros((0, dim), dtype=np.float16)
+        
+        n_tokens = len(tokens)
+        n_centroids = min(n_centroids or default_centroid_count(n_tokens), max(n_tokens, 1))
+        rng = np.random.default_rng(seed)
+        if n_tokens:
+            sample = np.sort(rng.choice(n_tokens, min(n_tokens, n_centroids * train_size), replace=False))
+            centroids = kmeans(tokens[sample].astype(np.float32), n_centroids, seed=seed)
+        else:
+            centroids = np.zeros((1, dim), dtype=np.float32)
+            
+        code_dtype = np.uint16 if len(centroids) <= np.iinfo(np.uint16).max else np.int32
+        codes = np.empty(n_tokens, dtype=code_dtype)
+        residuals = np.empty((n_tokens, dim), dtype=np.int8)
+        scales = np.empty(n_tokens, dtype=np.float16)
+        for start in range(0, n_tokens, SEARCH_BLOCK_ROWS):
+            block = tokens[start:start + SEARCH_BLOCK_ROWS].astype(np.float32)
+            block_codes = np.argmax(block @ centroids.T, axis=1)
+            block_residuals, block_scales = quantize_int8(block - centroids[block_codes])
+            codes[start:start + len(block)] = block_codes
+            residuals[start:start + len(block)] = block_residuals
+            scales[start:start + len(block)] = block_scales
+            
+        # Inverted lists: the distinct chunks with a token in each centroid
+        chunk_ids = np.repeat(np.arange(len(arrays), dtype=np.int64), lengths)
+        pairs = np.unique(codes.astype(np.int64) * max(len(arrays), 1) + chunk_ids)
+        pair_codes, centroid_chunks = np.divmod(pairs, max(len(arrays), 1))
+        centroid_offsets = np.searchsorted(pair_codes, np.arange(len(centroids) + 1))
+        
+        index_dir = Path(index_dir)
+        staging = index_dir.with_name(f".{index_dir.name}.{os.getpid()}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        for name, array in (
+            ("centroids", centroids.astype(np.float32)),
+            ("codes", codes),
+            ("residuals", residuals),
+            ("scales", scales),
+            ("offsets", offsets),
+            ("centroid_offsets", centroid_offsets.astype(np.int64)),
+            ("centroid_chunks", centroid_chunks.astype(np.int32))
+        ):
+            np.save(staging / f"{name}.npy", array)
+        with open(staging / "info.json", "w", encoding="utf-8") as f:
+            json.dump({
+                **(extra_info or {}),
+                "format_version": LATE_INTERACTION_FORMAT_VERSION,
+                "count": len(arrays),
+                "tokens": n_tokens,
+                "dim": dim,
+                "centroids": len(centroids)
+            }, f, indent=2)
+            
+        # Swap the old directory out before moving the new one into place
+        old = index_dir.with_name(f".{index_dir.name}.{os.getpid()}.old")
+        if index_dir.exists():
+            os.replace(index_dir, old)
+        os.replace(staging, index_dir)
+        shutil.rmtree(old, ignore_errors=True)
+        return cls(str(index_dir))
+        
+    def _gather(self, chunk_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Token ids of ``chunk_ids`` laid out back to back.
+        
+        Returns:
+            Tuple of (token ids, start of each chunk's segment)
+        """
+        starts = self.offsets[chunk_ids]
+        lengths = self.offsets[chunk_ids + 1] - starts
+        segments = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        token_ids = np.repeat(starts - segments, lengths) + np.arange(int(lengths.sum()))
+        return token_ids, segments
+        
+    def decompress(self, token_ids: np.ndarray) -> np.ndarray:
+        """Rebuild unit-length float32 token embeddings."""
+        residuals = np.asarray(self.residuals[token_ids], dtype=np.float32)
+        residuals *= np.asarray(self.scales[token_ids], dtype=np.float32)[:, None]
+        return _normalize(self.centroids[np.asarray(self.codes[token_ids], dtype=np.int64)] + residuals)
+        
+    def maxsim(self, query_tokens: np.ndarray, chunk_ids: np.ndarray, approximate: bool = False) -> np.ndarray:
+        """
+        Mean over query tokens of the best matching chunk token, per chunk.
+        
+        Args:
+            query_tokens: Unit-length (n_query_tokens, dim) array
+            chunk_ids: Chunks to score
+            approximate: Score with centroid similarities instead of the
+                decompressed token embeddings
+        """
+        if len(chunk_ids) == 0:
+            return np.zeros(0, dtype=np.float32)
+        token_ids, segments = self._gather(np.asarray(chunk_ids, dtype=np.int64))
+        if approximate:
+            centroid_scores = query_tokens @ self.centroids.T
+            similarities = centroid_scores[:, np.asarray(self.codes[token_ids], dtype=np.int64)]
+        else:
+            similarities = query_tokens @ self.decompress(token_ids).T
+        return np.maximum.reduceat(similarities, segments, axis=1).mean(axis=0)
+        
+    def search(
+        self,
+        query_tokens,
+        k: int = 4,
+        nprobe: int = 4,
+        candidates: int = 64
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the ``k`` chunks with the highest MaxSim score.
+        
+        Args:
+            query_tokens: (n_query_tokens, dim) query token embeddings
+            k: Number of results
+            nprobe: Centroids probed per query token; 0 scores every chunk
+            candidates: Chunks rescored exactly after approximate scoring
+            
+        Returns:
+            List of (chunk id, score) with the best match first
+        """
+        if self.count == 0 or k <= 0:
+            return []
+        query = _normalize(query_tokens)
+        
+        if nprobe <= 0:
+            chunk_ids = np.arange(self.count)
+        else:
+            nprobe = min(nprobe, len(self.centroids))
+            probe = np.argpartition(-(query @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+            lists = [
+                self.centroid_chunks[self.centroid_offsets[c]:self.centroid_offsets[c + 1]]
+                for c in np.unique(probe)
+            ]
+            chunk_ids = np.unique(np.concatenate(lists)).astype(np.int64)
+            if len(chunk_ids) > candidates:
+                approximate = self.maxsim(query, chunk_ids, approximate=True)
+                chunk_ids = np.sort(chunk_ids[np.argpartition(-approximate, candidates - 1)[:candidates]])
+                
+        scores = self.maxsim(query, chunk_ids)
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(chunk_ids[i]), float(scores[i])) for i in top]
+
+
+class LateInteractionRetriever:
+    """Retriever interface over a ``LateInteractionIndex``."""
+    
+    def __init__(
+        self,
+        index: LateInteractionIndex,
+        encoder,
+        get_document: Callable[[int, Optional[float]], "Document"],
+        k: int = 4,
+        nprobe: int = 4,
+        candidates: int = 64
+    ):
+        """
+        Initialize the retriever.
+        
+        Args:
+            index: Opened late-interaction index
+            encoder: Object with ``encode_query(text)`` returning token embeddings
+            get_document: Maps a chunk id and score to a document
+            k: Default number of chunks to return
+            nprobe: Centroids probed per query token
+            candidates: Chunks rescored exactly per query
+        """
+        self.index = index
+        self.encoder = encoder
+        self.get_document = get_document
+        self.k = k
+        self.nprobe = nprobe
+        self.candidates = candidates
+        
+    def invoke(self, query: str) -> List["Document"]:
+        """Retrieve the top ``k`` documents for a query."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, self.k)]
+        
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple["Document", float]]:
+        """Retrieve documents with MaxSim scores averaged over query tokens."""
+        results = self.index.search(self.encoder.encode_query(query), k, self.nprobe, self.candidates)
+        return [(self.get_document(chunk_id, score), score) for chunk_id, score in results]
@@ -0,0 +1,45 @@
+"""
+Lazy import helpers for RAG pipeline.
+
+Heavy third-party packages (torch via sentence-transformers, Chroma, the Groq
+client, LangChain community integrations) are only imported when the component
+that needs them is actually used.
+"""
+
+import importlib
+from typing import Any, Optional
+
+
+class LazyImport:
+    """Stand-in for a module or attribute that is imported on first use."""
+
+    def __init__(self, module: str, name: Optional[str] = None):
+        """
+        Initialize the lazy import.
+
+        Args:
+            module: Dotted module path to import
+            name: Attribute to take from the module (the module itself when None)
+        """
+        self._module = module
+        self._name = name
+        self._target = None
+
+    def resolve(self) -> Any:
+        """Import and return the real object."""
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            self._target = getattr(target, self._name) if self._name else target
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self) -> str:
+        target = f"{self._module}.{self._name}" if self._name else self._module
+        return f"LazyImport({target!r})"
@@ -0,0 +1,392 @@
+"""
+Rate-limit-aware scheduling of LLM calls for RAG pipeline.
+
+Every chat-model call goes through one LLMScheduler, which:
+
+- waits for room in requests-per-minute and tokens-per-minute budgets (token
+  buckets refilled continuously), so bursts stay under the provider's limits
+- gives each attempt a deadline, so a stalled response cannot hang a request
+- retries rate-limit, timeout, connection and 5xx errors with exponential
+  backoff and full jitter, honouring Retry-After when the server sends one
+- optionally hedges: an attempt slower than ``hedge_after`` seconds gets a
+  second copy (if the budgets have room) and whichever finishes first wins
+
+Callers bound every LLM call in a block by a request deadline with
+``deadline_scope``; waits, attempts and retries never run past it.
+
+ScheduledLLM wraps a chat model so components keep composing it with prompts
+(``prompt | llm``, where LangChain wraps it as a runnable) and calling
+``with_structured_output`` unchanged.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Longest Retry-After honoured; servers asking for more are retried sooner
+MAX_RETRY_AFTER = 60.0
+
+
+# time.monotonic() deadline for LLM calls made in the current context
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+class LLMTimeout(TimeoutError):
+    """An LLM attempt did not finish within its deadline."""
+
+
+class DeadlineExceeded(LLMTimeout):
+    """The caller's deadline left no time to (re)try the LLM call."""
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """
+    Bound LLM calls made inside the block by a ``time.monotonic()`` deadline.
+    
+    Nested scopes keep the earlier deadline; None leaves the current one.
+    """
+    current = _deadline.get()
+    if deadline is None or (current is not None and current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class TokenBucket:
+    """Continuously refilled budget of ``per_minute`` units."""
+    
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the bucket full.
+        
+        Args:
+            per_minute: Units refilled per minute (also the burst size)
+            clock: Monotonic clock, replaceable in tests
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+        
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+        
+    def reserve(self, amount: float) -> float:
+        """
+        Take ``amount`` units now and return the seconds to wait before using them.
+        
+        The level may go negative; later callers then queue behind the debt,
+        which keeps waiting callers roughly first come, first served.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+            
+    def try_take(self, amount: float) -> bool:
+        """Take ``amount`` units only if they are available right now."""
+        with self._lock:
+            self._refill()
+            if self.level < amount:
+                return False
+            self.level -= amount
+            return True
+            
+    def give_back(self, amount: float):
+        """Return units (negative amounts charge extra usage)."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+            
+    def available(self) -> float:
+        """Units available right now (negative while callers wait on debt)."""
+        with self._lock:
+            self._refill()
+            return self.level
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status carried by a client exception, if any."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, timeouts, connection failures and server errors are worth retrying."""
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Client libraries (groq, openai, httpx) name these APITimeoutError, ConnectError, ...
+    name = type(error).__name__
+    return "Timeout" in name or "Connect" in name
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header, if the server sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        value = headers.get("retry-after") if headers is not None else None
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(value: Any) -> int:
+    """Rough prompt size (4 characters per token) of a prompt value, messages or text."""
+    if hasattr(value, "to_string"):
+        value = value.to_string()
+    elif isinstance(value, (list, tuple)):
+        value = " ".join(str(getattr(message, "content", message)) for message in value)
+    return len(str(value)) // 4 + 1
+
+
+class LLMScheduler:
+    """Shared budget, deadline, retry and hedging policy for LLM calls."""
+    
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = 30,
+        tokens_per_minute: Optional[float] = 6000,
+        call_timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_after: Optional[float] = None,
+        expected_output_tokens: int = 512,
+        max_workers: int = 16,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            requests_per_minute: Request budget (unlimited when None)
+            tokens_per_minute: Prompt plus completion token budget (unlimited when None)
+            call_timeout: Seconds each attempt may take
+            max_retries: Retries after the first attempt for retryable errors
+            backoff_base: First backoff ceiling in seconds, doubled per retry
+            backoff_max: Largest backoff ceiling in seconds
+            hedge_after: Start a second attempt after this many seconds (off when None)
+            expected_output_tokens: Completion tokens reserved per call until
+                the response reports actual usage
+            max_workers: Threads running attempts (hedges and abandoned
+                attempts each hold one until the HTTP client gives up)
+            sleep: Sleep function, replaceable in tests
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.expected_output_tokens = expected_output_tokens
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._sleep = sleep
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "timeouts": 0,
+            "deadline_exceeded": 0,
+            "failures": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "throttled_seconds": 0.0
+        }
+        
+    def _count(self, name: str, amount: float = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+            
+    def call(self, func: Callable[[], Any], prompt_tokens: int = 0) -> Any:
+        """
+        Run ``func`` (one LLM request) under the budgets, deadline and retry policy.
+        
+        Args:
+            func: Zero-argument callable making the request
+            prompt_tokens: Estimated prompt size, charged with the expected output
+            
+        Returns:
+            The first successful result
+        """
+        tokens = prompt_tokens + self.expected_output_tokens
+        deadline = _deadline.get()
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            self._throttle(tokens, deadline)
+            timeout = self._attempt_timeout(deadline)
+            try:
+                result = self._attempt(func, tokens, timeout)
+            except DeadlineExceeded:
+                raise
+            except LLMTimeout as e:
+                if timeout < self.call_timeout:
+                    # Cut short by the caller's deadline, so there is no time to retry
+                    self._count("deadline_exceeded")
+                    raise DeadlineExceeded(f"LLM call hit the request deadline after {timeout:.1f}s") from e
+                error = e
+            except Exception as e:
+                error = e
+            else:
+                self._settle_usage(result, tokens)
+                return result
+            
+            if status_code(error) == 429:
+                self._count("rate_limited")
+            if not is_retryable(error) or attempt == self.max_retries:
+                self._count("failures")
+                raise error
+            delay = retry_after(error)
+            if delay is None:
+                # Full jitter keeps clients that failed together from retrying together
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            delay = min(delay, MAX_RETRY_AFTER)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded("no time left before the request deadline to retry") from error
+            self._count("retries")
+            self._sleep(delay)
+            
+    def _attempt_timeout(self, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return self.call_timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded("request deadline passed before the LLM call")
+        return min(self.call_timeout, remaining)
+        
+    def _throttle(self, tokens: int, deadline: Optional[float] = None):
+        """Reserve one request and ``tokens`` tokens, sleeping until both budgets allow it."""
+        delay = 0.0
+        if self.requests is not None:
+            delay = self.requests.reserve(1)
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            # Hand the reservation back so requests that can still make it go first
+            if self.requests is not None:
+                self.requests.give_back(1)
+            if self.tokens is not None:
+                self.tokens.give_back(tokens)
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded(f"rate budget needs {delay:.1f}s, past the request deadline")
+        if delay > 0:
+            self._count("throttled_seconds", delay)
+            self._sleep(delay)
+            
+    def _attempt(self, func: Callable[[], Any], tokens: int, timeout: Optional[float] = None) -> Any:
+        """One attempt with a deadline, plus a hedged copy when it runs slow."""
+        self._count("attempts")
+        timeout = self.call_timeout if timeout is None else timeout
+        start = time.monotonic()
+        primary = self._executor.submit(func)
+        pending = {primary}
+        
+        if self.hedge_after is not None and self.hedge_after < timeout:
+            done, _ = wait(pending, timeout=self.hedge_after)
+            if not done and self._take_hedge_budget(tokens):
+                self._count("hedges")
+                pending.add(self._executor.submit(func))
+                
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = timeout - (time.monotonic() - start)
+            done, pending = wait(pending, timeout=max(0.0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+                
+        if not pending and error is not None:
+            raise error
+        # Running attempts cannot be interrupted; they finish in the background
+        self._count("timeouts")
+        raise LLMTimeout(f"LLM call did not finish within {timeout:.1f}s")
+        
+    def _take_hedge_budget(self, tokens: int) -> bool:
+        """Hedges only use spare budget; they never wait for it."""
+        if self.requests is not None and not self.requests.try_take(1):
+            return False
+        if self.tokens is not None and not self.tokens.try_take(tokens):
+            if self.requests is not None:
+                self.requests.give_back(1)
+            return False
+        return True
+        
+    def _settle_usage(self, result: Any, reserved: int):
+        """Replace the token estimate with the usage the response reports."""
+        usage = getattr(result, "usage_metadata", None)
+        if self.tokens is not None and isinstance(usage, dict) and usage.get("total_tokens"):
+            self.tokens.give_back(reserved - usage["total_tokens"])
+            
+    def stats(self) -> Dict[str, Any]:
+        """Call, retry, hedge and throttling counters plus remaining budgets."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        for name, bucket in (("requests_available", self.requests), ("tokens_available", self.tokens)):
+            if bucket is not None:
+                stats[name] = round(bucket.available(), 1)
+        return stats
+
+
+class ScheduledLLM:
+    """Chat model wrapper that sends every call through an LLMScheduler."""
+    
+    def __init__(self, llm, scheduler: LLMScheduler):
+        """
+        Initialize the wrapper.
+        
+        Args:
+            llm: Chat model (or structured-output runnable) to call
+            scheduler: Scheduler shared by every component
+        """
+        self.llm = llm
+        self.scheduler = scheduler
+        
+    def invoke(self, input: Any, config=None, **kwargs) -> Any:
+        return self.scheduler.call(lambda: self.llm.invoke(input, config, **kwargs), estimate_tokens(input))
+        
+    def __call__(self, input: Any, config=None) -> Any:
+        # Piped after a prompt, LangChain calls this through a RunnableLambda
+        return self.invoke(input, config)
+        
+    def with_structured_output(self, schema, **kwargs) -> "ScheduledLLM":
+        return ScheduledLLM(self.llm.with_structured_output(schema, **kwargs), self.scheduler)
+        
+    @property
+    def model_name(self) -> Optional[str]:
+        return getattr(self.llm, "model_name", None)
+        
+    def __getattr__(self, name: str) -> Any:
+        # Anything else (temperature, model, ...) is read from the wrapped model
+        if name in ("llm", "scheduler"):
+            raise AttributeError(name)
+        return getattr(self.llm, name)
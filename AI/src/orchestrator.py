@@ -4,21 +4,31 @@ Main orchestrator for the RAG pipeline.
 Coordinates all components to provide a unified interface.
 """
 
+import copy
+import json
 import os
+import threading
 import time
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, field
 from pathlib import Path
 
-from langchain_groq import ChatGroq
-
-
+import numpy as np
 
+from .lazy_imports import LazyImport
 from .indexing import DocumentIndexer
 from .query_transform import QueryTransformer, DocumentReranker
 from .retrieval import DocumentRetriever
 from .routing import LogicalRouter, SemanticRouter
-from .generation import ResponseGenerator
+from .generation import ResponseGenerator, ContextBuilder
+from .summarization import Summarizer
+from .transform_cache import TransformationCache, normalize_question
+from .single_flight import SingleFlight
+from .http_pool import shared_pool
+from .llm_scheduler import LLMScheduler, LLMTimeout, ScheduledLLM, deadline_scope
+from .correction import AMBIGUOUS, INCORRECT, RelevanceGrader, retrieval_confidence
+
+ChatGroq = LazyImport("langchain_groq", "ChatGroq")
 
 
 @dataclass
@@ -32,35 +42,198 @@ class PipelineConfig:
     documents_path: str = "rag/uptiq_hr_policies"
     chunk_size: int = 200
     chunk_overlap: int = 20
+    document_extensions: List[str] = field(default_factory=lambda: [".txt", ".md", ".pdf", ".docx"])
+    recursive_documents: bool = True
+    ingest_workers: int = 4
+    ingest_batch_size: int = 64
+    chunker: str = "recursive"
+    chunk_tokens: int = 200
+    chunk_overlap_tokens: int = 20
+    chunk_encoding: str = "cl100k_base"
+    
+    # Multi-representation indexing ("chunks" or "sections")
+    index_mode: str = "chunks"
+    section_summary_method: str = "extractive"
+    section_max_chars: int = 4000
+    
+    # RAPTOR summary tree (raptor_mode None, "collapsed" or "tree")
+    raptor_mode: Optional[str] = None
+    raptor_summary_method: str = "extractive"
+    raptor_branching: int = 6
+    raptor_max_levels: int = 3
+    
+    # Late-interaction (ColBERT-style) retrieval over per-token embeddings
+    late_interaction: bool = False
+    late_interaction_centroids: Optional[int] = None
+    late_interaction_nprobe: int = 4
+    late_interaction_candidates: int = 64
     
     # Model settings
     embedding_model: str = "all-MiniLM-L6-v2"
     llm_model: str = "deepseek-r1-distill-llama-70b"
     
+    # LLM call scheduling shared by every component: rate budgets (None is
+    # unlimited), per-attempt timeout, retries with jittered backoff, hedging
+    llm_scheduler: bool = True
+    llm_requests_per_minute: Optional[int] = 30
+    llm_tokens_per_minute: Optional[int] = 6000
+    llm_call_timeout: float = 30.0
+    llm_max_retries: int = 3
+    llm_hedge_after: Optional[float] = None
+    llm_expected_output_tokens: int = 512
+    
+    # HTTP connection pool shared by every LLM client in the process
+    llm_http_max_connections: int = 32
+    llm_http_max_keepalive: int = 16
+    llm_http_keepalive_expiry: float = 60.0
+    llm_http2: bool = False
+    
     # Retrieval settings
     top_k: int = 4
     rerank_threshold: float = 0.7
     
+    # Generation settings
+    context_token_budget: int = 1200
+    
+    # Corrective retrieval ("corrective" method) grade thresholds
+    crag_correct_threshold: float = 0.45
+    crag_incorrect_threshold: float = 0.25
+    crag_expanded_k: int = 12
+    
+    # Adaptive method selection ("auto" method): basic retrieval is kept when
+    # it looks confident, otherwise auto_fallback_method runs
+    auto_fallback_method: str = "rag_fusion"
+    auto_min_top_score: float = 0.5
+    auto_min_source_agreement: float = 0.5
+    auto_min_score_gap: float = 0.05
+    
     # Query transformation settings
     enable_multi_query: bool = True
     enable_rag_fusion: bool = True
     enable_decomposition: bool = True
     enable_step_back: bool = True
     enable_hyde: bool = True
+    # Generated queries at least this similar to an earlier one are dropped
+    query_dedupe_threshold: float = 0.92
+    hyde_average_with_query: bool = False
     
     # Routing settings
     enable_logical_routing: bool = True
     enable_semantic_routing: bool = True
+    logical_routing_mode: str = "local"
+    logical_routing_margin: float = 0.05
+    logical_routing_candidates: int = 8
+    
+    # Cache settings
+    index_cache_dir: Optional[str] = ".rag_cache"
+    transformation_cache: bool = True
+    transformation_cache_max_entries: int = 10000
+    
+    # Identical concurrent requests share one pipeline run
+    coalesce_requests: bool = True
+    
+    # End-to-end time budget per request in seconds (None disables). Optional
+    # stages (transformation, reranking, routing) only run while more than
+    # generation_reserve seconds remain, and are cut off before the reserve
+    request_budget: Optional[float] = 30.0
+    generation_reserve: float = 10.0
+    
+    # API admission control: requests hold cost units by method (see
+    # src/admission.py for defaults); excess requests queue, then get 429/503
+    admission_capacity: int = 8
+    admission_max_queue: int = 32
+    admission_queue_timeout: float = 10.0
+    admission_method_costs: Dict[str, int] = field(default_factory=dict)
+    
+    # Vector store settings
+    vector_store: str = "chroma"
+    vector_dtype: str = "float16"
+    vector_quantization: Optional[str] = None
+    
+    # Approximate nearest-neighbour settings (mmap vector store only)
+    ann_backend: str = "exact"
+    ann_nlist: Optional[int] = None
+    ann_nprobe: int = 8
+    ann_hnsw_m: int = 16
+    ann_ef_construction: int = 200
+    ann_ef_search: int = 64
+
+
+@dataclass
+class RequestContext:
+    """Per-request state shared between pipeline stages."""
+    query: str
+    method: str
+    top_k: int
+    retrieved: Dict[Tuple[str, int], List] = field(default_factory=dict)
+    vector_searches: int = 0
+    deadline: Optional[float] = None
+    degradations: List[Dict[str, Any]] = field(default_factory=list)
+    query_embeddings: Dict[str, np.ndarray] = field(default_factory=dict)
+    
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None without one)."""
+        return None if self.deadline is None else self.deadline - time.monotonic()
 
 
 class RAGPipeline:
     """Main RAG pipeline orchestrator."""
     
+    # Methods whose query transformation calls the LLM
+    LLM_TRANSFORMATIONS = ("multi_query", "rag_fusion", "decomposition", "step_back", "hyde")
+    
+    # Components are built on first use (or by warm_up) in this order
+    COMPONENTS = {
+        "llm": "_build_llm",
+        "indexer": "_build_indexer",
+        "retriever": "_build_retriever",
+        "query_transformer": "_build_query_transformer",
+        "document_reranker": "_build_document_reranker",
+        "response_generator": "_build_response_generator",
+        "logical_router": "_build_logical_router",
+        "semantic_router": "_build_semantic_router",
+        "relevance_grader": "_build_relevance_grader",
+    }
+    
     def __init__(self, config: PipelineConfig):
         """Initialize the pipeline with configuration."""
         self.config = config
+        self._component_locks = {name: threading.Lock() for name in self.COMPONENTS}
+        self._component_status: Dict[str, str] = {}
+        self.single_flight = SingleFlight()
+        self.llm_scheduler = LLMScheduler(
+            requests_per_minute=config.llm_requests_per_minute,
+            tokens_per_minute=config.llm_tokens_per_minute,
+            call_timeout=config.llm_call_timeout,
+            max_retries=config.llm_max_retries,
+            hedge_after=config.llm_hedge_after,
+            expected_output_tokens=config.llm_expected_output_tokens
+        )
+        self.http_pool = shared_pool(
+            max_connections=config.llm_http_max_connections,
+            max_keepalive_connections=config.llm_http_max_keepalive,
+            keepalive_expiry=config.llm_http_keepalive_expiry,
+            http2=config.llm_http2
+        )
         self._setup_environment()
-        self._initialize_components()
+    
+    def __getattr__(self, name: str):
+        """Build pipeline components on first use."""
+        builder = self.COMPONENTS.get(name)
+        if builder is None or "_component_locks" not in self.__dict__:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        
+        with self._component_locks[name]:
+            if name not in self.__dict__:
+                self._component_status[name] = "loading"
+                try:
+                    component = getattr(self, builder)()
+                except Exception as e:
+                    self._component_status[name] = f"failed: {e}"
+                    raise
+                self.__dict__[name] = component
+                self._component_status[name] = "ready" if component is not None else "unavailable"
+        return self.__dict__[name]
     
     def _setup_environment(self):
         """Set up environment variables."""
@@ -69,54 +242,255 @@ class RAGPipeline:
         if self.config.gemini_api_key:
             os.environ["GEMINI_API_KEY"] = self.config.gemini_api_key
     
-    def _initialize_components(self):
-        """Initialize all pipeline components."""
-        # Initialize LLM
-        self.llm = ChatGroq(
+    def warm_up(self, components: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        Build components ahead of the first request.
+        
+        Args:
+            components: Component names to build (all enabled components by default)
+            
+        Returns:
+            Component readiness after warm-up
+        """
+        for name in components or self.COMPONENTS:
+            if self._component_enabled(name):
+                try:
+                    getattr(self, name)
+                except Exception as e:
+                    print(f"Warning: Could not warm up {name}: {e}")
+        return self.component_status()
+    
+    def preload(self) -> Dict[str, str]:
+        """
+        Load read-only state worth sharing with forked workers, building nothing.
+        
+        Loads the embedding model weights and, for the mmap vector store, maps
+        an index that is already up to date with the corpus (plus its saved
+        ANN structure) so the retriever is ready. Nothing is embedded: a
+        missing or stale index, a Chroma store, or RAPTOR/late-interaction
+        structures are built lazily after fork, or ahead of time with
+        ``--build-index``.
+        
+        Returns:
+            Component readiness after preloading
+        """
+        try:
+            self.indexer.embeddings  # Weights only; no inference runs
+            if (
+                not self.config.raptor_mode
+                and not self.config.late_interaction
+                and self.indexer.load_vectorstore() is not None
+            ):
+                self.retriever = DocumentRetriever(self.indexer.get_retriever(k=self.config.top_k))
+        except Exception as e:
+            print(f"Warning: Could not preload the index: {e}")
+        return self.component_status()
+    
+    def component_status(self) -> Dict[str, str]:
+        """Report the readiness of each component without building any."""
+        status = {}
+        for name in self.COMPONENTS:
+            if not self._component_enabled(name):
+                status[name] = "disabled"
+            elif name in self.__dict__ and name not in self._component_status:
+                status[name] = "ready"  # Assigned directly rather than built
+            else:
+                status[name] = self._component_status.get(name, "not_loaded")
+        return status
+    
+    def _component_enabled(self, name: str) -> bool:
+        """Check whether an optional component is switched on."""
+        if name == "logical_router":
+            return self.config.enable_logical_routing
+        if name == "semantic_router":
+            return self.config.enable_semantic_routing
+        return True
+    
+    def _build_llm(self):
+        """Create the chat model on the shared connection pool, routed through the LLM scheduler."""
+        if not self.config.llm_scheduler:
+            return ChatGroq(
+                model=self.config.llm_model,
+                temperature=0,
+                max_tokens=None,
+                reasoning_format="parsed",
+                timeout=None,
+                max_retries=2,
+                http_client=self.http_pool.sync_client,
+                http_async_client=self.http_pool.async_client
+            )
+        
+        # The scheduler owns retries; the client timeout frees abandoned attempts
+        llm = ChatGroq(
             model=self.config.llm_model,
             temperature=0,
             max_tokens=None,
             reasoning_format="parsed",
-            timeout=None,
-            max_retries=2
+            timeout=self.config.llm_call_timeout,
+            max_retries=0,
+            http_client=self.http_pool.sync_client,
+            http_async_client=self.http_pool.async_client
         )
-        
-        # Initialize components
-        self.indexer = DocumentIndexer(
+        return ScheduledLLM(llm, self.llm_scheduler)
+    
+    def _build_indexer(self) -> DocumentIndexer:
+        """Create the document indexer (its embedding model loads on first use)."""
+        return DocumentIndexer(
             documents_path=self.config.documents_path,
             chunk_size=self.config.chunk_size,
             chunk_overlap=self.config.chunk_overlap,
-            embedding_model=self.config.embedding_model
+            embedding_model=self.config.embedding_model,
+            cache_dir=self.config.index_cache_dir,
+            vector_store=self.config.vector_store,
+            vector_dtype=self.config.vector_dtype,
+            vector_quantization=self.config.vector_quantization,
+            ann_backend=self.config.ann_backend,
+            ann_params=self._ann_params(),
+            document_extensions=self.config.document_extensions,
+            recursive=self.config.recursive_documents,
+            ingest_workers=self.config.ingest_workers,
+            ingest_batch_size=self.config.ingest_batch_size,
+            chunker=self.config.chunker,
+            chunk_tokens=self.config.chunk_tokens,
+            chunk_overlap_tokens=self.config.chunk_overlap_tokens,
+            chunk_encoding=self.config.chunk_encoding,
+            index_mode=self.config.index_mode,
+            summarizer=self._section_summarizer(),
+            section_max_chars=self.config.section_max_chars,
+            raptor_mode=self.config.raptor_mode,
+            raptor_branching=self.config.raptor_branching,
+            raptor_max_levels=self.config.raptor_max_levels,
+            raptor_summarizer=self._raptor_summarizer(),
+            late_interaction=self.config.late_interaction,
+            late_interaction_params={
+                "n_centroids": self.config.late_interaction_centroids,
+                "nprobe": self.config.late_interaction_nprobe,
+                "candidates": self.config.late_interaction_candidates
+            }
         )
-        
-        self.query_transformer = QueryTransformer(self.llm)
-        self.document_reranker = DocumentReranker()
-        self.response_generator = ResponseGenerator(self.llm)
-        
-        if self.config.enable_logical_routing:
-            self.logical_router = LogicalRouter(self.llm)
-        
-        if self.config.enable_semantic_routing:
-            self.semantic_router = SemanticRouter(self.config.embedding_model)
-        
-        # Initialize retriever
-        self.retriever = None
-        self._initialize_retriever()
     
-    def _initialize_retriever(self):
-        """Initialize the document retriever."""
+    def _section_summarizer(self) -> Optional[Summarizer]:
+        """LLM summarizer for section mode, caching summaries under index_cache_dir."""
+        if self.config.index_mode != "sections" or self.config.section_summary_method != "llm":
+            return None
+        cache_dir = self.config.index_cache_dir
+        cache_path = str(Path(cache_dir) / "summaries" / "sections.json") if cache_dir else None
+        return Summarizer("llm", llm=self.llm, cache_path=cache_path)
+    
+    def _raptor_summarizer(self) -> Optional[Summarizer]:
+        """LLM summarizer for RAPTOR clusters, caching summaries under index_cache_dir."""
+        if not self.config.raptor_mode or self.config.raptor_summary_method != "llm":
+            return None
+        cache_dir = self.config.index_cache_dir
+        cache_path = str(Path(cache_dir) / "summaries" / "raptor.json") if cache_dir else None
+        return Summarizer("llm", llm=self.llm, cache_path=cache_path)
+    
+    def _ann_params(self) -> Dict[str, Any]:
+        """Collect the parameters of the configured ANN backend."""
+        if self.config.ann_backend == "ivf":
+            return {"nlist": self.config.ann_nlist, "nprobe": self.config.ann_nprobe}
+        if self.config.ann_backend == "hnsw":
+            return {
+                "m": self.config.ann_hnsw_m,
+                "ef_construction": self.config.ann_ef_construction,
+                "ef": self.config.ann_ef_search
+            }
+        return {}
+    
+    def _build_retriever(self) -> Optional[DocumentRetriever]:
+        """Build the vector store and wrap it in a retriever."""
         try:
-            vectorstore = self.indexer.create_vectorstore()
+            self.indexer.create_vectorstore()
             retriever = self.indexer.get_retriever(k=self.config.top_k)
-            self.retriever = DocumentRetriever(retriever)
+            return DocumentRetriever(retriever)
         except Exception as e:
             print(f"Warning: Could not initialize retriever: {e}")
             print("Pipeline will use mock responses")
+            return None
+    
+    def _build_query_transformer(self) -> QueryTransformer:
+        """Create the query transformer, deduplicating generated queries with the index's embeddings."""
+        return QueryTransformer(
+            self.llm,
+            cache=self._transformation_cache(),
+            # Without a retriever there are no searches to save
+            embeddings=self.indexer.embeddings if self.retriever else None,
+            dedupe_threshold=self.config.query_dedupe_threshold
+        )
+    
+    def _transformation_cache(self) -> Optional[TransformationCache]:
+        """Open the shared transformation cache under index_cache_dir, if enabled."""
+        if not self.config.transformation_cache or not self.config.index_cache_dir:
+            return None
+        try:
+            return TransformationCache(
+                str(Path(self.config.index_cache_dir) / "transformations.sqlite"),
+                max_entries=self.config.transformation_cache_max_entries
+            )
+        except Exception as e:
+            print(f"Warning: Could not open transformation cache: {e}")
+            return None
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Statistics of caches whose components are already built."""
+        stats = {}
+        transformer = self.__dict__.get("query_transformer")
+        if transformer is not None and getattr(transformer, "cache", None) is not None:
+            stats["transformations"] = transformer.cache.stats()
+        return stats
+    
+    def _build_document_reranker(self) -> DocumentReranker:
+        """Create the document reranker."""
+        return DocumentReranker()
+    
+    def _build_response_generator(self) -> ResponseGenerator:
+        """Create the response generator."""
+        return ResponseGenerator(
+            self.llm,
+            context_builder=ContextBuilder(self.config.context_token_budget)
+        )
+    
+    def _build_logical_router(self) -> LogicalRouter:
+        """Create the logical router and load routes from the corpus manifest."""
+        logical_router = LogicalRouter(
+            self.llm,
+            embeddings=self.indexer.embeddings,
+            mode=self.config.logical_routing_mode,
+            margin_threshold=self.config.logical_routing_margin,
+            max_candidates=self.config.logical_routing_candidates
+        )
+        
+        # Routes come from the vector store, so let the retriever build it first
+        if self.retriever is not None:
+            try:
+                logical_router.set_routes(*self.indexer.build_routing_targets())
+            except Exception as e:
+                print(f"Warning: Could not build routing targets: {e}")
+                print("Logical routing will run without a corpus manifest")
+        return logical_router
+    
+    def _build_semantic_router(self) -> SemanticRouter:
+        """Create the semantic router, sharing the indexer's embedding model."""
+        return SemanticRouter(
+            self.config.embedding_model,
+            embeddings=self.indexer.embeddings
+        )
+    
+    def _build_relevance_grader(self) -> RelevanceGrader:
+        """Create the corrective-retrieval grader, sharing the indexer's embedding model."""
+        return RelevanceGrader(
+            self.indexer.embeddings,
+            correct_threshold=self.config.crag_correct_threshold,
+            incorrect_threshold=self.config.crag_incorrect_threshold
+        )
     
     def run_pipeline(self, query: str, config_override: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Run the complete RAG pipeline.
         
+        Concurrent calls with the same normalized query and overrides share a
+        single run when coalesce_requests is enabled.
+        
         Args:
             query: User query string
             config_override: Optional configuration overrides
@@ -124,7 +498,30 @@ class RAGPipeline:
         Returns:
             Dictionary containing pipeline results and metadata
         """
+        if not self.config.coalesce_requests:
+            return self._run_pipeline(query, config_override)
+        
+        key = self.coalescing_key(query, config_override)
+        results, shared = self.single_flight.do(key, lambda: self._run_pipeline(query, config_override))
+        return self.shared_result(results, query) if shared else results
+    
+    @staticmethod
+    def coalescing_key(query: str, config_override: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+        """Key under which identical concurrent requests share one pipeline run."""
+        return normalize_question(query), json.dumps(config_override or {}, sort_keys=True, default=str)
+    
+    @staticmethod
+    def shared_result(results: Dict[str, Any], query: str) -> Dict[str, Any]:
+        """Copy of another request's results, labelled with the query this request sent."""
+        results = copy.deepcopy(results)
+        results["query"] = query
+        results["metadata"]["coalesced"] = True
+        return results
+    
+    def _run_pipeline(self, query: str, config_override: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run every pipeline stage for one request."""
         start_time = time.time()
+        context = None
         results = {
             "query": query,
             "timestamp": start_time,
@@ -140,14 +537,45 @@ class RAGPipeline:
             else:
                 method = "basic"  # Default to basic retrieval
             
-            transformed_queries = self._transform_query(query, method)
+            budget = (config_override or {}).get("request_budget", self.config.request_budget)
+            context = RequestContext(
+                query=query,
+                method=method,
+                top_k=self.config.top_k,
+                deadline=time.monotonic() + budget if budget else None
+            )
+            if method == "auto":
+                method, selection = self._select_method(query, context)
+                context.method = method
+                results["pipeline_stages"]["method_selection"] = selection
+            
+            transformed_queries, hyde_vector = [query], None
+            if method in self.LLM_TRANSFORMATIONS:
+                transformed = self._run_optional(
+                    context, "query_transformation", lambda: self._transform_for_retrieval(query, method)
+                )
+                if transformed is None:
+                    # Out of time: fall back to basic retrieval and generation
+                    method = context.method = "basic"
+                else:
+                    transformed_queries, hyde_vector = transformed
+            selection = results["pipeline_stages"].get("method_selection", {})
+            if selection.get("escalated") and method in ("multi_query", "rag_fusion") and query not in transformed_queries:
+                # The basic retrieval already ran, so keep it in the union for free
+                transformed_queries = [query] + transformed_queries
             results["pipeline_stages"]["query_transformation"] = {
                 "method": method,
                 "transformed_queries": transformed_queries
             }
             
             # Stage 2: Retrieval
-            retrieved_docs = self._retrieve_documents(transformed_queries)
+            if method == "corrective" and self.retriever:
+                retrieved_docs, correction = self._corrective_retrieve(query, context)
+                results["pipeline_stages"]["correction"] = correction
+            elif hyde_vector is not None:
+                retrieved_docs = self._retrieve_by_vector(hyde_vector, transformed_queries[0], context)
+            else:
+                retrieved_docs = self._retrieve_documents(transformed_queries, context)
             results["pipeline_stages"]["retrieval"] = {
                 "num_documents": len(retrieved_docs),
                 "documents": [doc.page_content[:100] + "..." for doc in retrieved_docs]
@@ -155,35 +583,125 @@ class RAGPipeline:
             
             # Stage 3: Reranking (if applicable)
             if method in ["rag_fusion", "multi_query"] and len(retrieved_docs) > 1:
-                reranked_docs = self._rerank_documents(retrieved_docs, method)
-                results["pipeline_stages"]["reranking"] = {
-                    "method": method,
-                    "num_documents": len(reranked_docs)
-                }
-                retrieved_docs = reranked_docs
+                reranked_docs = self._run_optional(
+                    context, "reranking", lambda: self._rerank_documents(retrieved_docs, method)
+                )
+                if reranked_docs is not None:
+                    results["pipeline_stages"]["reranking"] = {
+                        "method": method,
+                        "num_documents": len(reranked_docs)
+                    }
+                    retrieved_docs = reranked_docs
             
             # Stage 4: Routing (if enabled)
-            routing_info = self._route_query(query)
+            routing_info = self._run_optional(context, "routing", lambda: self._route_query(query, context))
             if routing_info:
                 results["pipeline_stages"]["routing"] = routing_info
             
-            # Stage 5: Generation
-            if method == "decomposition":
-                final_answer = self._generate_decomposed_response(query, transformed_queries)
-            elif method == "step_back":
-                final_answer = self._generate_step_back_response(query, transformed_queries)
-            else:
-                final_answer = self._generate_response(query, retrieved_docs)
+            # Stage 5: Generation (always runs, within the full budget)
+            with deadline_scope(context.deadline):
+                if method == "decomposition":
+                    # Sub-answers are optional work; without them answer the question directly
+                    final_answer = self._run_optional(
+                        context,
+                        "decomposed_generation",
+                        lambda: self._generate_decomposed_response(query, transformed_queries, context)
+                    )
+                    if final_answer is None:
+                        final_answer = self._generate_response(query, self._retrieve_once(query, context))
+                elif method == "step_back":
+                    final_answer = self._generate_step_back_response(query, transformed_queries, context)
+                else:
+                    final_answer = self._generate_response(query, retrieved_docs)
             
             results["final_answer"] = final_answer
+            results["metadata"]["vector_searches"] = context.vector_searches
             
         except Exception as e:
             results["error"] = str(e)
             results["final_answer"] = f"Error processing query: {str(e)}"
         
+        if context is not None and context.degradations:
+            results["pipeline_stages"]["degradation"] = context.degradations
+        if context is not None and context.deadline is not None:
+            results["metadata"]["time_remaining"] = round(context.remaining(), 3)
         results["execution_time"] = time.time() - start_time
         return results
     
+    def _run_optional(self, context: RequestContext, stage: str, func: Callable[[], Any]) -> Any:
+        """
+        Run an optional stage if the request has time for it.
+        
+        The stage is skipped when no more than generation_reserve seconds
+        remain, and LLM calls inside it are cut off before the reserve, so the
+        answer can always be generated. Skips and cancellations are recorded
+        in the request context.
+        
+        Returns:
+            The stage's result, or None when it was skipped or cancelled
+        """
+        reserve = self.config.generation_reserve
+        remaining = context.remaining()
+        if remaining is not None and remaining <= reserve:
+            context.degradations.append({
+                "stage": stage,
+                "action": "skipped",
+                "reason": f"{max(remaining, 0.0):.1f}s left, {reserve:.1f}s reserved for generation"
+            })
+            return None
+        
+        try:
+            with deadline_scope(context.deadline - reserve if context.deadline is not None else None):
+                return func()
+        except LLMTimeout as e:
+            context.degradations.append({"stage": stage, "action": "cancelled", "reason": str(e)})
+            return None
+    
+    def _select_method(self, query: str, context: RequestContext) -> Tuple[str, Dict[str, Any]]:
+        """
+        Pick basic retrieval when it looks confident, else the fallback method.
+        
+        The basic retrieval is kept in the request context, so the basic path
+        makes no extra searches and no LLM calls.
+        
+        Returns:
+            Tuple of (chosen method, selection details for the response)
+        """
+        if not self.retriever:
+            return "basic", {"method": "basic", "escalated": False, "reason": "retriever unavailable"}
+        
+        docs = self._retrieve_once(query, context)
+        grades = self.relevance_grader.grade(query, docs, self._embed_query(query, context))
+        confidence = retrieval_confidence(docs, grades)
+        reasons = []
+        if confidence["top_score"] < self.config.auto_min_top_score:
+            reasons.append("low top score")
+        if (
+            confidence["source_agreement"] < self.config.auto_min_source_agreement
+            and confidence["score_gap"] < self.config.auto_min_score_gap
+        ):
+            reasons.append("results split across sources")
+        
+        method = self.config.auto_fallback_method if reasons else "basic"
+        return method, {
+            "method": method,
+            "escalated": bool(reasons),
+            "reason": ", ".join(reasons) or "confident basic retrieval",
+            "confidence": confidence
+        }
+    
+    def _transform_for_retrieval(self, query: str, method: str) -> Tuple[List[str], Optional[np.ndarray]]:
+        """Transform the query, returning the queries and, for HyDE, the vector to search with."""
+        if method == "hyde" and self.retriever:
+            passage, vector = self.query_transformer.hyde_embedding(
+                query,
+                self.indexer.embeddings,
+                self.config.embedding_model,
+                self.config.hyde_average_with_query
+            )
+            return [passage], vector
+        return self._transform_query(query, method), None
+    
     def _transform_query(self, query: str, method: str) -> List[str]:
         """Transform query based on selected method."""
         if method == "multi_query":
@@ -199,19 +717,92 @@ class RAGPipeline:
         else:
             return [query]  # Basic retrieval
     
-    def _retrieve_documents(self, queries: List[str]) -> List:
+    def _retrieve_documents(self, queries: List[str], context: RequestContext) -> List:
         """Retrieve documents for given queries."""
         if not self.retriever:
             # Return mock documents if retriever not available
             return [type('Document', (), {'page_content': 'Mock document content'})()]
         
         if len(queries) == 1:
-            return self.retriever.retrieve_documents(queries[0], self.config.top_k)
+            return self._retrieve_once(queries[0], context)
         else:
             # For multiple queries, get union of results
-            all_docs = self.retriever.retrieve_multiple_queries(queries, self.config.top_k)
+            all_docs = [self._retrieve_once(q, context) for q in queries]
             return self.document_reranker.get_unique_union(all_docs)
     
+    def _retrieve_once(self, query: str, context: RequestContext) -> List:
+        """Retrieve documents for a query, reusing earlier results in this request."""
+        key = (query, context.top_k)
+        if key not in context.retrieved:
+            docs = None
+            if query == context.query and self._reuses_query_vector(context):
+                # Routing or grading needs this vector too, so embed once and search with it
+                docs = self.retriever.retrieve_by_vector(self._embed_query(query, context), context.top_k)
+            if docs is None:
+                docs = self.retriever.retrieve_documents(query, context.top_k)
+            context.retrieved[key] = docs
+            context.vector_searches += 1
+        return context.retrieved[key]
+    
+    def _reuses_query_vector(self, context: RequestContext) -> bool:
+        """Whether a stage after retrieval embeds the user's query."""
+        return (
+            self.config.enable_logical_routing
+            or self.config.enable_semantic_routing
+            or context.method in ("corrective", "auto")
+        )
+    
+    def _embed_query(self, text: str, context: RequestContext) -> np.ndarray:
+        """Embed a query once per request; retrieval, routing and grading share the vector."""
+        if text not in context.query_embeddings:
+            context.query_embeddings[text] = np.asarray(self.indexer.embeddings.embed_query(text), dtype=np.float32)
+        return context.query_embeddings[text]
+    
+    def _retrieve_by_vector(self, embedding, text: str, context: RequestContext) -> List:
+        """Search with a precomputed embedding, falling back to embedding ``text``."""
+        key = (text, context.top_k)
+        if key not in context.retrieved:
+            docs = self.retriever.retrieve_by_vector(embedding, context.top_k)
+            if docs is None:
+                return self._retrieve_once(text, context)
+            context.retrieved[key] = docs
+            context.vector_searches += 1
+        return context.retrieved[key]
+    
+    def _corrective_retrieve(self, query: str, context: RequestContext) -> Tuple[List, Dict[str, Any]]:
+        """
+        Retrieve, grade the chunks locally, and escalate only when grades are low.
+        
+        Returns:
+            Tuple of (selected documents, correction details for the response)
+        """
+        grader = self.relevance_grader
+        docs = list(self._retrieve_once(query, context))
+        query_embedding = self._embed_query(query, context)
+        grades = grader.grade(query, docs, query_embedding)
+        action = grader.action(grades)
+        correction: Dict[str, Any] = {"action": action, "initial_grades": [round(float(g), 3) for g in grades]}
+        
+        if action == AMBIGUOUS:
+            # Widen the candidate set for the same query; no LLM call needed
+            wider = [doc for doc, _ in self.retriever.retrieve_with_scores(query, k=self.config.crag_expanded_k)]
+            context.vector_searches += 1
+            docs += wider
+            grades = np.concatenate([grades, grader.grade(query, wider, query_embedding)])
+        elif action == INCORRECT:
+            rewritten = self._run_optional(context, "query_rewrite", lambda: self.query_transformer.rewrite_query(query))
+            correction["rewritten_query"] = rewritten
+            if rewritten and rewritten != query:
+                rewritten_docs = list(self._retrieve_once(rewritten, context))
+                docs += rewritten_docs
+                # Grade against the original question, which is what gets answered
+                grades = np.concatenate([grades, grader.grade(query, rewritten_docs, query_embedding)])
+        
+        selected, selected_grades = grader.select(docs, grades, context.top_k)
+        correction["grades"] = [round(g, 3) for g in selected_grades]
+        correction["final_action"] = grader.action(np.asarray(selected_grades))
+        return selected, correction
+    
     def _rerank_documents(self, docs: List, method: str) -> List:
         """Rerank documents using appropriate method."""
         if method == "rag_fusion":
@@ -220,22 +811,30 @@ class RAGPipeline:
             return docs
         return docs
     
-    def _route_query(self, query: str) -> Optional[Dict[str, Any]]:
+    def _route_query(self, query: str, context: RequestContext) -> Optional[Dict[str, Any]]:
         """Route query using available routing methods."""
         routing_info = {}
+        query_embedding = None
         
-        if self.config.enable_logical_routing and hasattr(self, 'logical_router'):
+        if self.config.enable_logical_routing or self.config.enable_semantic_routing:
             try:
-                logical_result = self.logical_router.route_query(query)
-                routing_info["logical_routing"] = {
-                    "file_name": logical_result.file_name
-                }
+                # Usually already embedded for retrieval; shared by both routers
+                query_embedding = self._embed_query(query, context)
+            except Exception as e:
+                print(f"Warning: Could not embed query for routing: {e}")
+        
+        if self.config.enable_logical_routing:
+            try:
+                routing_info["logical_routing"] = self.logical_router.route_with_details(query, query_embedding)
+            except LLMTimeout as e:
+                # Out of time rather than broken: recorded like other cancelled stages
+                context.degradations.append({"stage": "logical_routing", "action": "cancelled", "reason": str(e)})
             except Exception as e:
                 routing_info["logical_routing"] = {"error": str(e)}
         
-        if self.config.enable_semantic_routing and hasattr(self, 'semantic_router'):
+        if self.config.enable_semantic_routing:
             try:
-                semantic_result = self.semantic_router.route_query(query)
+                semantic_result = self.semantic_router.route_query(query, query_embedding)
                 routing_info["semantic_routing"] = semantic_result
             except Exception as e:
                 routing_info["semantic_routing"] = {"error": str(e)}
@@ -249,26 +848,26 @@ class RAGPipeline:
         
         return self.response_generator.generate_response_from_docs(docs, query)
     
-    def _generate_decomposed_response(self, query: str, sub_questions: List[str]) -> str:
+    def _generate_decomposed_response(self, query: str, sub_questions: List[str], context: RequestContext) -> str:
         """Generate response using decomposition method."""
         if not self.retriever:
             return "Mock decomposed response: This is a placeholder response."
         
         sub_answers = []
         for sub_q in sub_questions:
-            docs = self.retriever.retrieve_documents(sub_q, self.config.top_k)
+            docs = self._retrieve_once(sub_q, context)
             answer = self.response_generator.generate_response_from_docs(docs, sub_q)
             sub_answers.append(answer)
         
         return self.response_generator.generate_decomposed_response(sub_questions, sub_answers, query)
     
-    def _generate_step_back_response(self, query: str, step_back_queries: List[str]) -> str:
+    def _generate_step_back_response(self, query: str, step_back_queries: List[str], context: RequestContext) -> str:
         """Generate response using step-back method."""
         if not self.retriever:
             return "Mock step-back response: This is a placeholder response."
         
-        normal_docs = self.retriever.retrieve_documents(query, self.config.top_k)
-        step_back_docs = self.retriever.retrieve_documents(step_back_queries[0], self.config.top_k)
+        normal_docs = self._retrieve_once(query, context)
+        step_back_docs = self._retrieve_once(step_back_queries[0], context)
         
         return self.response_generator.generate_step_back_response(normal_docs, step_back_docs, query)
 
@@ -5,76 +5,222 @@ Implements various query transformation techniques including multi-query generat
 RAG-Fusion, decomposition, step-back prompting, and HyDE.
 """
 
-from typing import List, Dict, Any
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import FewShotChatMessagePromptTemplate
-from langchain.load import dumps, loads
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.documents import Document
+from __future__ import annotations
+
+import functools
+import inspect
+import json
+import logging
+import re
+from typing import TYPE_CHECKING, Iterable, List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from .lazy_imports import LazyImport
+from .transform_cache import TransformationCache, normalize_question
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+dumps = LazyImport("langchain_core.load", "dumps")
+ChatPromptTemplate = LazyImport("langchain_core.prompts", "ChatPromptTemplate")
+StrOutputParser = LazyImport("langchain_core.output_parsers", "StrOutputParser")
+FewShotChatMessagePromptTemplate = LazyImport("langchain_core.prompts", "FewShotChatMessagePromptTemplate")
+
+logger = logging.getLogger(__name__)
+
+
+# Bullets, numbering and labels LLMs put in front of list items
+LIST_MARKER = re.compile(
+    r"^\s*(?:[-*\u2022>]+\s*|\(?\d{1,2}[.):\]]\s*|(?:sub-?)?(?:query|question)\s*\d*\s*[:.)-]\s*)",
+    re.IGNORECASE
+)
+
+
+class QueryList(BaseModel):
+    """Search queries generated from a user question."""
+    queries: List[str] = Field(..., description="Self-contained search queries, one per item")
+
+
+def parse_query_list(lines: Iterable[str]) -> List[str]:
+    """
+    Clean LLM list output into distinct queries.
+    
+    Blank lines, bullets and numbering, surrounding quotes or bold markers,
+    preamble lines ("Here are five queries:") and queries differing only in
+    case or whitespace are dropped.
+    """
+    queries, seen = [], set()
+    for line in lines:
+        query = LIST_MARKER.sub("", line).strip().strip("\"'`*").strip()
+        key = normalize_question(query)
+        if not query or query.endswith(":") or key in seen:
+            continue
+        seen.add(key)
+        queries.append(query)
+    return queries
+
+
+def drop_near_duplicates(queries: List[str], embeddings, threshold: float) -> List[str]:
+    """Keep queries whose embedding is below ``threshold`` cosine similarity to every earlier one."""
+    if embeddings is None or len(queries) < 2:
+        return queries
+    vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1.0, norms)
+    kept: List[int] = []
+    for i in range(len(queries)):
+        if not kept or float(np.max(vectors[kept] @ vectors[i])) < threshold:
+            kept.append(i)
+    return [queries[i] for i in kept]
+
+
+def cached_transformation(method: str):
+    """Serve a transformation from the transformer's cache when one is configured."""
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        @functools.wraps(func)
+        def wrapper(self, question: str, *args, **kwargs):
+            if self.cache is None:
+                return func(self, question, *args, **kwargs)
+            # Options such as num_queries change the output, so they are part of the key
+            bound = signature.bind(self, question, *args, **kwargs)
+            bound.apply_defaults()
+            options = {name: value for name, value in bound.arguments.items() if name not in ("self", "question")}
+            key = f"{method}:{json.dumps(options, sort_keys=True)}" if options else method
+            version = self.PROMPT_VERSIONS[method]
+            cached = self.cache.get(key, question, self.model_name, version)
+            if cached is not None:
+                return cached
+            result = func(self, question, *args, **kwargs)
+            self.cache.put(key, question, self.model_name, version, result)
+            return result
+        return wrapper
+    return decorator
 
 
 class QueryTransformer:
     """Handles various query transformation techniques."""
     
-    def __init__(self, llm):
-        """Initialize with an LLM instance."""
+    # Bump a method's version when its prompt changes to invalidate cached outputs
+    PROMPT_VERSIONS = {
+        "multi_query": 2,
+        "rag_fusion": 2,
+        "decomposition": 2,
+        "step_back": 1,
+        "hyde": 1,
+        "rewrite": 1,
+    }
+    
+    # Consecutive structured-output failures after which text parsing is used for good
+    MAX_STRUCTURED_FAILURES = 3
+    
+    def __init__(
+        self,
+        llm,
+        cache: Optional[TransformationCache] = None,
+        embeddings=None,
+        dedupe_threshold: float = 0.92
+    ):
+        """
+        Initialize with an LLM instance.
+        
+        Args:
+            llm: Chat model used for transformations
+            cache: Persistent cache of transformation outputs (disabled when None)
+            embeddings: Local embedding model used to drop near-identical
+                generated queries (skipped when None)
+            dedupe_threshold: Cosine similarity at which two generated queries
+                count as the same search
+        """
         self.llm = llm
+        self.cache = cache
+        self.embeddings = embeddings
+        self.dedupe_threshold = dedupe_threshold
+        # None until the first list transformation shows whether the backend
+        # supports structured output
+        self.structured_output: Optional[bool] = None
+        self._structured_failures = 0
+        
+    @property
+    def model_name(self) -> str:
+        return str(getattr(self.llm, "model_name", None) or getattr(self.llm, "model", ""))
     
+    @cached_transformation("multi_query")
     def multi_query_generation(self, question: str, num_queries: int = 5) -> List[str]:
         """Generate multiple versions of a query."""
-        template = """You are an AI language model assistant. Your task is to generate five 
+        template = """You are an AI language model assistant. Your task is to generate {count} 
 different versions of the given user question to retrieve relevant documents from a vector 
 database. By generating multiple perspectives on the user question, your goal is to help
 the user overcome some of the limitations of the distance-based similarity search. 
 Provide these alternative questions separated by newlines. Original question: {question}"""
         
-        prompt = ChatPromptTemplate.from_template(template)
-        
-        generate_queries = (
-            prompt 
-            | self.llm
-            | StrOutputParser() 
-            | (lambda x: x.split("\n"))
-        )
-        
-        return generate_queries.invoke({"question": question})
+        return self._generate_query_list(template, question, num_queries)
     
+    @cached_transformation("rag_fusion")
     def rag_fusion_generation(self, question: str, num_queries: int = 4) -> List[str]:
         """Generate queries for RAG-Fusion approach."""
         template = """You are a helpful assistant that generates multiple search queries based on a single input query. \n
 Generate multiple search queries related to: {question} \n
-Output (4 queries):"""
-        
-        prompt = ChatPromptTemplate.from_template(template)
-        
-        generate_queries = (
-            prompt 
-            | self.llm
-            | StrOutputParser() 
-            | (lambda x: x.split("\n"))
-        )
+Output ({count} queries):"""
         
-        return generate_queries.invoke({"question": question})
+        return self._generate_query_list(template, question, num_queries)
     
+    @cached_transformation("decomposition")
     def decomposition(self, question: str, num_subquestions: int = 3) -> List[str]:
         """Decompose complex questions into sub-questions."""
         template = """You are a helpful assistant that generates multiple sub-questions related to an input question. \n
 The goal is to break down the input into a set of sub-problems / sub-questions that can be answers in isolation. \n
 Generate multiple search queries related to: {question} \n
-Output (3 queries):"""
+Output ({count} queries):"""
         
-        prompt = ChatPromptTemplate.from_template(template)
+        return self._generate_query_list(template, question, num_subquestions)
+    
+    def _generate_query_list(self, template: str, question: str, limit: int) -> List[str]:
+        """
+        Ask for ``limit`` queries and return at most that many distinct ones.
         
-        generate_queries = (
-            prompt 
-            | self.llm
-            | StrOutputParser() 
-            | (lambda x: x.split("\n"))
-        )
+        Structured output is used when the chat model supports it; otherwise
+        (or if the model does not return the schema) the text is parsed line
+        by line. A model that has never produced the schema is switched to
+        text parsing on its first failure, one that has after
+        MAX_STRUCTURED_FAILURES consecutive failures, so a rejecting model
+        does not cost two LLM calls per request. Timeouts are raised as is.
+        """
+        prompt = ChatPromptTemplate.from_template(template)
+        variables = {"question": question, "count": limit}
+        lines = None
+        if self.structured_output is not False:
+            try:
+                result = (prompt | self.llm.with_structured_output(QueryList)).invoke(variables)
+            except (AttributeError, NotImplementedError):
+                self.structured_output = False
+            except TimeoutError:
+                # Out of time, not a schema problem; a text call would fare no better
+                raise
+            except Exception as e:
+                self._structured_failures += 1
+                if self.structured_output is None or self._structured_failures >= self.MAX_STRUCTURED_FAILURES:
+                    self.structured_output = False
+                logger.warning(
+                    "Structured query generation failed (%d in a row), parsing text instead: %s",
+                    self._structured_failures,
+                    e
+                )
+            else:
+                self.structured_output = isinstance(result, QueryList)
+                self._structured_failures = 0
+                if self.structured_output:
+                    lines = result.queries
+        if lines is None:
+            lines = (prompt | self.llm | StrOutputParser()).invoke(variables).splitlines()
         
-        return generate_queries.invoke({"question": question})
+        queries = parse_query_list(lines)
+        return drop_near_duplicates(queries, self.embeddings, self.dedupe_threshold)[:limit]
     
+    @cached_transformation("step_back")
     def step_back_prompting(self, question: str) -> str:
         """Generate step-back questions using few-shot examples."""
         examples = [
@@ -109,6 +255,7 @@ Output (3 queries):"""
         generate_step_back = prompt | self.llm | StrOutputParser()
         return generate_step_back.invoke({"question": question})
     
+    @cached_transformation("hyde")
     def hyde_generation(self, question: str) -> str:
         """Generate hypothetical document for HyDE approach."""
         template = """Please write a scientific paper passage to answer the question
@@ -124,32 +271,110 @@ Passage:"""
         )
         
         return generate_docs.invoke({"question": question})
+    
+    def hyde_embedding(
+        self,
+        question: str,
+        embeddings,
+        embedding_model: str,
+        average_with_query: bool = False
+    ) -> Tuple[str, np.ndarray]:
+        """
+        Generate the HyDE passage and embed it, caching the vector by question.
+        
+        A cache hit skips both the LLM call and embedding the passage, so the
+        request goes straight to vector search.
+        
+        Args:
+            question: User question
+            embeddings: Embedding model used by the index
+            embedding_model: Name of that model (part of the cache key)
+            average_with_query: Average the unit passage and question vectors
+                so a passage that drifts off topic is pulled back to the question
+            
+        Returns:
+            Tuple of (generated passage, float32 query vector)
+        """
+        model = f"{self.model_name}|{embedding_model}|{'averaged' if average_with_query else 'passage'}"
+        version = self.PROMPT_VERSIONS["hyde"]
+        if self.cache is not None:
+            cached = self.cache.get_embedding("hyde", question, model, version)
+            if cached is not None:
+                return cached
+        
+        passage = self.hyde_generation(question)
+        vector = np.asarray(embeddings.embed_query(passage), dtype=np.float32)
+        if average_with_query:
+            views = [vector, np.asarray(embeddings.embed_query(question), dtype=np.float32)]
+            vector = np.mean([view / (np.linalg.norm(view) or 1.0) for view in views], axis=0)
+        if self.cache is not None:
+            self.cache.put_embedding("hyde", question, model, version, passage, vector)
+        return passage, vector
+    
+    @cached_transformation("rewrite")
+    def rewrite_query(self, question: str) -> str:
+        """Rewrite a question that retrieved nothing relevant into a better search query."""
+        template = """You rewrite questions about Uptiq's HR policies into search queries for a vector 
+database. The original question did not retrieve relevant policy text. Rewrite it using the 
+terms an HR policy document would use, keeping its meaning. Reply with the rewritten query only.
+Question: {question}
+Rewritten query:"""
+        
+        prompt = ChatPromptTemplate.from_template(template)
+        
+        rewrite = (
+            prompt 
+            | self.llm
+            | StrOutputParser() 
+        )
+        
+        return rewrite.invoke({"question": question}).strip()
 
 
 class DocumentReranker:
     """Handles document reranking using Reciprocal Rank Fusion."""
     
     @staticmethod
-    def reciprocal_rank_fusion(results: List[List[Document]], k: int = 60) -> List[tuple]:
-        """Apply Reciprocal Rank Fusion to combine multiple ranked lists."""
-        fused_scores = {}
+    def _doc_key(doc: Document) -> str:
+        """Identity of a chunk, ignoring the query-specific score retrievers attach."""
+        metadata = getattr(doc, "metadata", None)
+        if isinstance(metadata, dict) and "score" in metadata:
+            doc = doc.model_copy(update={"metadata": {k: v for k, v in metadata.items() if k != "score"}})
+        return dumps(doc)
+    
+    @staticmethod
+    def _fuse(results: List[List[Document]], k: int) -> List[Tuple[Document, float]]:
+        """RRF scores, best first; ties keep the order documents were first seen."""
+        fused_scores: Dict[str, float] = {}
+        first_seen: Dict[str, Document] = {}
         
         for docs in results:
             for rank, doc in enumerate(docs):
-                doc_str = dumps(doc)
-                if doc_str not in fused_scores:
-                    fused_scores[doc_str] = 0
-                fused_scores[doc_str] += 1 / (rank + k)
-        
-        reranked_results = [
-            (loads(doc), score)
-            for doc, score in sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
-        ]
-        return reranked_results
+                key = DocumentReranker._doc_key(doc)
+                fused_scores[key] = fused_scores.get(key, 0.0) + 1 / (rank + k)
+                first_seen.setdefault(key, doc)
+        
+        # sorted() is stable and dicts keep insertion order
+        return [(first_seen[key], fused_scores[key]) for key in sorted(fused_scores, key=fused_scores.get, reverse=True)]
+    
+    @staticmethod
+    def reciprocal_rank_fusion(results: List[List[Document]], k: int = 60) -> List[tuple]:
+        """Apply Reciprocal Rank Fusion to combine multiple ranked lists."""
+        return DocumentReranker._fuse(results, k)
     
     @staticmethod
-    def get_unique_union(documents: List[List[Document]]) -> List[Document]:
-        """Get unique union of retrieved documents."""
-        flattened_docs = [dumps(doc) for sublist in documents for doc in sublist]
-        unique_docs = list(set(flattened_docs))
-        return [loads(doc) for doc in unique_docs]
+    def get_unique_union(documents: List[List[Document]], k: int = 60) -> List[Document]:
+        """
+        Get the unique union of retrieved documents, most relevant first.
+        
+        Documents are ordered by their reciprocal rank fusion score, and the
+        score replaces the per-query ``metadata["score"]`` so the context
+        builder keeps the best chunks when the token budget runs out.
+        """
+        union = []
+        for doc, score in DocumentReranker._fuse(documents, k):
+            metadata = getattr(doc, "metadata", None)
+            if isinstance(metadata, dict):
+                doc = doc.model_copy(update={"metadata": {**metadata, "score": score}})
+            union.append(doc)
+        return union
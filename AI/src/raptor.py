@@ -0,0 +1,272 @@
+"""
+RAPTOR-style summary tree for RAG pipeline.
+
+Leaf chunks are clustered by embedding with spherical k-means, each cluster is
+summarized into a parent node, and the parents are clustered again until a
+level is small enough. Broad questions ("summarize all leave rules") then
+match a few summary nodes instead of many scattered leaves.
+
+Retrieval either scores every node at once ("collapsed") or walks the tree from
+the top level down ("tree"), keeping the best ``k`` nodes per level.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .ann import kmeans
+from .summarization import Summarizer
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+TREE_FORMAT_VERSION = 1
+RAPTOR_MODES = ("collapsed", "tree")
+# Above this many clusters a level is clustered in two stages
+MAX_FLAT_CLUSTERS = 64
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _group_by_assignment(assignments: np.ndarray) -> List[np.ndarray]:
+    """Split row ids into ascending groups that share an assignment."""
+    order = np.argsort(assignments, kind="stable")
+    bounds = np.flatnonzero(np.diff(assignments[order])) + 1
+    return np.split(order, bounds)
+
+
+def cluster_vectors(vectors: np.ndarray, branching: int, seed: int = 0) -> List[np.ndarray]:
+    """
+    Group unit vectors into clusters of about ``branching`` members.
+    
+    Large inputs are first split into ``sqrt(n_clusters)`` coarse clusters and
+    each is clustered separately, which keeps the cost near N * sqrt(N)
+    instead of quadratic in the number of rows.
+    
+    Returns:
+        Ascending row-id arrays, one per non-empty cluster
+    """
+    n_clusters = math.ceil(len(vectors) / branching)
+    if n_clusters <= 1:
+        return [np.arange(len(vectors))]
+        
+    if n_clusters > MAX_FLAT_CLUSTERS:
+        coarse = kmeans(vectors, math.isqrt(n_clusters), seed=seed)
+        groups = _group_by_assignment(np.argmax(vectors @ coarse.T, axis=1))
+        if len(groups) > 1:
+            return [
+                members[sub]
+                for members in groups
+                for sub in cluster_vectors(vectors[members], branching, seed)
+            ]
+            
+    centroids = kmeans(vectors, n_clusters, seed=seed)
+    return _group_by_assignment(np.argmax(vectors @ centroids.T, axis=1))
+
+
+class RaptorTree:
+    """Leaf chunks plus levels of cluster summaries, with one vector per node."""
+    
+    def __init__(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        levels: Sequence[int],
+        children: List[List[int]],
+        vectors: np.ndarray,
+        info: Optional[Dict[str, Any]] = None
+    ):
+        if not (len(texts) == len(metadatas) == len(levels) == len(children) == len(vectors)):
+            raise ValueError("RAPTOR tree node arrays have different lengths")
+        self.texts = texts
+        self.metadatas = metadatas
+        self.levels = np.asarray(levels, dtype=np.int32)
+        self.children = children
+        self.vectors = vectors
+        self.info = dict(info or {})
+        
+    def __len__(self) -> int:
+        return len(self.texts)
+        
+    @property
+    def depth(self) -> int:
+        """Number of summary levels above the leaves."""
+        return int(self.levels.max()) if len(self.levels) else 0
+        
+    @classmethod
+    def build(
+        cls,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        vectors,
+        embeddings,
+        summarizer: Summarizer,
+        branching: int = 6,
+        max_levels: int = 3,
+        seed: int = 0,
+        info: Optional[Dict[str, Any]] = None
+    ) -> "RaptorTree":
+        """
+        Build the tree bottom-up from leaf chunks and their embeddings.
+        
+        Args:
+            texts: Leaf chunk texts
+            metadatas: Leaf chunk metadata
+            vectors: Leaf chunk embeddings, one row per leaf
+            embeddings: Embedding model used to embed the summaries
+            summarizer: Summarizer for clusters; with an on-disk cache an
+                interrupted build resumes from the summaries already made
+            branching: Target number of children per summary node
+            max_levels: Maximum number of summary levels
+            seed: Random seed for clustering, so rebuilds form the same clusters
+            info: Extra values stored with the tree (e.g. a corpus fingerprint)
+        """
+        texts, metadatas = list(texts), [dict(metadata) for metadata in metadatas]
+        blocks = [_normalize(vectors).reshape(len(texts), -1)]
+        levels = [0] * len(texts)
+        children: List[List[int]] = [[] for _ in texts]
+        sources = [{os.path.basename(metadata.get("source", ""))} - {""} for metadata in metadatas]
+        
+        level_ids = np.arange(len(texts))
+        level_vectors = blocks[0]
+        for level in range(1, max_levels + 1):
+            if len(level_ids) <= branching:
+                break
+            groups = cluster_vectors(level_vectors, branching, seed)
+            if len(groups) >= len(level_ids):
+                break
+                
+            members = [level_ids[group].tolist() for group in groups]
+            summaries = summarizer.summarize_groups([[texts[i] for i in group] for group in members])
+            level_vectors = _normalize(embeddings.embed_documents(summaries))
+            
+            level_ids = np.arange(len(texts), len(texts) + len(members))
+            for summary, group in zip(summaries, members):
+                group_sources = set().union(*(sources[i] for i in group))
+                texts.append(summary)
+                metadatas.append({"raptor_level": level, "sources": ", ".join(sorted(group_sources))})
+                levels.append(level)
+                children.append(group)
+                sources.append(group_sources)
+            blocks.append(level_vectors)
+            print(f"RAPTOR level {level}: {len(members)} summaries")
+            
+        return cls(texts, metadatas, levels, children, np.concatenate(blocks), info)
+        
+    def save(self, tree_dir: str):
+        """Write the tree to ``tree_dir``; the node file is replaced last."""
+        tree_dir = Path(tree_dir)
+        tree_dir.mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        
+        tmp_vectors = tree_dir / f".{pid}.vectors.npy"
+        np.save(tmp_vectors, np.asarray(self.vectors, dtype=np.float32))
+        os.replace(tmp_vectors, tree_dir / "vectors.npy")
+        
+        tmp_nodes = tree_dir / f".{pid}.nodes.json"
+        with open(tmp_nodes, "w", encoding="utf-8") as f:
+            json.dump({
+                **self.info,
+                "format_version": TREE_FORMAT_VERSION,
+                "texts": self.texts,
+                "metadatas": self.metadatas,
+                "levels": self.levels.tolist(),
+                "children": self.children
+            }, f)
+        os.replace(tmp_nodes, tree_dir / "nodes.json")
+        
+    @classmethod
+    def load(cls, tree_dir: str) -> "RaptorTree":
+        """Load a saved tree, memory-mapping its vectors."""
+        tree_dir = Path(tree_dir)
+        with open(tree_dir / "nodes.json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format_version") != TREE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported RAPTOR tree format in {tree_dir}")
+            
+        nodes = {key: data.pop(key) for key in ("texts", "metadatas", "levels", "children")}
+        vectors = np.load(tree_dir / "vectors.npy", mmap_mode="r")
+        return cls(vectors=vectors, info=data, **nodes)
+        
+    def search_collapsed(self, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        """Score every node, leaves and summaries alike, and return the top ``k``."""
+        return self._top(np.arange(len(self)), query_vector, k)
+        
+    def search_tree(self, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Walk down from the top level, keeping the best ``k`` nodes per level.
+        
+        Returns:
+            The best ``k`` of all nodes visited, so broad queries can stop at
+            summaries while specific ones reach the leaves
+        """
+        candidates = np.flatnonzero(self.levels == self.depth)
+        selected: List[Tuple[int, float]] = []
+        while len(candidates):
+            best = self._top(candidates, query_vector, k)
+            selected.extend(best)
+            candidates = np.array([child for node_id, _ in best for child in self.children[node_id]], dtype=np.int64)
+        return sorted(selected, key=lambda item: -item[1])[:k]
+        
+    def _top(self, node_ids: np.ndarray, query_vector, k: int) -> List[Tuple[int, float]]:
+        if len(node_ids) == 0 or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = np.asarray(self.vectors[node_ids], dtype=np.float32) @ query
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(node_ids[i]), float(scores[i])) for i in top]
+        
+    def get_document(self, node_id: int, score: Optional[float] = None) -> "Document":
+        """Materialize a node as a LangChain document."""
+        from langchain_core.documents import Document
+        
+        metadata = dict(self.metadatas[node_id])
+        if score is not None:
+            metadata["score"] = score
+        return Document(page_content=self.texts[node_id], metadata=metadata)
+
+
+class RaptorRetriever:
+    """Retriever interface over a ``RaptorTree``."""
+    
+    def __init__(self, tree: RaptorTree, embeddings, k: int = 4, mode: str = "collapsed"):
+        """
+        Initialize the retriever.
+        
+        Args:
+            tree: Built or loaded summary tree
+            embeddings: Embedding model used to embed queries
+            k: Default number of nodes to return
+            mode: "collapsed" to search all nodes, "tree" for top-down traversal
+        """
+        if mode not in RAPTOR_MODES:
+            raise ValueError(f"Unknown RAPTOR mode: {mode}. Choose from {', '.join(RAPTOR_MODES)}")
+        self.tree = tree
+        self.embeddings = embeddings
+        self.k = k
+        self.mode = mode
+        
+    def invoke(self, query: str) -> List["Document"]:
+        """Retrieve the top ``k`` nodes for a query."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, self.k)]
+        
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple["Document", float]]:
+        """Retrieve nodes with cosine similarity scores."""
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k)
+        
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4) -> List[Tuple["Document", float]]:
+        """Retrieve nodes for an already-computed query vector."""
+        search = self.tree.search_tree if self.mode == "tree" else self.tree.search_collapsed
+        return [(self.tree.get_document(node_id, score), score) for node_id, score in search(embedding, k)]
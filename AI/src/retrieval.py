@@ -4,9 +4,13 @@ Retrieval module for RAG pipeline.
 Handles document retrieval and similarity search.
 """
 
-from typing import List, Dict, Any, Optional
-from langchain_core.documents import Document
-from langchain_core.vectorstores import VectorStoreRetriever
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.vectorstores import VectorStoreRetriever
 
 
 class DocumentRetriever:
@@ -20,6 +24,28 @@ class DocumentRetriever:
         """Retrieve documents for a single query."""
         return self.retriever.invoke(query)
     
+    def retrieve_by_vector(self, embedding, k: int = 4) -> Optional[List[Document]]:
+        """
+        Retrieve documents for an already-computed query embedding.
+        
+        Returns:
+            Documents, or None when the retriever only accepts text queries
+        """
+        if hasattr(self.retriever, 'similarity_search_by_vector_with_score'):
+            return [doc for doc, _ in self.retriever.similarity_search_by_vector_with_score(embedding, k=k)]
+        vectorstore = getattr(self.retriever, 'vectorstore', None)
+        if vectorstore is None or not hasattr(vectorstore, 'similarity_search_by_vector'):
+            return None
+        
+        docs = vectorstore.similarity_search_by_vector(embedding, k=k)
+        docstore = getattr(self.retriever, 'docstore', None)
+        if docstore is not None:
+            # Multi-vector retrievers match summaries and return their sections
+            id_key = getattr(self.retriever, 'id_key', 'doc_id')
+            ids = list(dict.fromkeys(doc.metadata[id_key] for doc in docs if id_key in doc.metadata))
+            return [doc for doc in docstore.mget(ids) if doc is not None]
+        return docs
+    
     def retrieve_multiple_queries(self, queries: List[str], k: int = 4) -> List[List[Document]]:
         """Retrieve documents for multiple queries."""
         results = []
@@ -35,6 +61,8 @@ class DocumentRetriever:
     def retrieve_with_scores(self, query: str, k: int = 4) -> List[tuple]:
         """Retrieve documents with similarity scores."""
         if hasattr(self.retriever, 'similarity_search_with_score'):
+            return self.retriever.similarity_search_with_score(query, k=k)
+        elif hasattr(self.retriever, 'vectorstore'):
             return self.retriever.vectorstore.similarity_search_with_score(query, k=k)
         else:
             # Fallback to regular retrieval
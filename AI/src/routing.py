@@ -4,44 +4,150 @@ Routing module for RAG pipeline.
 Implements logical and semantic routing techniques.
 """
 
-from typing import Literal, Dict, Any, List
+import re
+from functools import lru_cache
+from typing import Literal, Dict, Any, List, Optional, Tuple, Type
+
+import numpy as np
 # from langchain_core.pydantic_v1 import BaseModel, Field
 from pydantic import BaseModel
 from pydantic import Field
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain.utils.math import cosine_similarity
-from langchain_huggingface import HuggingFaceEmbeddings
+from pydantic import create_model
+
+from .lazy_imports import LazyImport
+
+ChatPromptTemplate = LazyImport("langchain_core.prompts", "ChatPromptTemplate")
+PromptTemplate = LazyImport("langchain_core.prompts", "PromptTemplate")
+HuggingFaceEmbeddings = LazyImport("langchain_huggingface", "HuggingFaceEmbeddings")
+
+
+ROUTE_FIELD_DESCRIPTION = (
+    "Given a user question, choose which HR policy file "
+    "would be most relevant for answering their question."
+)
+
+
+# Routing answer when no file can be singled out; retrieval searches every source
+ALL_SOURCES = "all"
+
+# Words too common in policy file names and questions to shortlist by
+ROUTE_STOPWORDS = frozenset({"the", "and", "for", "what", "how", "can", "does", "policy", "policies", "txt", "pdf", "docx"})
+
+
+def route_keywords(text: str) -> set:
+    """Lower-cased words of three or more letters, minus routing stopwords."""
+    return {word for word in re.findall(r"[a-z0-9]{3,}", text.lower()) if word not in ROUTE_STOPWORDS}
 
 
 class RouteQuery(BaseModel):
     """Data model for routing queries to HR policy files."""
     
-    file_name: Literal[
-        "employee_code_of_conduct.txt",
-        "leave_policy.txt", 
-        "work_from_home_policy.txt",
-        "payroll_and_compensation_policy.txt",
-        "performance_review_policy.txt",
-        "it_and_security_policy.txt"
-    ] = Field(
-        ...,
-        description=(
-            "Given a user question, choose which HR policy file "
-            "would be most relevant for answering their question."
-        ),
+    file_name: str = Field(..., description=ROUTE_FIELD_DESCRIPTION)
+
+
+@lru_cache(maxsize=256)
+def build_route_model(file_names: Tuple[str, ...]) -> Type[RouteQuery]:
+    """Create a RouteQuery schema whose file_name is restricted to the given files."""
+    return create_model(
+        "RouteQuery",
+        __base__=RouteQuery,
+        file_name=(Literal[file_names], Field(..., description=ROUTE_FIELD_DESCRIPTION)),
     )
 
 
+class RouteIndex:
+    """Vector index over routing targets derived from the corpus manifest."""
+    
+    def __init__(self, manifest: List[Dict[str, Any]], centroids: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Build the index from manifest entries and their centroid embeddings.
+        
+        Args:
+            manifest: Corpus manifest entries with ``file_name`` and ``description``
+            centroids: Optional per-file centroid embeddings; similarity search is
+                only available when every manifest file has one
+        """
+        self.names = [entry["file_name"] for entry in manifest]
+        self.descriptions = {entry["file_name"]: entry.get("description", "") for entry in manifest}
+        self.keywords = {name: route_keywords(f"{name} {self.descriptions[name]}") for name in self.names}
+        self.matrix: Optional[np.ndarray] = None
+        
+        centroids = centroids or {}
+        if self.names and all(name in centroids for name in self.names):
+            matrix = np.stack([np.asarray(centroids[name], dtype=np.float32) for name in self.names])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self.matrix = matrix / np.where(norms == 0, 1.0, norms)
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    def search(self, query_vector, k: int) -> List[Tuple[str, float]]:
+        """Return the ``k`` most similar targets as (file_name, cosine score), best first."""
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        scores = self.matrix @ query_vector
+        
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.names[i], float(scores[i])) for i in top]
+    
+    def keyword_search(self, question: str, k: int) -> List[Tuple[str, int]]:
+        """
+        Return up to ``k`` targets sharing words with the question, most shared first.
+        
+        Used when there are no centroids; targets with no word in common are
+        left out, and ties keep manifest order.
+        """
+        words = route_keywords(question)
+        hits = [(name, len(words & self.keywords[name])) for name in self.names]
+        hits = [hit for hit in hits if hit[1] > 0]
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+    
+    def format_routes(self, names: List[str]) -> str:
+        """Describe the given targets for the routing prompt."""
+        lines = []
+        for name in names:
+            description = self.descriptions.get(name)
+            lines.append(f"- {name}: {description}" if description else f"- {name}")
+        return "\n".join(lines)
+
+
 class LogicalRouter:
     """Handles logical routing using structured LLM output."""
     
-    def __init__(self, llm):
-        """Initialize with an LLM instance."""
+    def __init__(
+        self,
+        llm,
+        embeddings=None,
+        mode: str = "llm",
+        margin_threshold: float = 0.05,
+        max_candidates: int = 8
+    ):
+        """
+        Initialize the logical router.
+        
+        Args:
+            llm: LLM used for structured routing (and as the local-mode fallback)
+            embeddings: Embedding model used to embed questions for the route index
+            mode: "llm" to always ask the LLM, "local" to route by centroid similarity
+            margin_threshold: Minimum top-1/top-2 similarity gap accepted in local mode
+            max_candidates: Number of shortlisted files offered to the LLM, which keeps
+                the routing prompt the same size however many files are indexed
+        """
         self.llm = llm
+        self.embeddings = embeddings
+        self.mode = mode
+        self.margin_threshold = margin_threshold
+        self.max_candidates = max_candidates
         self.structured_llm = llm.with_structured_output(RouteQuery)
         
         system = """You are an expert at routing a user question to the appropriate data source.
-Given a user question, choose which HR policy file would be most relevant for answering their question."""
+Given a user question, choose which HR policy file would be most relevant for answering their question.
+
+Available HR policy files:
+{routes}"""
         
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", system),
@@ -49,18 +155,88 @@ Given a user question, choose which HR policy file would be most relevant for an
         ])
         
         self.router = self.prompt | self.structured_llm
+        self.route_index: Optional[RouteIndex] = None
+    
+    def set_routes(self, manifest: List[Dict[str, Any]], centroids: Optional[Dict[str, np.ndarray]] = None):
+        """Load routing targets from the corpus manifest built at index time."""
+        self.route_index = RouteIndex(manifest, centroids) if manifest else None
+    
+    def route_with_details(self, question: str, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Route a query and report how the decision was made.
+        
+        When centroids are available the question is scored against every file with
+        a single matrix-vector product. In local mode a clear winner is returned
+        directly; otherwise only the shortlisted files are offered to the LLM.
+        Without centroids, a corpus of more than ``max_candidates`` files is
+        shortlisted by the words the question shares with file names and
+        descriptions, and routed to ``ALL_SOURCES`` without an LLM call when
+        nothing matches, so the prompt never lists the whole corpus.
+        """
+        details: Dict[str, Any] = {"method": "llm"}
+        index = self.route_index
+        candidates = index.names if index is not None else []
+        
+        if index is not None and index.matrix is not None and self.embeddings is not None:
+            if query_embedding is None:
+                query_embedding = self.embeddings.embed_query(question)
+            
+            hits = index.search(query_embedding, max(2, self.max_candidates))
+            candidates = [name for name, _ in hits]
+            details["similarity_score"] = hits[0][1]
+            if len(hits) > 1:
+                details["margin"] = hits[0][1] - hits[1][1]
+            
+            if self.mode == "local":
+                if len(hits) == 1 or details["margin"] >= self.margin_threshold:
+                    details["method"] = "centroid"
+                    details["file_name"] = hits[0][0]
+                    return details
+                details["method"] = "llm_fallback"
+        elif len(candidates) > self.max_candidates:
+            hits = index.keyword_search(question, self.max_candidates)
+            if not hits:
+                details["method"] = "all_sources"
+                details["file_name"] = ALL_SOURCES
+                return details
+            candidates = [name for name, _ in hits]
+            details["method"] = "keyword_shortlist"
+        
+        details["file_name"] = self._route_with_llm(question, candidates).file_name
+        return details
     
     def route_query(self, question: str) -> RouteQuery:
         """Route a query to the appropriate policy file."""
-        return self.router.invoke({"question": question})
+        if self.route_index is None:
+            return self.router.invoke({"question": question, "routes": ""})
+        return RouteQuery(file_name=self.route_with_details(question)["file_name"])
+    
+    def _route_with_llm(self, question: str, candidates: List[str]) -> RouteQuery:
+        """Ask the LLM to choose among the candidate files."""
+        if not candidates:
+            return self.router.invoke({"question": question, "routes": ""})
+        
+        schema = build_route_model(tuple(candidates))
+        router = self.prompt | self.llm.with_structured_output(schema)
+        return router.invoke({
+            "question": question,
+            "routes": self.route_index.format_routes(candidates)
+        })
 
 
 class SemanticRouter:
     """Handles semantic routing using embedding similarity."""
     
-    def __init__(self, embedding_model: str = "all-MiniLM-L6-v2"):
-        """Initialize with embedding model."""
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+    def __init__(self, embedding_model: str = "all-MiniLM-L6-v2", embeddings=None):
+        """
+        Initialize with embedding model.
+        
+        Args:
+            embedding_model: HuggingFace embedding model name
+            embeddings: Optional already-loaded embedding model to share
+        """
+        self.embedding_model = embedding_model
+        self.embeddings = embeddings or HuggingFaceEmbeddings(model_name=embedding_model)
         
         # Define expert templates
         self.hr_template = """You are an HR policies assistant for the company Uptiq.
@@ -89,27 +265,53 @@ class SemanticRouter:
         self.prompt_templates = [self.hr_template, self.it_template, self.law_template]
         self.template_names = ["hr_template", "it_template", "law_template"]
         self.prompt_embeddings = self.embeddings.embed_documents(self.prompt_templates)
+        
+        # Templates are static, so normalize once and score queries with a matmul
+        matrix = np.asarray(self.prompt_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.template_matrix = matrix / np.where(norms == 0, 1.0, norms)
     
-    def route_query(self, query: str) -> Dict[str, Any]:
-        """Route query to the most similar prompt template."""
-        # Embed the query
-        query_embedding = self.embeddings.embed_query(query)
-        
-        # Compute cosine similarity
-        similarity = cosine_similarity([query_embedding], self.prompt_embeddings)[0]
-        
-        # Find most similar template
-        most_similar_index = similarity.argmax()
-        chosen_name = self.template_names[most_similar_index]
-        chosen_prompt = self.prompt_templates[most_similar_index]
-        
-        return {
-            "template_name": chosen_name,
-            "template": chosen_prompt,
-            "similarity_score": float(similarity[most_similar_index])
-        }
+    def route_query(self, query: str, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Route query to the most similar prompt template.
+        
+        Args:
+            query: User query string
+            query_embedding: Optional precomputed embedding of ``query``, e.g. the
+                one already used for retrieval, to avoid embedding it again
+        """
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(query)
+        return self.route_queries([query], [query_embedding])[0]
+    
+    def route_queries(
+        self,
+        queries: List[str],
+        query_embeddings: Optional[List[List[float]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Route many queries at once with a single embedding batch and matmul."""
+        if not queries:
+            return []
+        if query_embeddings is None:
+            # embed_query applies the query instruction of asymmetric models,
+            # matching the single-query path and the retrieval vector
+            query_embeddings = [self.embeddings.embed_query(query) for query in queries]
+        
+        vectors = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        similarity = (vectors / np.where(norms == 0, 1.0, norms)) @ self.template_matrix.T
+        best = similarity.argmax(axis=1)
+        
+        return [
+            {
+                "template_name": self.template_names[index],
+                "template": self.prompt_templates[index],
+                "similarity_score": float(similarity[row, index])
+            }
+            for row, index in enumerate(best)
+        ]
     
-    def get_prompt_template(self, query: str) -> PromptTemplate:
+    def get_prompt_template(self, query: str) -> "PromptTemplate":
         """Get the most appropriate prompt template for a query."""
         routing_result = self.route_query(query)
         return PromptTemplate.from_template(routing_result["template"])
@@ -0,0 +1,81 @@
+"""
+Request coalescing for RAG pipeline.
+
+When many users ask the same question at once (say, right after a policy
+announcement), only the first request runs the pipeline; identical requests
+that arrive while it is in flight wait for it and share its result. Results
+are not kept after the call finishes, so this never serves stale answers.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    """One in-flight execution and the requests waiting on it."""
+    __slots__ = ("done", "result", "error", "waiters")
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+        
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run ``func`` unless a call with the same key is already running.
+        
+        Args:
+            key: Identity of the work, e.g. normalized query and options
+            func: Zero-argument callable doing the work
+            
+        Returns:
+            Tuple of (result, shared); shared is True when the result came from
+            another request's execution. Exceptions are re-raised in every waiter.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+            
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Forget the call before waking waiters so later arrivals start afresh
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+        
+    def stats(self) -> Dict[str, int]:
+        """Executions, coalesced requests and calls currently in flight."""
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls)
+            }
@@ -0,0 +1,156 @@
+"""
+Offline summarization for RAG pipeline indexes.
+
+Produces compact text representations of sections or clusters, either
+extractively or with an LLM. LLM summaries are cached on disk keyed by a hash
+of their input, so index rebuilds only summarize content that changed and an
+interrupted build resumes from the summaries already saved.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .lazy_imports import LazyImport
+
+ChatPromptTemplate = LazyImport("langchain_core.prompts", "ChatPromptTemplate")
+StrOutputParser = LazyImport("langchain_core.output_parsers", "StrOutputParser")
+
+# Bump when the prompt changes so cached LLM summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
+SUMMARY_PROMPT = """Summarize the following HR policy text in 2-3 sentences.
+Keep specific numbers, eligibility rules and deadlines. Reply with the summary only.
+
+{text}"""
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def extractive_summary(text: str, max_chars: int = 300) -> str:
+    """Leading lines and sentences of ``text``, cut at a sentence boundary."""
+    lines = [line.strip(" \t-*•") for line in text.splitlines()]
+    sentences = [s for line in lines if line for s in SENTENCE_END.split(line) if s]
+    summary = ""
+    for sentence in sentences:
+        candidate = f"{summary} {sentence}".strip()
+        if len(candidate) > max_chars:
+            break
+        summary = candidate
+    return summary or text[:max_chars].strip()
+
+
+class SummaryCache:
+    """JSON file of summaries keyed by content hash."""
+    
+    def __init__(self, path: Optional[str]):
+        self.path = Path(path) if path else None
+        self.entries: Dict[str, str] = {}
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                print(f"Warning: Ignoring unreadable summary cache {self.path}")
+                
+    def get(self, key: str) -> Optional[str]:
+        return self.entries.get(key)
+        
+    def put(self, key: str, summary: str):
+        self.entries[key] = summary
+        
+    def save(self):
+        """Write the cache atomically."""
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{os.getpid()}.{self.path.name}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+class Summarizer:
+    """Summarize texts extractively or with an LLM, with on-disk caching."""
+    
+    def __init__(
+        self,
+        method: str = "extractive",
+        llm=None,
+        cache_path: Optional[str] = None,
+        max_chars: int = 300,
+        batch_size: int = 8
+    ):
+        """
+        Initialize the summarizer.
+        
+        Args:
+            method: "extractive" or "llm"
+            llm: Chat model used when method is "llm"
+            cache_path: JSON file for cached LLM summaries (no caching when None)
+            max_chars: Length limit for extractive summaries
+            batch_size: Texts summarized per LLM batch; the cache is saved
+                after every batch so interrupted builds can resume
+        """
+        if method not in ("extractive", "llm"):
+            raise ValueError(f"Unknown summary method: {method}")
+        if method == "llm" and llm is None:
+            raise ValueError("The llm summary method requires an llm")
+            
+        self.method = method
+        self.llm = llm
+        self.max_chars = max_chars
+        self.batch_size = batch_size
+        self.cache = SummaryCache(cache_path)
+        self.chain = None
+        if method == "llm":
+            prompt = ChatPromptTemplate.from_template(SUMMARY_PROMPT)
+            self.chain = prompt | llm | StrOutputParser()
+            
+    @property
+    def variant(self) -> str:
+        """Everything besides the input text that determines a summary."""
+        if self.method == "llm":
+            model = getattr(self.llm, "model_name", None) or getattr(self.llm, "model", "")
+            return f"llm:{model}:v{SUMMARY_PROMPT_VERSION}"
+        return f"extractive:{self.max_chars}"
+        
+    def cache_key(self, text: str) -> str:
+        """Hash of the text and the summary variant."""
+        return hashlib.sha256(f"{self.variant}\n{text}".encode("utf-8")).hexdigest()
+        
+    def summarize(self, texts: List[str]) -> List[str]:
+        """Summarize ``texts``, only generating summaries missing from the cache."""
+        if self.method == "extractive":
+            # Cheap and deterministic, so not worth caching
+            return [extractive_summary(text, self.max_chars) for text in texts]
+            
+        keys = [self.cache_key(text) for text in texts]
+        missing = [i for i, key in enumerate(keys) if self.cache.get(key) is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            summaries = self.chain.batch([{"text": texts[i]} for i in batch])
+            for i, summary in zip(batch, summaries):
+                self.cache.put(keys[i], summary.strip())
+            self.cache.save()
+            
+        return [self.cache.get(key) for key in keys]
+        
+    def summarize_groups(self, groups: List[List[str]]) -> List[str]:
+        """
+        Summarize each group of related texts into a single summary.
+        
+        LLM summaries are cached by the hash of the group's combined text, so a
+        rebuild that produces the same cluster reuses its summary.
+        """
+        if self.method == "extractive":
+            # Give every member an equal share so the summary covers the group
+            return [
+                " ".join(extractive_summary(text, max(80, self.max_chars // len(group))) for text in group)
+                for group in groups
+            ]
+        return self.summarize(["\n\n".join(group) for group in groups])
@@ -0,0 +1,172 @@
+"""
+Persistent cache for LLM query transformations.
+
+Transformations run at temperature 0, so the same question always produces the
+same rewrite, sub-questions or HyDE passage. Outputs are stored in SQLite keyed
+by (method, normalized question, model, prompt version) and shared by every
+worker process; the least recently used entries are evicted once the cache
+grows past ``max_entries``.
+
+HyDE results are also cached as the embedding of the generated passage, so a
+repeated HyDE question skips both the LLM call and embedding the passage.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold and collapse whitespace so trivially different questions share an entry."""
+    return " ".join(question.casefold().split())
+
+
+class TransformationCache:
+    """SQLite-backed cache of transformation outputs with LRU eviction."""
+    
+    def __init__(self, path: str, max_entries: int = 10000):
+        """
+        Initialize the cache.
+        
+        Args:
+            path: SQLite database file (created if missing)
+            max_entries: Entries kept per table before the least recently used
+                are evicted
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transformations ("
+                "key TEXT PRIMARY KEY, method TEXT NOT NULL, value TEXT NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS transformations_last_used ON transformations (last_used)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, method TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread and process; connections never cross a fork."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+        
+    @staticmethod
+    def make_key(method: str, question: str, model: str, prompt_version: int) -> str:
+        raw = json.dumps([method, normalize_question(question), model, prompt_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        
+    def get(self, method: str, question: str, model: str, prompt_version: int) -> Optional[Any]:
+        """Return the cached output, or None on a miss."""
+        row = self._lookup("transformations", "value", self.make_key(method, question, model, prompt_version))
+        return json.loads(row[0]) if row is not None else None
+        
+    def put(self, method: str, question: str, model: str, prompt_version: int, value: Any):
+        """Store an output and evict the least recently used entries over the limit."""
+        self._store(
+            "transformations",
+            {"key": self.make_key(method, question, model, prompt_version), "method": method, "value": json.dumps(value)}
+        )
+        
+    def get_embedding(
+        self,
+        method: str,
+        question: str,
+        model: str,
+        prompt_version: int
+    ) -> Optional[Tuple[str, np.ndarray]]:
+        """
+        Return a cached (generated text, float32 embedding) pair, or None on a miss.
+        
+        ``model`` should name both the LLM and the embedding model.
+        """
+        row = self._lookup("embeddings", "text, vector", self.make_key(method, question, model, prompt_version))
+        return (row[0], np.frombuffer(row[1], dtype=np.float32)) if row is not None else None
+        
+    def put_embedding(self, method: str, question: str, model: str, prompt_version: int, text: str, vector):
+        """Store the generated text and its embedding."""
+        self._store("embeddings", {
+            "key": self.make_key(method, question, model, prompt_version),
+            "method": method,
+            "text": text,
+            "vector": np.asarray(vector, dtype=np.float32).tobytes()
+        })
+        
+    def _lookup(self, table: str, columns: str, key: str):
+        try:
+            with self._connect() as conn:
+                row = conn.execute(f"SELECT {columns} FROM {table} WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute(f"UPDATE {table} SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"Warning: Transformation cache read failed: {e}")
+            row = None
+            
+        with self._stats_lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row
+        
+    def _store(self, table: str, values: Dict[str, Any]):
+        now = time.time()
+        values = {**values, "created": now, "last_used": now}
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+                    tuple(values.values())
+                )
+                excess = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    conn.execute(
+                        f"DELETE FROM {table} WHERE key IN (SELECT key FROM {table} ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    with self._stats_lock:
+                        self.evictions += excess
+        except sqlite3.Error as e:
+            print(f"Warning: Transformation cache write failed: {e}")
+            
+    def stats(self) -> Dict[str, Any]:
+        """Hit statistics for this process plus the number of stored entries."""
+        try:
+            conn = self._connect()
+            entries = sum(
+                conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("transformations", "embeddings")
+            )
+        except sqlite3.Error:
+            entries = None
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "max_entries": self.max_entries
+            }
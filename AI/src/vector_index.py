@@ -0,0 +1,484 @@
+"""
+Memory-mapped vector index for RAG pipeline.
+
+Stores chunk vectors as a flat float16/float32 file next to a fixed-width chunk
+table, a UTF-8 text buffer and a JSON buffer for any further chunk metadata.
+Every file is opened read-only with ``mmap``, so all worker processes on a host
+share a single page-cache copy of the index.
+
+Chunks are addressed by integer id and only materialized as LangChain
+documents for the final top-k. With ``quantization="int8"`` the full scan runs
+over one byte per dimension and the shortlist is rescored in float32 from the
+stored float16 vectors.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+
+INDEX_FORMAT_VERSION = 2
+
+# Fixed-width record per chunk: byte span in text.bin, source file, the
+# character offset of the chunk inside that source and the byte span in
+# meta.bin of the remaining metadata as JSON (empty when there is none).
+CHUNK_DTYPE = np.dtype([
+    ("text_start", np.int64),
+    ("text_end", np.int64),
+    ("source_id", np.int32),
+    ("start_index", np.int64),
+    ("meta_start", np.int64),
+    ("meta_end", np.int64),
+])
+
+# Metadata keys held in the chunk table rather than meta.bin
+RECORD_KEYS = ("source", "start_index")
+
+# Rows scored per block so float16 vectors are upcast a slice at a time
+SEARCH_BLOCK_ROWS = 65536
+
+# Shortlist size, as a multiple of k, rescored in float32 after an int8 scan
+RESCORE_FACTOR = 4
+
+# Recently written chunk texts remembered for de-duplication (~100 bytes each)
+INTERN_TABLE_SIZE = 65536
+
+
+class ChunkRecord:
+    """Lightweight handle for a stored chunk: id, source and character span."""
+    
+    __slots__ = ("id", "source", "start", "end")
+    
+    def __init__(self, id: int, source: str, start: int, end: int):
+        self.id = id
+        self.source = source
+        self.start = start
+        self.end = end
+        
+    def __repr__(self) -> str:
+        return f"ChunkRecord(id={self.id}, source={self.source!r}, start={self.start}, end={self.end})"
+
+
+class FlatVectorIndex:
+    """Read-only, memory-mapped exact (brute-force) cosine similarity index."""
+    
+    def __init__(self, index_dir: str):
+        """
+        Open an index written by ``FlatVectorIndex.write``.
+        
+        Args:
+            index_dir: Directory containing the index files
+        """
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "index.json", "r", encoding="utf-8") as f:
+            self.info: Dict[str, Any] = json.load(f)
+            
+        if self.info.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version: {self.info.get('version')}")
+            
+        self.count = self.info["count"]
+        self.dim = self.info["dim"]
+        self.sources: List[str] = self.info["sources"]
+        self.vectors = self._map(self.index_dir / "vectors.bin", np.dtype(self.info["dtype"]), (self.count, self.dim))
+        self.chunks = self._map(self.index_dir / "chunks.bin", CHUNK_DTYPE, (self.count,))
+        self.text = self._map(self.index_dir / "text.bin", np.uint8, (self.info["text_bytes"],))
+        self.meta = self._map(self.index_dir / "meta.bin", np.uint8, (self.info["meta_bytes"],))
+        
+        self.quantization: Optional[str] = self.info.get("quantization")
+        self.codes = self.scales = None
+        if self.quantization == "int8":
+            self.codes = self._map(self.index_dir / "codes.bin", np.int8, (self.count, self.dim))
+            self.scales = self._map(self.index_dir / "scales.bin", np.float32, (self.count,))
+        elif self.quantization is not None:
+            raise ValueError(f"Unsupported quantization: {self.quantization}")
+            
+    @staticmethod
+    def _map(path: Path, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        """Map a raw file read-only (empty files cannot be mmapped)."""
+        if int(np.prod(shape)) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+        
+    @classmethod
+    def write(
+        cls,
+        index_dir: str,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        vectors,
+        dtype: str = "float16",
+        quantization: Optional[str] = None,
+        extra_info: Optional[Dict[str, Any]] = None
+    ) -> "FlatVectorIndex":
+        """
+        Write a new index atomically and open it.
+        
+        Args:
+            index_dir: Destination directory
+            texts: Chunk texts
+            metadatas: Chunk metadata with ``source``, optional ``start_index``
+                and any other JSON-serializable fields
+            vectors: Chunk embeddings, one row per chunk
+            dtype: Storage dtype for vectors ("float16" or "float32")
+            quantization: "int8" to also store per-row scaled int8 codes used
+                for the full scan, or None to scan the stored vectors directly
+            extra_info: Additional fields stored in index.json (e.g. fingerprint)
+        """
+        with FlatIndexWriter(index_dir, dtype=dtype, quantization=quantization, extra_info=extra_info) as writer:
+            writer.add(texts, metadatas, vectors)
+        return writer.index
+        
+    def __len__(self) -> int:
+        return self.count
+        
+    @property
+    def nbytes(self) -> int:
+        """Total size of the mapped index data in bytes."""
+        arrays = [self.vectors, self.chunks, self.text, self.meta, self.codes, self.scales]
+        return sum(array.nbytes for array in arrays if array is not None)
+        
+    def search(self, query_vector, k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Find the ``k`` chunks most similar to the query.
+        
+        Returns:
+            List of (chunk id, cosine similarity) pairs, best first
+        """
+        if self.count == 0 or k <= 0:
+            return []
+            
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        
+        if self.codes is None:
+            return self._scan(self.vectors, None, query, k)
+            
+        shortlist = self._scan(self.codes, self.scales, query, k * RESCORE_FACTOR)
+        ids = np.sort(np.array([chunk_id for chunk_id, _ in shortlist], dtype=np.int64))
+        scores = np.asarray(self.vectors[ids], dtype=np.float32) @ query
+        order = np.argsort(-scores)[:k]
+        return [(int(ids[i]), float(scores[i])) for i in order]
+        
+    def _scan(self, vectors: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Exact top-k over ``vectors`` (rows multiplied by ``scales`` if given)."""
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores = block @ query
+            if scales is not None:
+                scores *= scales[start:start + SEARCH_BLOCK_ROWS]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(len(scores))
+            best_ids = np.concatenate([best_ids, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_ids, best_scores = best_ids[keep], best_scores[keep]
+                
+        order = np.argsort(-best_scores)
+        return [(int(best_ids[i]), float(best_scores[i])) for i in order]
+        
+    def get_record(self, chunk_id: int) -> ChunkRecord:
+        """Return the compact record of a chunk without decoding its text."""
+        record = self.chunks[chunk_id]
+        return ChunkRecord(
+            int(chunk_id),
+            self.sources[record["source_id"]],
+            int(record["text_start"]),
+            int(record["text_end"])
+        )
+        
+    def get_text(self, chunk_id: int) -> str:
+        """Return the text of a chunk."""
+        record = self.chunks[chunk_id]
+        return self.text[record["text_start"]:record["text_end"]].tobytes().decode("utf-8")
+        
+    def get_metadata(self, chunk_id: int) -> Dict[str, Any]:
+        """Return the metadata of a chunk."""
+        record = self.chunks[chunk_id]
+        metadata = {"source": self.sources[record["source_id"]]}
+        if record["start_index"] >= 0:
+            metadata["start_index"] = int(record["start_index"])
+        if record["meta_end"] > record["meta_start"]:
+            metadata.update(json.loads(self.meta[record["meta_start"]:record["meta_end"]].tobytes()))
+        return metadata
+        
+    def get_document(self, chunk_id: int, score: Optional[float] = None) -> "Document":
+        """Materialize a chunk as a LangChain document."""
+        from langchain_core.documents import Document
+        
+        metadata = self.get_metadata(chunk_id)
+        if score is not None:
+            metadata["score"] = score
+        return Document(page_content=self.get_text(chunk_id), metadata=metadata)
+        
+    def source_centroids(self, name: Callable[[str], str] = os.path.basename) -> Dict[str, np.ndarray]:
+        """Compute a unit-length mean vector per source file, keyed by ``name(source)``."""
+        sums = np.zeros((len(self.sources), self.dim), dtype=np.float32)
+        source_ids = np.asarray(self.chunks["source_id"])
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            np.add.at(sums, source_ids[start:start + SEARCH_BLOCK_ROWS], block)
+            
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        sums = sums / np.where(norms == 0, 1.0, norms)
+        return {name(source): sums[i] for i, source in enumerate(self.sources)}
+
+
+class FlatIndexWriter:
+    """
+    Incrementally write a ``FlatVectorIndex``.
+    
+    Batches are appended to files in a staging directory, so memory use is
+    bounded by the batch size rather than the corpus; the de-duplication table
+    is an LRU of at most ``max_interned`` texts for the same reason.
+    ``commit`` renames the staging directory into place, so readers never
+    observe a partial index. Used as a context manager, the index is committed
+    on success and the staging directory removed on error.
+    """
+    
+    def __init__(
+        self,
+        index_dir: str,
+        dtype: str = "float16",
+        quantization: Optional[str] = None,
+        extra_info: Optional[Dict[str, Any]] = None,
+        max_interned: int = INTERN_TABLE_SIZE
+    ):
+        """
+        Initialize the writer.
+        
+        Args:
+            index_dir: Destination directory
+            dtype: Storage dtype for vectors ("float16" or "float32")
+            quantization: "int8" to also store quantized codes, or None
+            extra_info: Additional fields stored in index.json (e.g. fingerprint)
+            max_interned: Distinct texts remembered for de-duplication; a
+                repeat of an evicted text is stored again
+        """
+        if quantization not in (None, "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+            
+        self.index_dir = Path(index_dir)
+        self.dtype = dtype
+        self.quantization = quantization
+        self.extra_info = dict(extra_info or {})
+        self.index: Optional[FlatVectorIndex] = None
+        
+        self.count = 0
+        self.dim: Optional[int] = None
+        self.text_bytes = 0
+        self.meta_bytes = 0
+        self._last_meta: Optional[Tuple[bytes, int]] = None
+        self.sources: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        # Identical chunk texts (e.g. boilerplate shared by several files) are
+        # stored once; keyed by digest and capped so the table stays small
+        self.max_interned = max_interned
+        self._interned: "OrderedDict[bytes, int]" = OrderedDict()
+        
+        self.index_dir.parent.mkdir(parents=True, exist_ok=True)
+        self.staging = Path(tempfile.mkdtemp(prefix=".index-", dir=self.index_dir.parent))
+        names = ["vectors", "chunks", "text", "meta"] + (["codes", "scales"] if quantization == "int8" else [])
+        self._files = {name: open(self.staging / f"{name}.bin", "wb") for name in names}
+        
+    def __enter__(self) -> "FlatIndexWriter":
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+            
+    def add(self, texts: List[str], metadatas: List[Dict[str, Any]], vectors) -> None:
+        """Append a batch of chunks with their embeddings."""
+        if not texts:
+            return
+            
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        
+        chunks = np.zeros(len(texts), dtype=CHUNK_DTYPE)
+        for i, (text, metadata) in enumerate(zip(texts, metadatas)):
+            data = text.encode("utf-8")
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            start = self._interned.get(digest)
+            if start is None:
+                start = self._intern(digest)
+                self._files["text"].write(data)
+                self.text_bytes += len(data)
+            else:
+                self._interned.move_to_end(digest)
+            source = metadata.get("source", "")
+            if source not in self._source_ids:
+                self._source_ids[source] = len(self.sources)
+                self.sources.append(source)
+            meta_start, meta_end = self._write_meta(metadata)
+            chunks[i] = (
+                start, start + len(data), self._source_ids[source], metadata.get("start_index", -1),
+                meta_start, meta_end
+            )
+            
+        vectors.astype(self.dtype).tofile(self._files["vectors"])
+        chunks.tofile(self._files["chunks"])
+        if self.quantization == "int8":
+            codes, scales = quantize_int8(vectors)
+            codes.tofile(self._files["codes"])
+            scales.tofile(self._files["scales"])
+        self.count += len(texts)
+        
+    def _write_meta(self, metadata: Dict[str, Any]) -> Tuple[int, int]:
+        """Append the metadata not held in the chunk table; returns its byte span."""
+        extra = {key: value for key, value in metadata.items() if key not in RECORD_KEYS}
+        if not extra:
+            return 0, 0
+        data = json.dumps(extra, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        # Neighbouring chunks of one section usually carry identical metadata
+        if self._last_meta is not None and self._last_meta[0] == data:
+            start = self._last_meta[1]
+        else:
+            start = self.meta_bytes
+            self._files["meta"].write(data)
+            self.meta_bytes += len(data)
+            self._last_meta = (data, start)
+        return start, start + len(data)
+        
+    def _intern(self, digest: bytes) -> int:
+        """Remember the next text offset under ``digest``, evicting the least recently used."""
+        if self.max_interned <= 0:
+            return self.text_bytes
+        self._interned[digest] = self.text_bytes
+        if len(self._interned) > self.max_interned:
+            self._interned.popitem(last=False)
+        return self.text_bytes
+        
+    def commit(self) -> FlatVectorIndex:
+        """Finish the index, move it into place and open it."""
+        for f in self._files.values():
+            f.close()
+            
+        info = dict(self.extra_info)
+        info.update({
+            "version": INDEX_FORMAT_VERSION,
+            "count": self.count,
+            "dim": self.dim or 0,
+            "dtype": self.dtype,
+            "quantization": self.quantization,
+            "text_bytes": self.text_bytes,
+            "meta_bytes": self.meta_bytes,
+            "sources": self.sources
+        })
+        try:
+            with open(self.staging / "index.json", "w", encoding="utf-8") as f:
+                json.dump(info, f, indent=2)
+                
+            if self.index_dir.exists():
+                retired = Path(tempfile.mkdtemp(prefix=".retired-", dir=self.index_dir.parent))
+                os.replace(self.index_dir, retired / self.index_dir.name)
+                os.replace(self.staging, self.index_dir)
+                shutil.rmtree(retired, ignore_errors=True)
+            else:
+                os.replace(self.staging, self.index_dir)
+        except Exception:
+            self.abort()
+            raise
+            
+        self.index = FlatVectorIndex(str(self.index_dir))
+        return self.index
+        
+    def abort(self) -> None:
+        """Discard everything written so far."""
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+@contextmanager
+def index_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on ``path`` across processes (``fcntl.flock``).
+    
+    Wrap checking, building and committing an index so that processes which
+    find it stale at the same time build it once: the first takes the lock and
+    the others wait, then map the index it committed. Where ``fcntl`` is not
+    available (Windows) the block runs unlocked.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+        
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization; returns (codes, scales)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+class FlatIndexRetriever:
+    """Retriever interface over a ``FlatVectorIndex``."""
+    
+    def __init__(self, index: FlatVectorIndex, embeddings, k: int = 4, searcher=None):
+        """
+        Initialize the retriever.
+        
+        Args:
+            index: Opened vector index
+            embeddings: Embedding model used to embed queries
+            k: Default number of chunks to return
+            searcher: Object with ``search(query_vector, k)`` such as an ANN
+                searcher from ``src.ann`` (exact index scan when None)
+        """
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k
+        self.searcher = searcher or index
+        
+    def invoke(self, query: str) -> List["Document"]:
+        """Retrieve the top ``k`` documents for a query."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, self.k)]
+        
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple["Document", float]]:
+        """Retrieve documents with cosine similarity scores."""
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k)
+        
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4) -> List[Tuple["Document", float]]:
+        """Retrieve documents for an already-computed query vector."""
+        return [
+            (self.index.get_document(chunk_id, score), score)
+            for chunk_id, score in self.searcher.search(embedding, k)
+        ]
@@ -4,14 +4,31 @@ Unit tests for RAG pipeline components.
 
 import pytest
 import os
+import numpy as np
 from unittest.mock import Mock, patch
 from typing import List
 
+from langchain_core.runnables import RunnableLambda
+
 from src.indexing import DocumentIndexer
 from src.query_transform import QueryTransformer, DocumentReranker
 from src.retrieval import DocumentRetriever
-from src.routing import LogicalRouter, SemanticRouter
-from src.generation import ResponseGenerator
+from src.routing import ALL_SOURCES, LogicalRouter, SemanticRouter, RouteIndex, build_route_model
+from src.generation import ResponseGenerator, ContextBuilder
+from src.vector_index import FlatIndexWriter, FlatVectorIndex, FlatIndexRetriever
+from src.ann import build_searcher, kmeans
+from src.ingest import LOADERS, batched, discover_files, read_documents
+from src.chunking import FALLBACK_TOKEN_PATTERN, SectionChunker, TokenChunker, fallback_token_offsets
+from src.summarization import Summarizer, extractive_summary
+from src.late_interaction import LateInteractionIndex, LateInteractionRetriever
+from src.transform_cache import TransformationCache
+from src.raptor import RaptorRetriever, RaptorTree, cluster_vectors
+from src.single_flight import SingleFlight
+from src.admission import AdmissionController, Overloaded
+from src.http_pool import HTTPClientPool, shared_pool
+from src.llm_scheduler import (
+    DeadlineExceeded, LLMScheduler, LLMTimeout, ScheduledLLM, TokenBucket, deadline_scope, is_retryable
+)
 from src.orchestrator import RAGPipeline, PipelineConfig
 
 
@@ -26,6 +43,15 @@ class TestDocumentIndexer:
         assert indexer.chunk_overlap == 10
         assert indexer.embedding_model == "all-MiniLM-L6-v2"
     
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_embeddings_load_on_first_use(self, mock_embeddings):
+        """Test constructing an indexer does not load the embedding model."""
+        indexer = DocumentIndexer("test_path", embedding_model="test-model")
+        
+        mock_embeddings.assert_not_called()
+        assert indexer.embeddings is indexer.embeddings
+        mock_embeddings.assert_called_once_with(model_name="test-model")
+    
     @patch('src.indexing.DirectoryLoader')
     def test_load_documents_file_not_found(self, mock_loader):
         """Test load_documents with non-existent path."""
@@ -49,6 +75,800 @@ class TestDocumentIndexer:
             docs = indexer.load_documents()
             assert len(docs) == 1
             assert docs[0].page_content == "Test content"
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_build_route_centroids(self, mock_embeddings):
+        """Test per-file centroids are averaged from stored chunk embeddings."""
+        indexer = DocumentIndexer("test_path")
+        indexer.vectorstore = Mock()
+        indexer.vectorstore.get.return_value = {
+            "embeddings": [[1.0, 0.0], [3.0, 0.0], [0.0, 2.0]],
+            "metadatas": [
+                {"source": "/docs/leave_policy.txt"},
+                {"source": "/docs/leave_policy.txt"},
+                {"source": "/docs/it_and_security_policy.txt"},
+            ]
+        }
+        
+        centroids = indexer.build_route_centroids()
+        
+        assert set(centroids) == {"leave_policy.txt", "it_and_security_policy.txt"}
+        np.testing.assert_allclose(centroids["leave_policy.txt"], [1.0, 0.0])
+        np.testing.assert_allclose(centroids["it_and_security_policy.txt"], [0.0, 1.0])
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_build_manifest(self, mock_embeddings):
+        """Test manifest entries are derived from titles and section headings."""
+        from langchain_core.documents import Document
+        
+        doc = Document(
+            page_content="Uptiq - Leave Policy\n\n1. Annual Leave\n   - 18 days\n2. Sick Leave\n",
+            metadata={"source": "/docs/leave_policy.txt"}
+        )
+        
+        manifest = DocumentIndexer("test_path").build_manifest([doc])
+        
+        assert manifest[0]["file_name"] == "leave_policy.txt"
+        assert manifest[0]["description"] == "Uptiq - Leave Policy: Annual Leave; Sick Leave"
+        assert len(manifest[0]["sha256"]) == 64
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_routing_targets_are_cached(self, mock_embeddings, tmp_path):
+        """Test centroids are reused from the cache while the corpus is unchanged."""
+        indexer = DocumentIndexer("test_path", cache_dir=str(tmp_path))
+        indexer.vectorstore = Mock()
+        indexer.manifest = [{"file_name": "leave_policy.txt", "description": "Leave", "sha256": "abc"}]
+        indexer.vectorstore.get.return_value = {
+            "embeddings": [[0.0, 2.0]],
+            "metadatas": [{"source": "/docs/leave_policy.txt"}]
+        }
+        
+        indexer.build_routing_targets()
+        indexer.vectorstore.get.reset_mock()
+        manifest, centroids = indexer.build_routing_targets()
+        
+        indexer.vectorstore.get.assert_not_called()
+        assert manifest[0]["file_name"] == "leave_policy.txt"
+        np.testing.assert_allclose(centroids["leave_policy.txt"], [0.0, 1.0])
+        
+        indexer.manifest[0]["sha256"] = "changed"
+        indexer.build_routing_targets()
+        indexer.vectorstore.get.assert_called_once()
+
+
+class TestFlatVectorIndex:
+    """Test cases for the memory-mapped FlatVectorIndex."""
+    
+    TEXTS = ["Annual leave is 20 days.", "Passwords rotate every 90 days.", "Sick leave needs a note – always."]
+    METADATAS = [
+        {"source": "/docs/leave_policy.txt", "start_index": 0},
+        {"source": "/docs/it_and_security_policy.txt", "start_index": 0},
+        {"source": "/docs/leave_policy.txt", "start_index": 25},
+    ]
+    VECTORS = [[1.0, 0.0, 0.0], [0.0, 3.0, 0.0], [0.8, 0.0, 0.6]]
+    
+    def write_index(self, tmp_path, dtype="float16"):
+        return FlatVectorIndex.write(str(tmp_path / "vectors"), self.TEXTS, self.METADATAS, self.VECTORS, dtype=dtype)
+    
+    def test_write_and_reopen(self, tmp_path):
+        """Test an index round-trips texts and metadata through its files."""
+        self.write_index(tmp_path)
+        index = FlatVectorIndex(str(tmp_path / "vectors"))
+        
+        assert len(index) == 3
+        assert index.vectors.dtype == np.float16
+        assert index.get_text(2) == self.TEXTS[2]
+        assert index.get_metadata(2) == {"source": "/docs/leave_policy.txt", "start_index": 25}
+    
+    def test_full_metadata_round_trips(self, tmp_path):
+        """Test metadata beyond source and start_index (e.g. section fields) is stored and returned."""
+        import json
+        
+        section = {"title": "Uptiq - Leave Policy", "section": "Annual Leave", "doc_id": "leave-1"}
+        metadatas = [
+            {"source": "/docs/leave_policy.txt", "start_index": 0, **section},
+            {"source": "/docs/leave_policy.txt", "start_index": 40, **section},
+            {"source": "/docs/it_and_security_policy.txt", "page": 3, "tags": ["vpn", "mfa"]},
+        ]
+        FlatVectorIndex.write(str(tmp_path / "vectors"), self.TEXTS, metadatas, self.VECTORS)
+        index = FlatVectorIndex(str(tmp_path / "vectors"))
+        
+        assert [index.get_metadata(i) for i in range(3)] == metadatas
+        assert index.get_document(0, score=0.5).metadata == {**metadatas[0], "score": 0.5}
+        # Consecutive chunks with the same section share one JSON record
+        assert index.info["meta_bytes"] < 2 * len(json.dumps(section))
+    
+    def test_search_returns_best_first(self, tmp_path):
+        """Test search ranks chunks by cosine similarity."""
+        index = self.write_index(tmp_path, dtype="float32")
+        
+        results = index.search([1.0, 0.0, 0.1], k=2)
+        
+        assert [chunk_id for chunk_id, _ in results] == [0, 2]
+        assert results[0][1] > results[1][1]
+    
+    def test_source_centroids(self, tmp_path):
+        """Test per-file centroids are computed from the mapped vectors."""
+        index = self.write_index(tmp_path, dtype="float32")
+        
+        centroids = index.source_centroids()
+        
+        np.testing.assert_allclose(centroids["it_and_security_policy.txt"], [0.0, 1.0, 0.0], atol=1e-6)
+        np.testing.assert_allclose(np.linalg.norm(centroids["leave_policy.txt"]), 1.0, atol=1e-6)
+    
+    def test_retriever_returns_scored_documents(self, tmp_path):
+        """Test FlatIndexRetriever embeds the query and materializes documents."""
+        embeddings = Mock()
+        embeddings.embed_query.return_value = [0.0, 1.0, 0.0]
+        retriever = FlatIndexRetriever(self.write_index(tmp_path), embeddings, k=1)
+        
+        docs = retriever.invoke("How often do passwords change?")
+        
+        assert len(docs) == 1
+        assert docs[0].page_content == self.TEXTS[1]
+        assert docs[0].metadata["score"] == pytest.approx(1.0, abs=1e-3)
+    
+    def test_chunk_records_use_slots(self, tmp_path):
+        """Test chunk records are compact slot objects pointing into the text buffer."""
+        index = self.write_index(tmp_path)
+        
+        record = index.get_record(1)
+        
+        assert not hasattr(record, "__dict__")
+        assert record.source == "/docs/it_and_security_policy.txt"
+        assert index.text[record.start:record.end].tobytes().decode("utf-8") == self.TEXTS[1]
+    
+    def test_identical_texts_are_interned(self, tmp_path):
+        """Test duplicate chunk texts share one copy in the text buffer."""
+        texts = ["Shared footer.", "Unique body.", "Shared footer."]
+        metadatas = [{"source": "/docs/a.txt"}, {"source": "/docs/a.txt"}, {"source": "/docs/b.txt"}]
+        index = FlatVectorIndex.write(str(tmp_path / "vectors"), texts, metadatas, np.eye(3))
+        
+        assert index.info["text_bytes"] == len("Shared footer.Unique body.")
+        assert index.get_text(2) == "Shared footer."
+        assert index.get_metadata(2)["source"] == "/docs/b.txt"
+    
+    def test_intern_table_is_bounded(self, tmp_path):
+        """Test the de-duplication table keeps only recent texts, re-storing evicted ones."""
+        texts = ["Footer.", "Body one.", "Footer.", "Body two.", "Body three.", "Footer."]
+        metadatas = [{"source": "/docs/a.txt"}] * len(texts)
+        with FlatIndexWriter(str(tmp_path / "vectors"), max_interned=2) as writer:
+            writer.add(texts, metadatas, np.eye(len(texts)))
+            assert len(writer._interned) == 2
+        index = writer.index
+        
+        # The second "Footer." is a hit; the third was evicted by the two bodies
+        assert index.info["text_bytes"] == len("Footer.Body one.Body two.Body three.Footer.")
+        assert [index.get_text(i) for i in range(len(texts))] == texts
+    
+    def test_int8_search_matches_exact_ranking(self, tmp_path):
+        """Test int8 scanning with float32 rescoring keeps the exact top-k."""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 64)).astype(np.float32)
+        texts = [f"chunk {i}" for i in range(500)]
+        metadatas = [{"source": "/docs/a.txt"}] * 500
+        exact = FlatVectorIndex.write(str(tmp_path / "exact"), texts, metadatas, vectors, dtype="float32")
+        quantized = FlatVectorIndex.write(
+            str(tmp_path / "int8"), texts, metadatas, vectors, dtype="float16", quantization="int8"
+        )
+        
+        for query in rng.normal(size=(10, 64)):
+            expected = [chunk_id for chunk_id, _ in exact.search(query, k=5)]
+            assert [chunk_id for chunk_id, _ in quantized.search(query, k=5)] == expected
+        
+        # float16 vectors plus int8 codes still take less space than float32 vectors
+        assert quantized.vectors.nbytes + quantized.codes.nbytes < exact.vectors.nbytes
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_indexer_reuses_mapped_index(self, mock_embeddings, tmp_path):
+        """Test the mmap backend only embeds documents when the corpus changes."""
+        from langchain_core.documents import Document
+        
+        docs = [Document(page_content="Annual leave is 20 days.", metadata={"source": "/docs/leave_policy.txt"})]
+        mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[1.0, 0.0]] * len(texts)
+        indexer = DocumentIndexer("test_path", cache_dir=str(tmp_path), vector_store="mmap")
+        
+        indexer.create_vectorstore(docs)
+        index = indexer.create_vectorstore(docs)
+        
+        assert isinstance(index, FlatVectorIndex)
+        assert mock_embeddings.return_value.embed_documents.call_count == 1
+        assert isinstance(indexer.get_retriever(k=2), FlatIndexRetriever)
+        assert set(indexer.build_route_centroids()) == {"leave_policy.txt"}
+        
+        docs[0].page_content = "Annual leave is 25 days."
+        indexer.create_vectorstore(docs)
+        assert mock_embeddings.return_value.embed_documents.call_count == 2
+
+
+class TestANNSearch:
+    """Test cases for the ANN search backends."""
+    
+    @pytest.fixture
+    def index(self, tmp_path):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(400, 16)).astype(np.float32)
+        texts = [f"chunk {i}" for i in range(400)]
+        return FlatVectorIndex.write(str(tmp_path / "vectors"), texts, [{"source": "/docs/a.txt"}] * 400, vectors)
+    
+    def test_kmeans_returns_unit_centroids(self):
+        """Test k-means produces one normalized centroid per cluster."""
+        vectors = np.eye(4, dtype=np.float32).repeat(5, axis=0)
+        
+        centroids = kmeans(vectors, 4)
+        
+        assert centroids.shape == (4, 4)
+        np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-6)
+    
+    def test_ivf_probing_all_lists_is_exact(self, index):
+        """Test IVF equals exact search when every list is probed."""
+        ivf = build_searcher(index, "ivf", {"nlist": 10, "nprobe": 10})
+        query = np.random.default_rng(1).normal(size=16)
+        
+        assert [i for i, _ in ivf.search(query, 5)] == [i for i, _ in index.search(query, 5)]
+    
+    def test_ivf_lists_are_persisted(self, index):
+        """Test IVF lists are saved next to the index and reused."""
+        build_searcher(index, "ivf", {"nlist": 10})
+        
+        with patch('src.ann.kmeans') as mock_kmeans:
+            ivf = build_searcher(index, "ivf", {"nlist": 10, "nprobe": 2})
+        
+        assert (index.index_dir / "ivf-10.npz").exists()
+        mock_kmeans.assert_not_called()
+        assert len(ivf.search(np.ones(16), 3)) == 3
+    
+    def test_ivf_reopens_when_nlist_exceeds_chunks(self, tmp_path):
+        """Test saved lists with fewer clusters than configured reopen and search."""
+        vectors = np.random.default_rng(3).normal(size=(10, 16)).astype(np.float32)
+        small = FlatVectorIndex.write(
+            str(tmp_path / "small"), [f"chunk {i}" for i in range(10)], [{"source": "/docs/a.txt"}] * 10, vectors
+        )
+        build_searcher(small, "ivf", {"nlist": 16, "nprobe": 16})
+        
+        reopened = build_searcher(small, "ivf", {"nlist": 16, "nprobe": 16}, build=False)
+        
+        assert reopened.nlist == 10
+        assert [i for i, _ in reopened.search(vectors[4], 3)] == [i for i, _ in small.search(vectors[4], 3)]
+    
+    def test_hnsw_recall(self, index):
+        """Test the HNSW backend finds the exact neighbours on a small index."""
+        pytest.importorskip("hnswlib")
+        hnsw = build_searcher(index, "hnsw", {"ef": 100})
+        query = np.random.default_rng(2).normal(size=16)
+        
+        assert [i for i, _ in hnsw.search(query, 5)] == [i for i, _ in index.search(query, 5)]
+    
+    def test_unknown_backend(self, index):
+        """Test an unknown backend name is rejected."""
+        with pytest.raises(ValueError):
+            build_searcher(index, "lsh")
+    
+    def test_retriever_uses_searcher(self, index):
+        """Test FlatIndexRetriever delegates to the configured searcher."""
+        searcher = Mock()
+        searcher.search.return_value = [(7, 0.9)]
+        embeddings = Mock()
+        embeddings.embed_query.return_value = [0.0] * 16
+        
+        docs = FlatIndexRetriever(index, embeddings, k=1, searcher=searcher).invoke("query")
+        
+        assert docs[0].page_content == "chunk 7"
+        searcher.search.assert_called_once()
+
+
+class TestStreamingIngest:
+    """Test cases for streaming document ingest."""
+    
+    def make_corpus(self, root):
+        (root / "policies" / "archive").mkdir(parents=True)
+        (root / "policies" / "leave_policy.txt").write_text("Leave Policy\n\nAnnual leave is 20 days.", encoding="utf-8")
+        (root / "policies" / "remote.md").write_text("# Remote Work\n\nWork from home twice a week.", encoding="utf-8")
+        (root / "policies" / "archive" / "old_leave.txt").write_text("Old Leave Policy\n\nAnnual leave was 15 days.", encoding="utf-8")
+        (root / "policies" / "logo.png").write_bytes(b"\x89PNG")
+        return root / "policies"
+    
+    def test_discover_files_recursive(self, tmp_path):
+        """Test discovery walks subdirectories in a stable order and filters extensions."""
+        root = self.make_corpus(tmp_path)
+        
+        names = [path.name for path in discover_files(str(root))]
+        flat = [path.name for path in discover_files(str(root), recursive=False)]
+        
+        assert names == ["leave_policy.txt", "remote.md", "old_leave.txt"]
+        assert flat == ["leave_policy.txt", "remote.md"]
+    
+    def test_read_documents_preserves_order(self, tmp_path):
+        """Test threaded reads yield documents in discovery order."""
+        root = self.make_corpus(tmp_path)
+        paths = list(discover_files(str(root)))
+        
+        docs = list(read_documents(paths, max_workers=2))
+        
+        assert [doc.metadata["source"] for doc in docs] == [str(path) for path in paths]
+        assert docs[1].page_content.startswith("# Remote Work")
+    
+    def test_missing_optional_parser_is_skipped(self, tmp_path):
+        """Test files whose loader dependency is missing are skipped with a warning."""
+        path = tmp_path / "handbook.pdf"
+        path.write_bytes(b"%PDF-1.4")
+        
+        with patch.dict(LOADERS, {".pdf": Mock(side_effect=ModuleNotFoundError("No module", name="pypdf"))}):
+            assert list(read_documents([path])) == []
+    
+    def test_batched(self):
+        """Test batching groups items without dropping the remainder."""
+        assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    
+    @patch('src.indexing.Chroma')
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_chroma_index_is_built_in_batches(self, mock_embeddings, mock_chroma, tmp_path):
+        """Test chunks are added to Chroma batch by batch while the manifest is collected."""
+        root = self.make_corpus(tmp_path)
+        indexer = DocumentIndexer(str(root), chunk_size=30, chunk_overlap=0, ingest_batch_size=2)
+        
+        indexer.create_vectorstore()
+        
+        batches = [call.args[0] for call in mock_chroma.return_value.add_documents.call_args_list]
+        assert all(len(batch) <= 2 for batch in batches)
+        assert len(batches) > 1
+        assert [entry["file_name"] for entry in indexer.manifest] == [
+            "archive/old_leave.txt", "leave_policy.txt", "remote.md"
+        ]
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_mmap_index_streams_from_directory(self, mock_embeddings, tmp_path):
+        """Test the mmap index is written incrementally from a streamed corpus."""
+        root = self.make_corpus(tmp_path)
+        mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[1.0, 0.0]] * len(texts)
+        indexer = DocumentIndexer(
+            str(root), chunk_size=30, chunk_overlap=0, cache_dir=str(tmp_path / "cache"),
+            vector_store="mmap", ingest_batch_size=1
+        )
+        
+        index = indexer.create_vectorstore()
+        
+        batch_sizes = [len(call.args[0]) for call in mock_embeddings.return_value.embed_documents.call_args_list]
+        assert batch_sizes == [1] * len(index)
+        assert len(index.sources) == 3
+        assert len(indexer.manifest) == 3
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_same_file_name_in_two_folders_routes_separately(self, mock_embeddings, tmp_path):
+        """Test manifest entries and centroids are keyed by the path relative to documents_path."""
+        root = tmp_path / "policies"
+        for region in ("us", "in"):
+            (root / region).mkdir(parents=True)
+            (root / region / "leave_policy.txt").write_text(f"Leave Policy {region.upper()}\n\n{region} leave.")
+        mock_embeddings.return_value.embed_documents.side_effect = (
+            lambda texts: [[1.0, 0.0] if "us" in text.lower() else [0.0, 1.0] for text in texts]
+        )
+        
+        for vector_store in ("mmap", "chroma"):
+            indexer = DocumentIndexer(str(root), cache_dir=str(tmp_path / vector_store), vector_store=vector_store)
+            if vector_store == "chroma":
+                indexer.vectorstore = Mock()
+                indexer.vectorstore.get.return_value = {
+                    "embeddings": [[1.0, 0.0], [0.0, 1.0]],
+                    "metadatas": [
+                        {"source": str(root / "us" / "leave_policy.txt")},
+                        {"source": str(root / "in" / "leave_policy.txt")}
+                    ]
+                }
+                indexer.manifest = indexer.build_manifest(indexer.iter_documents())
+            
+            manifest, centroids = indexer.build_routing_targets()
+            
+            assert [entry["file_name"] for entry in manifest] == ["in/leave_policy.txt", "us/leave_policy.txt"]
+            np.testing.assert_allclose(centroids["us/leave_policy.txt"], [1.0, 0.0], atol=1e-6)
+            np.testing.assert_allclose(centroids["in/leave_policy.txt"], [0.0, 1.0], atol=1e-6)
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_concurrent_builders_embed_once(self, mock_embeddings, tmp_path):
+        """Test indexers racing on a missing index build it once; the others map the result."""
+        import threading
+        import time
+        
+        root = self.make_corpus(tmp_path)
+        
+        def embed(texts):
+            time.sleep(0.02)
+            return [[1.0, 0.0]] * len(texts)
+        
+        mock_embeddings.return_value.embed_documents.side_effect = embed
+        indexers = [
+            DocumentIndexer(str(root), chunk_size=30, chunk_overlap=0, cache_dir=str(tmp_path / "cache"), vector_store="mmap")
+            for _ in range(4)
+        ]
+        start = threading.Barrier(len(indexers))
+        
+        def build(indexer):
+            start.wait()
+            indexer.create_vectorstore()
+        
+        threads = [threading.Thread(target=build, args=(indexer,)) for indexer in indexers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert all(len(indexer.vectorstore) == len(indexers[0].vectorstore) > 0 for indexer in indexers)
+        embedded = sum(len(call.args[0]) for call in mock_embeddings.return_value.embed_documents.call_args_list)
+        assert embedded == len(indexers[0].vectorstore)
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_load_vectorstore_never_builds(self, mock_embeddings, tmp_path):
+        """Test loading only maps an up-to-date index and its saved ANN lists."""
+        root = self.make_corpus(tmp_path)
+        mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[1.0, 0.0]] * len(texts)
+        
+        def make_indexer():
+            return DocumentIndexer(
+                str(root), chunk_size=30, chunk_overlap=0, cache_dir=str(tmp_path / "cache"),
+                vector_store="mmap", ann_backend="ivf", ann_params={"nlist": 2}
+            )
+        
+        assert make_indexer().load_vectorstore() is None
+        assert not (tmp_path / "cache" / "vectors").exists()
+        
+        make_indexer().create_vectorstore()
+        embed_calls = mock_embeddings.return_value.embed_documents.call_count
+        indexer = make_indexer()
+        index = indexer.load_vectorstore()
+        
+        assert isinstance(index, FlatVectorIndex) and indexer.searcher.backend == "ivf"
+        assert mock_embeddings.return_value.embed_documents.call_count == embed_calls
+        
+        (root / "remote.md").write_text("# Remote\n\nRemote work needs approval.")
+        assert make_indexer().load_vectorstore() is None
+        assert mock_embeddings.return_value.embed_documents.call_count == embed_calls
+
+
+class TestTokenChunker:
+    """Test cases for the token-aware chunker."""
+    
+    TEXT = (
+        "Leave Policy\n\n"
+        "Annual leave is twenty days per year. Unused days expire in March.\n\n"
+        "Sick leave needs a doctor’s note after two days. Notify your manager early."
+    )
+    
+    def make_chunker(self, chunk_tokens=12, overlap_tokens=2):
+        chunker = TokenChunker.__new__(TokenChunker)
+        chunker.chunk_tokens, chunker.overlap_tokens, chunker.min_fill = chunk_tokens, overlap_tokens, 0.5
+        chunker.encoding = None
+        return chunker
+    
+    def test_fallback_offsets_match_regex(self):
+        """Test the vectorized fallback tokenizer matches the regex definition."""
+        text = "Héllo, wörld! foo_bar 12.5% – ’quoted’ 日本語\n\n  end."
+        
+        expected = [m.start() for m in FALLBACK_TOKEN_PATTERN.finditer(text)]
+        
+        assert fallback_token_offsets(text).tolist() == expected
+    
+    def test_tiktoken_offsets_map_bytes_to_characters(self):
+        """Test token byte lengths are converted to character offsets."""
+        chunker = self.make_chunker()
+        chunker.encoding = Mock()
+        chunker.encoding.encode_ordinary.return_value = [1, 2, 3, 4]
+        # "é" is split across two tokens, as byte-level BPE can do
+        chunker.encoding.decode_tokens_bytes.return_value = [b"h", b"\xc3", b"\xa9llo", b" w\xc3\xb6rld"]
+        
+        assert chunker.token_offsets("héllo wörld").tolist() == [0, 1, 1, 5]
+    
+    def test_chunks_respect_budget_and_spans(self):
+        """Test chunks stay within the token budget and record their character span."""
+        chunker = self.make_chunker()
+        doc = Mock(page_content=self.TEXT, metadata={"source": "/docs/leave_policy.txt"})
+        
+        chunks = chunker.split_documents([doc])
+        
+        assert len(chunks) > 1
+        for chunk in chunks:
+            assert chunker.count_tokens(chunk.page_content) <= 12
+            start = chunk.metadata["start_index"]
+            assert self.TEXT[start:start + len(chunk.page_content)] == chunk.page_content
+            assert chunk.metadata["source"] == "/docs/leave_policy.txt"
+    
+    def test_prefers_paragraph_and_sentence_breaks(self):
+        """Test chunks end at a paragraph or sentence break when one is in range."""
+        paragraph = self.make_chunker(chunk_tokens=16, overlap_tokens=0).split_text(self.TEXT)
+        sentence = self.make_chunker(chunk_tokens=12, overlap_tokens=0).split_text(self.TEXT)
+        
+        first_paragraph = "Leave Policy\n\nAnnual leave is twenty days per year. Unused days expire in March.\n\n"
+        assert self.TEXT[paragraph[0][0]:paragraph[0][1]] == first_paragraph
+        assert self.TEXT[sentence[0][0]:sentence[0][1]] == "Leave Policy\n\nAnnual leave is twenty days per year. "
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_indexer_uses_token_chunker(self, mock_embeddings):
+        """Test the indexer switches to the token chunker when configured."""
+        indexer = DocumentIndexer("test_path", chunker="token", chunk_tokens=64, chunk_overlap_tokens=8)
+        
+        splitter = indexer._make_splitter()
+        
+        assert isinstance(splitter, TokenChunker)
+        assert splitter.chunk_tokens == 64
+        
+        # Defaults match the notebook's from_tiktoken_encoder(chunk_size=200, chunk_overlap=20)
+        default = DocumentIndexer("test_path", chunker="token")._make_splitter()
+        assert (default.chunk_tokens, default.overlap_tokens) == (200, 20)
+
+
+class TestMultiRepresentationIndex:
+    """Test cases for section summaries with parent section retrieval."""
+    
+    TEXT = (
+        "Uptiq - Leave Policy\n\nThis policy covers paid time off.\n\n"
+        "1. Annual Leave\n   - Employees get 18 paid days per year.\n   - Apply 7 days in advance.\n\n"
+        "2. Sick Leave\n   - Employees get 10 sick days.\n   - A note is needed after 2 days.\n"
+    )
+    
+    def make_docs(self):
+        from langchain_core.documents import Document
+        
+        return [Document(page_content=self.TEXT, metadata={"source": "/docs/leave_policy.txt"})]
+    
+    def test_section_chunker_splits_at_headings(self):
+        """Test sections start at heading lines and keep their heading."""
+        sections = SectionChunker().split_documents(self.make_docs())
+        
+        assert [section.metadata["section"] for section in sections] == ["", "Annual Leave", "Sick Leave"]
+        assert sections[1].page_content.startswith("1. Annual Leave")
+        assert self.TEXT[sections[2].metadata["start_index"]:].startswith("2. Sick Leave")
+        assert all(section.metadata["title"] == "Uptiq - Leave Policy" for section in sections)
+    
+    def test_long_sections_split_at_paragraphs(self):
+        """Test sections over the size limit are split at paragraph breaks."""
+        text = "1. Benefits\n" + "\n\n".join(["Paragraph text here."] * 10)
+        
+        spans = SectionChunker(max_chars=60).split_text(text)
+        
+        assert len(spans) > 1
+        assert all(end - start <= 60 for start, end, _ in spans)
+        assert all(heading == "Benefits" for _, _, heading in spans)
+    
+    def test_extractive_summary_cuts_at_sentence(self):
+        """Test extractive summaries stop at a sentence boundary within the limit."""
+        summary = extractive_summary("- Employees get 18 days. Apply early. Carry over is capped at 6.", max_chars=40)
+        
+        assert summary == "Employees get 18 days. Apply early."
+    
+    def test_llm_summaries_are_cached(self, tmp_path):
+        """Test LLM summaries are generated once per distinct text and reused across runs."""
+        calls = []
+        
+        def fake_llm(prompt_value):
+            calls.append(prompt_value)
+            return "summary"
+        
+        cache_path = str(tmp_path / "summaries.json")
+        Summarizer("llm", llm=RunnableLambda(fake_llm), cache_path=cache_path).summarize(["a", "b"])
+        summaries = Summarizer("llm", llm=RunnableLambda(fake_llm), cache_path=cache_path).summarize(["a", "b", "c"])
+        
+        assert summaries == ["summary"] * 3
+        assert len(calls) == 3
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_mmap_sections_embed_summaries_and_return_sections(self, mock_embeddings, tmp_path):
+        """Test section mode embeds summaries but retrieves the full section text."""
+        embedded = []
+        mock_embeddings.return_value.embed_documents.side_effect = (
+            lambda texts: embedded.extend(texts) or [[float(i == j) for j in range(3)] for i in range(len(texts))]
+        )
+        mock_embeddings.return_value.embed_query.return_value = [0.0, 0.0, 1.0]
+        indexer = DocumentIndexer("test_path", cache_dir=str(tmp_path), vector_store="mmap", index_mode="sections")
+        
+        indexer.create_vectorstore(self.make_docs())
+        docs = indexer.get_retriever(k=1).invoke("How many sick days?")
+        
+        assert embedded[2].startswith("Uptiq - Leave Policy - Sick Leave: ")
+        assert "Employees get 10 sick days." in embedded[2]
+        assert docs[0].page_content.startswith("2. Sick Leave")
+        assert "A note is needed after 2 days." in docs[0].page_content
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_chroma_sections_use_docstore(self, mock_embeddings):
+        """Test the Chroma backend maps matching summaries back to their sections."""
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        
+        mock_embeddings.return_value = DeterministicFakeEmbedding(size=8)
+        indexer = DocumentIndexer("test_path", index_mode="sections")
+        
+        indexer.create_vectorstore(self.make_docs())
+        docs = indexer.get_retriever(k=3).invoke("sick leave")
+        
+        assert len(indexer.docstore.store) == 3
+        assert {doc.metadata["section"] for doc in docs} == {"", "Annual Leave", "Sick Leave"}
+        assert all("doc_id" not in doc.metadata for doc in docs)
+
+
+class TestRaptorTree:
+    """Test cases for the RAPTOR summary tree."""
+    
+    TOPICS = ["leave", "salary", "travel"]
+    
+    def embed(self, texts):
+        """Embed texts by the topic words they mention."""
+        return [[float(text.count(topic)) + 0.01 for topic in self.TOPICS] for text in texts]
+    
+    def make_leaves(self):
+        texts = [f"Rule {i} about {topic}." for topic in self.TOPICS for i in range(4)]
+        metadatas = [{"source": f"/docs/{topic}.txt"} for topic in self.TOPICS for _ in range(4)]
+        return texts, metadatas, np.array(self.embed(texts))
+    
+    def make_embeddings(self):
+        embeddings = Mock()
+        embeddings.embed_documents.side_effect = self.embed
+        embeddings.embed_query.side_effect = lambda text: self.embed([text])[0]
+        return embeddings
+    
+    def test_cluster_vectors_partitions_rows(self):
+        """Test clusters cover every row once, including two-stage clustering."""
+        vectors = np.random.default_rng(0).normal(size=(2000, 8)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        
+        groups = cluster_vectors(vectors, branching=6)
+        
+        assert np.array_equal(np.sort(np.concatenate(groups)), np.arange(2000))
+        assert 150 < len(groups) < 500
+    
+    def test_build_clusters_by_topic(self):
+        """Test leaves on the same topic share a parent summary."""
+        texts, metadatas, vectors = self.make_leaves()
+        
+        tree = RaptorTree.build(texts, metadatas, vectors, self.make_embeddings(), Summarizer(), branching=4)
+        
+        parents = [i for i in range(len(tree)) if tree.levels[i] == 1]
+        assert sorted(sorted(tree.children[i]) for i in parents) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+        assert {tree.metadatas[i]["sources"] for i in parents} == {"leave.txt", "salary.txt", "travel.txt"}
+    
+    def test_collapsed_and_tree_search(self, tmp_path):
+        """Test both retrieval modes on a saved and reloaded tree."""
+        texts, metadatas, vectors = self.make_leaves()
+        tree = RaptorTree.build(texts, metadatas, vectors, self.make_embeddings(), Summarizer(), branching=4)
+        tree.save(str(tmp_path))
+        loaded = RaptorTree.load(str(tmp_path))
+        
+        collapsed = RaptorRetriever(loaded, self.make_embeddings(), k=5).invoke("salary")
+        top_down = RaptorRetriever(loaded, self.make_embeddings(), k=5, mode="tree").invoke("salary")
+        
+        assert len(loaded) == len(tree)
+        assert all("salary" in doc.page_content for doc in collapsed)
+        assert any(doc.metadata.get("raptor_level") == 1 for doc in top_down)
+        assert all("salary" in doc.page_content for doc in top_down)
+    
+    def test_llm_cluster_summaries_resume_from_cache(self, tmp_path):
+        """Test a rebuild forms the same clusters and reuses their cached summaries."""
+        calls = []
+        
+        def fake_llm(prompt_value):
+            calls.append(prompt_value)
+            return "leave salary travel"
+        
+        texts, metadatas, vectors = self.make_leaves()
+        cache_path = str(tmp_path / "raptor.json")
+        for _ in range(2):
+            summarizer = Summarizer("llm", llm=RunnableLambda(fake_llm), cache_path=cache_path)
+            RaptorTree.build(texts, metadatas, vectors, self.make_embeddings(), summarizer, branching=4)
+        
+        assert len(calls) == 3
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_indexer_persists_tree(self, mock_embeddings, tmp_path):
+        """Test the indexer builds the tree once and reloads it from cache_dir."""
+        from langchain_core.documents import Document
+        
+        mock_embeddings.return_value = self.make_embeddings()
+        docs = [
+            Document(page_content=f"{topic} policy. " * 30, metadata={"source": f"/docs/{topic}.txt"})
+            for topic in self.TOPICS
+        ]
+        
+        for _ in range(2):
+            indexer = DocumentIndexer(
+                "test_path", cache_dir=str(tmp_path), vector_store="mmap", raptor_mode="collapsed", raptor_branching=4
+            )
+            indexer.create_vectorstore(docs)
+            retriever = indexer.get_retriever(k=2)
+        
+        assert isinstance(retriever, RaptorRetriever)
+        assert (tmp_path / "raptor" / "nodes.json").exists()
+        assert len(retriever.tree) > len(indexer.vectorstore)
+        assert mock_embeddings.return_value.embed_documents.call_count == 1 + indexer.raptor_tree.depth
+
+
+class WordTokenEncoder:
+    """Token encoder with one fixed random vector per word."""
+    
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+        self.vocab = {}
+        self.rng = np.random.default_rng(0)
+        
+    def encode(self, texts):
+        return [np.array([self.vector(word) for word in text.lower().split()]).reshape(-1, self.dim) for text in texts]
+        
+    def encode_query(self, text):
+        return self.encode([text])[0]
+        
+    def vector(self, word):
+        if word not in self.vocab:
+            self.vocab[word] = self.rng.normal(size=self.dim).astype(np.float32)
+        return self.vocab[word]
+
+
+class TestLateInteraction:
+    """Test cases for ColBERT-style late-interaction retrieval."""
+    
+    TEXTS = [
+        "employees get eighteen annual leave days per year",
+        "sick leave needs a medical note after two days",
+        "salary is paid on the last working day",
+        "passwords must be rotated every ninety days",
+        "remote work requires manager approval",
+    ] * 20
+    
+    def build(self, tmp_path, n_centroids=16):
+        encoder = WordTokenEncoder()
+        index = LateInteractionIndex.write(str(tmp_path / "li"), encoder.encode(self.TEXTS), n_centroids=n_centroids)
+        return index, encoder
+    
+    def test_decompressed_tokens_match_originals(self, tmp_path):
+        """Test centroid plus int8 residual reconstructs the token embeddings."""
+        index, encoder = self.build(tmp_path)
+        original = np.concatenate(encoder.encode(self.TEXTS))
+        original /= np.linalg.norm(original, axis=1, keepdims=True)
+        
+        restored = index.decompress(np.arange(index.n_tokens))
+        
+        assert index.n_tokens == len(original)
+        assert np.min(np.sum(original * restored, axis=1)) > 0.99
+        assert index.residuals.dtype == np.int8
+    
+    def test_maxsim_search(self, tmp_path):
+        """Test MaxSim finds chunks sharing the query's terms, pruned or not."""
+        index, encoder = self.build(tmp_path)
+        query = encoder.encode_query("medical note for sick leave")
+        
+        pruned = index.search(query, k=3, nprobe=2, candidates=10)
+        exhaustive = index.search(query, k=3, nprobe=0)
+        
+        assert all(chunk_id % 5 == 1 for chunk_id, _ in pruned)
+        assert pruned[0][1] == pytest.approx(exhaustive[0][1])
+        assert exhaustive[0][1] <= 1.0
+    
+    def test_index_reopens_from_disk(self, tmp_path):
+        """Test a written index can be reopened by another worker."""
+        index, encoder = self.build(tmp_path)
+        
+        reopened = LateInteractionIndex(str(tmp_path / "li"))
+        
+        assert len(reopened) == len(self.TEXTS)
+        assert reopened.search(encoder.encode_query("salary paid"), k=1)[0][0] % 5 == 2
+    
+    @patch('src.indexing.HuggingFaceEmbeddings')
+    def test_indexer_late_interaction_retriever(self, mock_embeddings, tmp_path):
+        """Test the indexer serves late-interaction results from the mmap store."""
+        from langchain_core.documents import Document
+        
+        mock_embeddings.return_value.embed_documents.side_effect = lambda texts: [[1.0, 0.0]] * len(texts)
+        docs = [Document(page_content=text, metadata={"source": f"/docs/{i}.txt"}) for i, text in enumerate(self.TEXTS[:5])]
+        indexer = DocumentIndexer(
+            "test_path",
+            cache_dir=str(tmp_path),
+            vector_store="mmap",
+            late_interaction=True,
+            token_encoder=WordTokenEncoder()
+        )
+        indexer.create_vectorstore(docs)
+        
+        retriever = indexer.get_retriever(k=1)
+        results = retriever.similarity_search_with_score("password rotated every ninety days")
+        
+        assert isinstance(retriever, LateInteractionRetriever)
+        assert results[0][0].page_content == self.TEXTS[3]
+        assert results[0][0].metadata["source"] == "/docs/3.txt"
 
 
 class TestQueryTransformer:
@@ -71,6 +891,513 @@ class TestQueryTransformer:
         
         assert len(queries) == 3
         assert "Query 1" in queries
+    
+    def test_list_output_is_cleaned_and_bounded(self):
+        """Test preambles, numbering, blanks and duplicates never become searches."""
+        output = (
+            "Here are four search queries:\n\n1. Annual leave days\n2) annual  leave DAYS\n"
+            "- **Sick leave rules**\nQuery 4: \"Leave carry forward\"\n5. Leave encashment\n"
+        )
+        transformer = QueryTransformer(RunnableLambda(lambda prompt_value: output))
+        
+        queries = transformer.rag_fusion_generation("leave?", num_queries=3)
+        
+        assert queries == ["Annual leave days", "Sick leave rules", "Leave carry forward"]
+        assert transformer.structured_output is False
+    
+    def test_near_identical_queries_are_dropped(self):
+        """Test queries with nearly the same embedding are searched once."""
+        vectors = {"Annual leave": [1.0, 0.0], "Yearly leave": [0.99, 0.05], "Sick leave": [0.0, 1.0]}
+        embeddings = Mock()
+        embeddings.embed_documents.side_effect = lambda texts: [vectors[text] for text in texts]
+        transformer = QueryTransformer(
+            RunnableLambda(lambda prompt_value: "Annual leave\nYearly leave\nSick leave"),
+            embeddings=embeddings
+        )
+        
+        assert transformer.decomposition("leave?") == ["Annual leave", "Sick leave"]
+    
+    def test_structured_output_is_preferred(self):
+        """Test chat models with structured output skip text parsing."""
+        from src.query_transform import QueryList
+        
+        llm = Mock()
+        llm.with_structured_output.return_value = RunnableLambda(
+            lambda prompt_value: QueryList(queries=["Annual leave", "", "Sick leave", "Maternity leave"])
+        )
+        transformer = QueryTransformer(llm)
+        
+        queries = transformer.multi_query_generation("leave?", num_queries=2)
+        
+        assert queries == ["Annual leave", "Sick leave"]
+        assert transformer.structured_output is True
+        llm.with_structured_output.assert_called_once_with(QueryList)
+    
+    def test_rejected_schema_falls_back_to_text_once(self, caplog):
+        """Test a model that rejects the schema is not asked for it on every request."""
+        llm = Mock()
+        llm.with_structured_output.return_value = RunnableLambda(Mock(side_effect=ValueError("tool_use_failed")))
+        text_calls = []
+        llm.side_effect = lambda prompt_value: text_calls.append(prompt_value) or "Annual leave\nSick leave"
+        transformer = QueryTransformer(RunnableLambda(llm))
+        transformer.llm.with_structured_output = llm.with_structured_output
+        
+        with caplog.at_level("WARNING", logger="src.query_transform"):
+            for question in ("leave?", "sick days?", "carry forward?"):
+                assert transformer.multi_query_generation(question) == ["Annual leave", "Sick leave"]
+        
+        assert transformer.structured_output is False
+        llm.with_structured_output.assert_called_once()
+        assert len(text_calls) == 3
+        assert "tool_use_failed" in caplog.text
+    
+    def test_structured_output_survives_transient_failure(self):
+        """Test a model that produced the schema keeps using it after one failure."""
+        from src.query_transform import QueryList
+        
+        replies = iter([QueryList(queries=["Annual leave"]), ValueError("flaky"), QueryList(queries=["Sick leave"])])
+        
+        def structured(prompt_value):
+            reply = next(replies)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+        
+        llm = Mock()
+        llm.with_structured_output.return_value = RunnableLambda(structured)
+        transformer = QueryTransformer(llm)
+        transformer.llm = RunnableLambda(lambda prompt_value: "Maternity leave")
+        transformer.llm.with_structured_output = llm.with_structured_output
+        
+        assert transformer.multi_query_generation("a?") == ["Annual leave"]
+        assert transformer.multi_query_generation("b?") == ["Maternity leave"]
+        assert transformer.multi_query_generation("c?") == ["Sick leave"]
+        assert transformer.structured_output is True
+    
+    def test_query_count_is_part_of_the_cache_key(self, tmp_path):
+        """Test asking for a different number of queries misses the cache."""
+        calls = []
+        
+        def fake_llm(prompt_value):
+            calls.append(prompt_value)
+            return "q1\nq2\nq3"
+        
+        cache = TransformationCache(str(tmp_path / "transformations.sqlite"))
+        transformer = QueryTransformer(RunnableLambda(fake_llm), cache=cache)
+        
+        assert transformer.rag_fusion_generation("leave?", num_queries=2) == ["q1", "q2"]
+        assert transformer.rag_fusion_generation("leave?", 2) == ["q1", "q2"]
+        assert transformer.rag_fusion_generation("leave?", num_queries=3) == ["q1", "q2", "q3"]
+        assert len(calls) == 2
+
+
+def wait_for(condition, timeout=5.0):
+    """Poll until ``condition()`` is true or fail after ``timeout`` seconds."""
+    import time
+    
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+class TestSingleFlight:
+    """Test cases for request coalescing."""
+    
+    def test_concurrent_calls_share_one_execution(self):
+        """Test waiters receive the leader's result without running the work."""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        
+        flight, release, calls = SingleFlight(), threading.Event(), []
+        
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return "answer"
+        
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(flight.do, "q", work) for _ in range(4)]
+            wait_for(lambda: flight.stats()["coalesced"] == 3)
+            release.set()
+            outcomes = [f.result(5) for f in futures]
+        
+        assert len(calls) == 1
+        assert sorted(shared for _, shared in outcomes) == [False, True, True, True]
+        assert all(result == "answer" for result, _ in outcomes)
+        assert flight.stats() == {"executions": 1, "coalesced": 3, "in_flight": 0}
+    
+    def test_errors_reach_every_waiter(self):
+        """Test a failed execution raises in the leader and all waiters."""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        
+        flight, release = SingleFlight(), threading.Event()
+        
+        def work():
+            release.wait(5)
+            raise RuntimeError("rate limited")
+        
+        with ThreadPoolExecutor(3) as pool:
+            futures = [pool.submit(flight.do, "q", work) for _ in range(3)]
+            wait_for(lambda: flight.stats()["coalesced"] == 2)
+            release.set()
+            for future in futures:
+                with pytest.raises(RuntimeError, match="rate limited"):
+                    future.result(5)
+    
+    def test_finished_calls_are_not_reused(self):
+        """Test sequential calls each run, so results are never stale."""
+        flight, calls = SingleFlight(), []
+        
+        for _ in range(2):
+            result, shared = flight.do("q", lambda: calls.append(1) or len(calls))
+        
+        assert (result, shared) == (2, False)
+        assert flight.stats()["executions"] == 2
+
+
+class TestAdmissionController:
+    """Test cases for weighted admission control."""
+    
+    def run(self, coroutine):
+        import asyncio
+        return asyncio.run(coroutine)
+    
+    def test_requests_queue_in_order_until_capacity_frees(self):
+        """Test excess requests wait and are admitted first in, first out."""
+        import asyncio
+        
+        async def scenario():
+            controller = AdmissionController(capacity=2, max_queue=4, queue_timeout=5)
+            release, order = asyncio.Event(), []
+            
+            async def request(name, method):
+                async with controller.admit(method):
+                    order.append(name)
+                    await release.wait()
+            
+            tasks = [asyncio.create_task(request(name, "basic")) for name in ("a", "b", "c", "d")]
+            await asyncio.sleep(0.01)
+            assert order == ["a", "b"] and controller.stats()["queued"] == 2
+            release.set()
+            await asyncio.gather(*tasks)
+            return order, controller.stats()
+        
+        order, stats = self.run(scenario())
+        
+        assert order == ["a", "b", "c", "d"]
+        assert stats["admitted"] == 4 and stats["in_use"] == 0 and stats["queued"] == 0
+        assert stats["queue_time_max"] > 0
+    
+    def test_method_costs_weight_capacity(self):
+        """Test an expensive method holds more capacity than basic retrieval."""
+        async def scenario():
+            controller = AdmissionController(capacity=4, max_queue=0, queue_timeout=5)
+            async with controller.admit("decomposition"):
+                in_use = controller.in_use
+                with pytest.raises(Overloaded) as shed:
+                    async with controller.admit("basic"):
+                        pass
+            return controller, in_use, shed.value
+        
+        controller, in_use, shed = self.run(scenario())
+        
+        assert in_use == 4
+        assert shed.status_code == 429 and shed.retry_after >= 1
+        assert controller.cost("unknown") == 1
+        assert AdmissionController(capacity=2).cost("decomposition") == 2
+    
+    def test_queue_timeout_sheds_with_503(self):
+        """Test a request that waits too long gives up and frees its queue slot."""
+        async def scenario():
+            controller = AdmissionController(capacity=1, max_queue=1, queue_timeout=0.05)
+            async with controller.admit("basic"):
+                with pytest.raises(Overloaded) as shed:
+                    async with controller.admit("basic"):
+                        pass
+                stats = controller.stats()
+            return shed.value, stats
+        
+        shed, stats = self.run(scenario())
+        
+        assert shed.status_code == 503
+        assert stats["queued"] == 0 and stats["rejected_timeout"] == 1
+
+
+class RateLimitError(Exception):
+    """Client error shaped like groq/openai status errors."""
+    
+    def __init__(self, status_code=429, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = Mock(status_code=status_code, headers={"retry-after": retry_after} if retry_after else {})
+
+
+class TestLLMScheduler:
+    """Test cases for rate budgets, retries, deadlines and hedging."""
+    
+    def make_scheduler(self, **kwargs):
+        sleeps = []
+        options = {"requests_per_minute": None, "tokens_per_minute": None, "backoff_base": 0.5, **kwargs}
+        return LLMScheduler(sleep=sleeps.append, **options), sleeps
+    
+    def test_token_bucket_queues_callers_behind_debt(self):
+        """Test reservations beyond the budget wait for the refill rate."""
+        now = [0.0]
+        bucket = TokenBucket(60, clock=lambda: now[0])
+        
+        assert bucket.reserve(60) == 0.0
+        assert bucket.reserve(6) == pytest.approx(6.0)
+        assert not bucket.try_take(1)
+        now[0] = 10.0
+        assert bucket.try_take(4)
+    
+    def test_rate_budget_throttles_bursts(self):
+        """Test calls beyond requests per minute sleep instead of hitting the provider."""
+        scheduler, sleeps = self.make_scheduler(requests_per_minute=2)
+        
+        for _ in range(3):
+            scheduler.call(lambda: "ok")
+        
+        assert len(sleeps) == 1 and sleeps[0] == pytest.approx(30.0, abs=0.5)
+    
+    def test_retryable_errors_back_off_with_jitter(self):
+        """Test 429s are retried, honouring Retry-After, with bounded jittered backoff otherwise."""
+        scheduler, sleeps = self.make_scheduler()
+        errors = [RateLimitError(429, "2"), RateLimitError(503)]
+        
+        def flaky():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+        
+        assert scheduler.call(flaky) == "ok"
+        assert sleeps[0] == 2.0
+        assert 0.0 <= sleeps[1] <= 1.0
+        assert scheduler.stats()["retries"] == 2 and scheduler.stats()["rate_limited"] == 1
+    
+    def test_permanent_errors_are_not_retried(self):
+        """Test client errors and exhausted retries surface to the caller."""
+        scheduler, _ = self.make_scheduler(max_retries=2)
+        
+        with pytest.raises(RateLimitError):
+            scheduler.call(Mock(side_effect=RateLimitError(400)))
+        failing = Mock(side_effect=RateLimitError(429))
+        with pytest.raises(RateLimitError):
+            scheduler.call(failing)
+        
+        assert failing.call_count == 3
+        assert not is_retryable(ValueError("bad prompt"))
+        assert is_retryable(type("APITimeoutError", (Exception,), {})())
+    
+    def test_slow_attempts_time_out(self):
+        """Test an attempt past its deadline is abandoned with LLMTimeout."""
+        import threading
+        
+        scheduler, _ = self.make_scheduler(call_timeout=0.05, max_retries=0)
+        release = threading.Event()
+        
+        with pytest.raises(LLMTimeout):
+            scheduler.call(lambda: release.wait(5))
+        release.set()
+        
+        assert scheduler.stats()["timeouts"] == 1
+    
+    def test_slow_attempts_are_hedged(self):
+        """Test a second attempt starts after hedge_after and the first answer wins."""
+        import threading
+        
+        scheduler, _ = self.make_scheduler(call_timeout=5, hedge_after=0.05)
+        release, calls = threading.Event(), []
+        
+        def request():
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                return "slow"
+            return "fast"
+        
+        assert scheduler.call(request) == "fast"
+        release.set()
+        assert scheduler.stats()["hedges"] == 1 and scheduler.stats()["hedge_wins"] == 1
+    
+    def test_scheduled_llm_wraps_structured_output(self):
+        """Test prompts pipe into the wrapper and structured output stays scheduled."""
+        from langchain_core.prompts import ChatPromptTemplate
+        
+        scheduler, _ = self.make_scheduler()
+        llm = Mock(model_name="stub-model")
+        llm.invoke.return_value = "answer"
+        scheduled = ScheduledLLM(llm, scheduler)
+        
+        assert (ChatPromptTemplate.from_template("{q}") | scheduled).invoke({"q": "hi"}) == "answer"
+        structured = scheduled.with_structured_output(dict)
+        assert isinstance(structured, ScheduledLLM) and structured.scheduler is scheduler
+        assert scheduled.model_name == "stub-model"
+        assert scheduler.stats()["calls"] == 1
+    
+    def test_deadline_caps_attempts_and_skips_retries(self):
+        """Test a call inside a deadline scope gives up at the deadline, not the call timeout."""
+        import threading
+        import time
+        
+        scheduler, sleeps = self.make_scheduler(call_timeout=5, max_retries=3)
+        release = threading.Event()
+        start = time.monotonic()
+        
+        with deadline_scope(start + 0.1):
+            with pytest.raises(DeadlineExceeded):
+                scheduler.call(lambda: release.wait(5))
+            # Nested scopes keep the earlier deadline
+            with deadline_scope(start + 60):
+                with pytest.raises(DeadlineExceeded):
+                    scheduler.call(lambda: "too late")
+        release.set()
+        
+        assert time.monotonic() - start < 1.0
+        assert sleeps == [] and scheduler.stats()["attempts"] == 1
+    
+    def test_rate_wait_past_deadline_fails_fast(self):
+        """Test a call that would wait for budget past its deadline returns the budget and fails."""
+        import time
+        
+        scheduler, sleeps = self.make_scheduler(requests_per_minute=1)
+        scheduler.call(lambda: "ok")
+        
+        with deadline_scope(time.monotonic() + 5):
+            with pytest.raises(DeadlineExceeded):
+                scheduler.call(lambda: "ok")
+        
+        assert sleeps == []
+        assert scheduler.stats()["requests_available"] == pytest.approx(0.0, abs=0.1)
+
+
+class TestHTTPClientPool:
+    """Test cases for the shared LLM connection pool."""
+    
+    def test_shared_pool_per_settings(self):
+        """Test equal settings share one pool and different settings do not."""
+        pool = shared_pool(max_connections=7, max_keepalive_connections=3)
+        
+        assert shared_pool(max_keepalive_connections=3, max_connections=7) is pool
+        assert shared_pool(max_connections=8, max_keepalive_connections=3) is not pool
+        
+    def test_clients_are_lazy_and_reused(self):
+        """Test clients are built on first use, once, with the configured limits."""
+        pool = HTTPClientPool(max_connections=4, max_keepalive_connections=2)
+        assert pool.stats()["open_connections"] == 0
+        
+        client = pool.sync_client
+        assert pool.sync_client is client
+        assert client._transport._pool._max_connections == 4
+        assert client._transport._pool._max_keepalive_connections == 2
+        pool.close()
+        assert pool.sync_client is not client
+        pool.close()
+        
+    def test_http2_without_h2_falls_back(self, capsys):
+        """Test HTTP/2 is only enabled when the h2 package is available."""
+        import importlib.util
+        
+        with patch.object(importlib.util, "find_spec", return_value=None):
+            pool = HTTPClientPool(http2=True)
+        
+        assert pool.http2 is False
+        assert "h2 package is not installed" in capsys.readouterr().out
+        
+    def test_clients_reset_after_fork(self):
+        """Test a forked child does not reuse the parent's connections."""
+        pool = HTTPClientPool()
+        client = pool.sync_client
+        
+        with patch("src.http_pool.os.getpid", return_value=-1):
+            assert pool.sync_client is not client
+        client.close()
+        pool.close()
+
+
+class TestTransformationCache:
+    """Test cases for the persistent transformation cache."""
+    
+    def make_transformer(self, tmp_path, calls, max_entries=100):
+        def fake_llm(prompt_value):
+            calls.append(prompt_value)
+            return "What is the leave policy?"
+        
+        cache = TransformationCache(str(tmp_path / "transformations.sqlite"), max_entries=max_entries)
+        return QueryTransformer(RunnableLambda(fake_llm), cache=cache)
+    
+    def test_repeated_questions_skip_the_llm(self, tmp_path):
+        """Test identical and trivially different questions are served from the cache."""
+        calls = []
+        transformer = self.make_transformer(tmp_path, calls)
+        
+        first = transformer.step_back_prompting("Can I carry forward leave?")
+        second = transformer.step_back_prompting("  can I  carry forward LEAVE?")
+        
+        assert first == second == "What is the leave policy?"
+        assert len(calls) == 1
+        assert transformer.cache.stats()["hits"] == 1
+    
+    def test_cache_is_shared_across_instances(self, tmp_path):
+        """Test outputs persist on disk for other workers and restarts."""
+        calls = []
+        self.make_transformer(tmp_path, calls).hyde_generation("sick leave rules")
+        
+        transformer = self.make_transformer(tmp_path, calls)
+        transformer.hyde_generation("sick leave rules")
+        
+        assert len(calls) == 1
+    
+    def test_prompt_version_and_method_are_part_of_the_key(self, tmp_path):
+        """Test a changed prompt or a different method misses the cache."""
+        calls = []
+        transformer = self.make_transformer(tmp_path, calls)
+        transformer.step_back_prompting("q")
+        transformer.hyde_generation("q")
+        
+        with patch.dict(QueryTransformer.PROMPT_VERSIONS, {"step_back": 2}):
+            transformer.step_back_prompting("q")
+        
+        assert len(calls) == 3
+    
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        """Test the cache stays within max_entries and keeps recently used entries."""
+        cache = TransformationCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+        cache.put("hyde", "a", "m", 1, "A")
+        cache.put("hyde", "b", "m", 1, "B")
+        cache.get("hyde", "a", "m", 1)
+        cache.put("hyde", "c", "m", 1, "C")
+        
+        assert cache.get("hyde", "a", "m", 1) == "A"
+        assert cache.get("hyde", "b", "m", 1) is None
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["evictions"] == 1
+    
+    def test_hyde_embedding_hit_skips_llm_and_embedding(self, tmp_path):
+        """Test a repeated HyDE question is served as a vector from the cache."""
+        calls = []
+        embeddings = Mock()
+        embeddings.embed_query.return_value = [0.6, 0.8, 0.0]
+        
+        first = self.make_transformer(tmp_path, calls).hyde_embedding("Sick leave?", embeddings, "minilm")
+        passage, vector = self.make_transformer(tmp_path, calls).hyde_embedding("sick leave?", embeddings, "minilm")
+        
+        assert passage == first[0] == "What is the leave policy?"
+        assert vector.dtype == np.float32
+        np.testing.assert_allclose(vector, [0.6, 0.8, 0.0], atol=1e-6)
+        assert len(calls) == 1
+        assert embeddings.embed_query.call_count == 1
+    
+    def test_hyde_embedding_averages_with_question(self, tmp_path):
+        """Test averaging combines the unit passage and question vectors."""
+        embeddings = Mock()
+        embeddings.embed_query.side_effect = lambda text: [2.0, 0.0] if text == "q" else [0.0, 3.0]
+        
+        _, vector = self.make_transformer(tmp_path, []).hyde_embedding("q", embeddings, "m", average_with_query=True)
+        
+        np.testing.assert_allclose(vector, [0.5, 0.5], atol=1e-6)
 
 
 class TestDocumentReranker:
@@ -110,6 +1437,27 @@ class TestDocumentReranker:
         
         # Should have unique documents
         assert len(unique_docs) <= 3  # At most 3 unique docs
+    
+    def test_unique_union_is_ranked_and_stable(self):
+        """Test the union dedupes across query scores and puts consensus chunks first."""
+        from langchain_core.documents import Document
+        
+        def doc(text, score):
+            return Document(page_content=text, metadata={"source": "leave_policy.txt", "score": score})
+        
+        documents = [
+            [doc("Sick leave is 10 days.", 0.7), doc("Annual leave is 18 days.", 0.6)],
+            [doc("Annual leave is 18 days.", 0.9), doc("Casual leave is 7 days.", 0.5)],
+        ]
+        
+        unique_docs = DocumentReranker.get_unique_union(documents)
+        
+        assert [d.page_content for d in unique_docs] == [
+            "Annual leave is 18 days.", "Sick leave is 10 days.", "Casual leave is 7 days."
+        ]
+        scores = [d.metadata["score"] for d in unique_docs]
+        assert scores == sorted(scores, reverse=True)
+        assert DocumentReranker.get_unique_union(documents) == unique_docs
 
 
 class TestDocumentRetriever:
@@ -135,6 +1483,33 @@ class TestDocumentRetriever:
         assert len(docs) == 1
         assert docs[0].page_content == "Test content"
     
+    def test_retrieve_by_vector(self, tmp_path):
+        """Test searching with a precomputed embedding skips embedding the query."""
+        embeddings = Mock()
+        index = TestFlatVectorIndex().write_index(tmp_path)
+        retriever = DocumentRetriever(FlatIndexRetriever(index, embeddings, k=1))
+        
+        docs = retriever.retrieve_by_vector([0.0, 1.0, 0.0], k=1)
+        
+        assert docs[0].page_content == TestFlatVectorIndex.TEXTS[1]
+        embeddings.embed_query.assert_not_called()
+    
+    def test_retrieve_by_vector_maps_multi_vector_results(self):
+        """Test summary hits from a multi-vector retriever become their sections."""
+        from langchain_core.documents import Document
+        
+        summary = Document(page_content="summary", metadata={"doc_id": "s1"})
+        section = Document(page_content="full section")
+        base = Mock(spec=["vectorstore", "docstore", "id_key"])
+        base.vectorstore.similarity_search_by_vector.return_value = [summary, summary]
+        base.docstore.mget.return_value = [section]
+        base.id_key = "doc_id"
+        
+        docs = DocumentRetriever(base).retrieve_by_vector([1.0, 0.0], k=2)
+        
+        assert docs == [section]
+        base.docstore.mget.assert_called_once_with(["s1"])
+    
     def test_format_documents(self):
         """Test document formatting."""
         mock_doc1 = Mock()
@@ -171,6 +1546,113 @@ class TestLogicalRouter:
         assert result.file_name == "leave_policy.txt"
 
 
+class TestLogicalRouterLocalMode:
+    """Test cases for manifest-driven and centroid-based logical routing."""
+    
+    MANIFEST = [
+        {"file_name": "leave_policy.txt", "description": "Uptiq - Leave Policy"},
+        {"file_name": "it_and_security_policy.txt", "description": "Uptiq - IT Policy"},
+        {"file_name": "sample_policies.txt", "description": "Example HR Policy Documents"},
+    ]
+    CENTROIDS = {
+        "leave_policy.txt": np.array([1.0, 0.0, 0.0]),
+        "it_and_security_policy.txt": np.array([0.0, 1.0, 0.0]),
+        "sample_policies.txt": np.array([0.0, 0.0, 1.0]),
+    }
+    
+    def _make_router(self, query_vector, llm_calls, mode="local", max_candidates=8):
+        """Build a router with fake embeddings and an LLM that records its schemas."""
+        def structured_output(schema):
+            def fake_llm_route(prompt):
+                llm_calls.append((schema, prompt.to_string()))
+                return schema(file_name=schema.model_fields["file_name"].annotation.__args__[-1])
+            return RunnableLambda(fake_llm_route)
+        
+        mock_llm = Mock()
+        mock_llm.with_structured_output.side_effect = structured_output
+        embeddings = Mock()
+        embeddings.embed_query.return_value = query_vector
+        
+        router = LogicalRouter(
+            mock_llm, embeddings=embeddings, mode=mode,
+            margin_threshold=0.1, max_candidates=max_candidates
+        )
+        router.set_routes(self.MANIFEST, self.CENTROIDS)
+        return router
+    
+    def test_build_route_model_restricts_file_name(self):
+        """Test the generated schema only accepts the given files."""
+        schema = build_route_model(("leave_policy.txt", "sample_policies.txt"))
+        assert schema(file_name="sample_policies.txt").file_name == "sample_policies.txt"
+        with pytest.raises(ValueError):
+            schema(file_name="unknown.txt")
+    
+    def test_route_index_search(self):
+        """Test the route index returns the nearest targets best first."""
+        index = RouteIndex(self.MANIFEST, self.CENTROIDS)
+        hits = index.search([0.1, 0.2, 0.9], k=2)
+        assert [name for name, _ in hits] == ["sample_policies.txt", "it_and_security_policy.txt"]
+        assert index.matrix.dtype == np.float32
+    
+    def test_confident_query_skips_llm(self):
+        """Test a clear centroid winner is returned without an LLM call."""
+        llm_calls = []
+        router = self._make_router([0.9, 0.1, 0.0], llm_calls)
+        
+        details = router.route_with_details("How many sick days do I get?")
+        
+        assert details["method"] == "centroid"
+        assert details["file_name"] == "leave_policy.txt"
+        assert router.route_query("How many sick days do I get?").file_name == "leave_policy.txt"
+        assert llm_calls == []
+    
+    def test_ambiguous_query_falls_back_to_llm(self):
+        """Test a small top-two margin defers to the LLM."""
+        llm_calls = []
+        router = self._make_router([0.7, 0.68, 0.0], llm_calls, max_candidates=2)
+        
+        details = router.route_with_details("Can I use my laptop while on leave?")
+        
+        assert details["method"] == "llm_fallback"
+        assert len(llm_calls) == 1
+        assert details["file_name"] == "it_and_security_policy.txt"
+    
+    def test_llm_mode_offers_only_shortlisted_files(self):
+        """Test the LLM schema and prompt are limited to the shortlist."""
+        llm_calls = []
+        router = self._make_router([0.9, 0.1, 0.0], llm_calls, mode="llm", max_candidates=2)
+        
+        router.route_with_details("How many sick days do I get?")
+        
+        schema, prompt = llm_calls[0]
+        assert schema.model_fields["file_name"].annotation.__args__ == (
+            "leave_policy.txt", "it_and_security_policy.txt"
+        )
+        assert "sample_policies.txt" not in prompt
+        assert "Uptiq - Leave Policy" in prompt
+    
+    def test_without_centroids_prompt_is_bounded(self):
+        """Test a large corpus without centroids is shortlisted by keywords, not listed in full."""
+        llm_calls = []
+        router = self._make_router([0.0, 0.0, 0.0], llm_calls, mode="llm", max_candidates=2)
+        manifest = self.MANIFEST + [
+            {"file_name": f"site_{i}_facilities.txt", "description": f"Facilities at site {i}"} for i in range(50)
+        ]
+        router.set_routes(manifest)
+        
+        details = router.route_with_details("How many days of leave do I get?")
+        
+        assert details["method"] == "keyword_shortlist"
+        schema, prompt = llm_calls[0]
+        assert schema.model_fields["file_name"].annotation.__args__ == ("leave_policy.txt",)
+        assert "site_3_facilities.txt" not in prompt
+        
+        details = router.route_with_details("Who signs off on my expenses?")
+        
+        assert details == {"method": "all_sources", "file_name": ALL_SOURCES}
+        assert len(llm_calls) == 1
+
+
 class TestSemanticRouter:
     """Test cases for SemanticRouter."""
     
@@ -191,6 +1673,48 @@ class TestSemanticRouter:
         assert result["template_name"] in ["hr_template", "it_template", "law_template"]
 
 
+class TestSemanticRouterVectorized:
+    """Test cases for matrix-based semantic routing with fake embeddings."""
+    
+    def _make_router(self):
+        """Build a router whose templates embed to the unit axes."""
+        embeddings = Mock()
+        embeddings.embed_documents.side_effect = lambda texts: (
+            [[2.0, 0.0, 0.0], [0.0, 3.0, 0.0], [0.0, 0.0, 4.0]] if len(texts) == 3 and "{query}" in texts[0]
+            else [[0.0, 1.0, 0.1]] * len(texts)
+        )
+        embeddings.embed_query.side_effect = lambda text: [0.0, 1.0, 0.1]
+        return SemanticRouter(embeddings=embeddings), embeddings
+    
+    def test_template_matrix_is_normalized(self):
+        """Test template embeddings are stored as a unit-norm float32 matrix."""
+        router, _ = self._make_router()
+        assert router.template_matrix.dtype == np.float32
+        np.testing.assert_allclose(np.linalg.norm(router.template_matrix, axis=1), 1.0, rtol=1e-6)
+    
+    def test_route_query_with_precomputed_embedding(self):
+        """Test a shared query vector is used without re-embedding."""
+        router, embeddings = self._make_router()
+        
+        result = router.route_query("Is my laptop encrypted?", query_embedding=[0.1, 0.9, 0.0])
+        
+        assert result["template_name"] == "it_template"
+        embeddings.embed_query.assert_not_called()
+    
+    def test_route_queries_batch(self):
+        """Test many queries are routed in one matrix product, embedded as queries."""
+        router, embeddings = self._make_router()
+        
+        results = router.route_queries(["q1", "q2"], [[1.0, 0.0, 0.0], [0.0, 0.2, 0.9]])
+        assert [r["template_name"] for r in results] == ["hr_template", "law_template"]
+        assert results[0]["similarity_score"] == pytest.approx(1.0)
+        
+        results = router.route_queries(["q3", "q4"])
+        assert [r["template_name"] for r in results] == ["it_template", "it_template"]
+        assert [call.args[0] for call in embeddings.embed_query.call_args_list] == ["q3", "q4"]
+        assert router.route_queries([]) == []
+
+
 class TestResponseGenerator:
     """Test cases for ResponseGenerator."""
     
@@ -227,6 +1751,89 @@ class TestResponseGenerator:
         assert "Answer 2: A2" in formatted
 
 
+class TestContextBuilder:
+    """Test cases for token-budgeted context packing."""
+    
+    TEXT = "Annual leave is 18 days. Sick leave is 10 days. Casual leave is 7 days per year."
+    
+    def _chunk(self, start, end, source="leave_policy.txt", score=None):
+        """Create a chunk of TEXT with span metadata."""
+        from langchain_core.documents import Document
+        metadata = {"source": source, "start_index": start}
+        if score is not None:
+            metadata["score"] = score
+        return Document(page_content=self.TEXT[start:end], metadata=metadata)
+    
+    def test_merges_overlapping_chunks(self):
+        """Test overlapping spans from one source become a single passage."""
+        builder = ContextBuilder(max_tokens=500)
+        context = builder.build([self._chunk(25, 60), self._chunk(0, 35)])
+        assert context == self.TEXT[0:60]
+    
+    def test_merges_adjacent_chunks(self):
+        """Test chunks separated only by whitespace are joined."""
+        builder = ContextBuilder(max_tokens=500)
+        context = builder.build([self._chunk(0, 24), self._chunk(25, 48)])
+        assert context == "Annual leave is 18 days.\nSick leave is 10 days."
+    
+    def test_deduplicates_identical_chunks(self):
+        """Test repeated chunks without spans appear once."""
+        from langchain_core.documents import Document
+        doc = Document(page_content="Remote work needs approval.")
+        builder = ContextBuilder(max_tokens=500)
+        assert builder.build([doc, doc, Document(page_content="Remote work")]) == "Remote work needs approval."
+    
+    def test_tight_budget_keeps_top_ranked_union_chunk(self):
+        """Test a multi-query union that overflows the budget keeps its best-ranked chunk."""
+        from langchain_core.documents import Document
+        
+        def doc(text, source):
+            return Document(page_content=text, metadata={"source": source})
+        
+        best = "Annual leave is 18 days per calendar year."
+        sub_query_results = [
+            [doc("Payroll is credited on the last working day.", "payroll.txt"), doc(best, "leave.txt")],
+            [doc(best, "leave.txt"), doc("Laptops must use disk encryption.", "it.txt")],
+            [doc("Performance reviews are held twice a year.", "reviews.txt"), doc(best, "leave.txt")],
+        ]
+        union = DocumentReranker.get_unique_union(sub_query_results)
+        
+        builder = ContextBuilder(max_tokens=500)
+        budget = builder.count_tokens(best) + 2
+        for _ in range(5):
+            assert builder.build(union, max_tokens=budget) == best
+    
+    def test_orders_by_score(self):
+        """Test higher scoring passages come first."""
+        builder = ContextBuilder(max_tokens=500)
+        context = builder.build([
+            self._chunk(0, 24, source="a.txt", score=0.2),
+            self._chunk(48, 81, source="b.txt", score=0.9),
+        ])
+        assert context.startswith("Casual leave")
+    
+    def test_respects_token_budget(self):
+        """Test passages stop at the budget and the best one is truncated to fit."""
+        builder = ContextBuilder(max_tokens=8)
+        docs = [self._chunk(0, 24, source="a.txt"), self._chunk(25, 48, source="b.txt")]
+        
+        context = builder.build(docs)
+        assert builder.count_tokens(context) <= 8
+        assert context.startswith("Annual leave")
+        
+        tiny = builder.build(docs, max_tokens=3)
+        assert 0 < builder.count_tokens(tiny) <= 3
+    
+    def test_generator_uses_builder(self):
+        """Test ResponseGenerator formats documents through the builder."""
+        builder = Mock()
+        builder.build.return_value = "packed"
+        with patch('src.generation.hub'):
+            generator = ResponseGenerator(Mock(), context_builder=builder)
+        
+        assert generator.format_documents([Mock()]) == "packed"
+
+
 class TestRAGPipeline:
     """Test cases for RAGPipeline."""
     
@@ -0,0 +1,76 @@
+"""
+Import-time benchmark for the RAG pipeline package.
+
+Runs ``python -X importtime`` in a fresh interpreter and fails if heavy
+dependencies are imported eagerly or the package import exceeds its budget.
+Run with ``pytest -s`` to see the slowest imports.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Packages that must only load when the component using them is created
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "chromadb",
+    "langchain_groq",
+    "langchain_huggingface",
+    "langchain_community",
+    "langchain_text_splitters",
+    "langsmith",
+    "langchain_core.language_models",
+]
+
+# Cumulative import budget in milliseconds; generous to absorb slow CI machines
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1500"))
+
+
+def measure_imports(module: str):
+    """Import ``module`` in a fresh interpreter and parse the importtime report."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    timings = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative) / 1000
+    return timings
+
+
+def report(module: str, timings, top: int = 10):
+    """Print the slowest imports for debugging regressions."""
+    print(f"\nImport time report for {module} (cumulative ms):")
+    for name, ms in sorted(timings.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {ms:9.1f}  {name}")
+
+
+@pytest.mark.parametrize("module", ["src.orchestrator", "src.__main__"])
+def test_heavy_dependencies_are_lazy(module):
+    """Test importing the pipeline does not pull in heavy dependencies."""
+    timings = measure_imports(module)
+    report(module, timings)
+
+    eager = [name for name in HEAVY_MODULES if name in timings]
+    assert eager == [], f"{module} eagerly imports {eager}"
+
+
+def test_import_time_budget():
+    """Test the package import stays within its time budget."""
+    timings = measure_imports("src.orchestrator")
+    assert timings["src.orchestrator"] <= IMPORT_BUDGET_MS
@@ -5,9 +5,14 @@ Integration tests for the RAG pipeline.
 import pytest
 import os
 import tempfile
+import time
+import numpy as np
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+from langchain_core.documents import Document
+
+from src.correction import RelevanceGrader
 from src.orchestrator import RAGPipeline, PipelineConfig
 
 
@@ -180,6 +185,686 @@ class TestRAGPipelineIntegration:
             assert result["pipeline_stages"]["routing"]["semantic_routing"]["template_name"] == "hr_template"
 
 
+class TestRetrievalReuse:
+    """Each (query, k) pair should be searched at most once per request."""
+    
+    def setup_method(self):
+        """Replace every external component with a mock."""
+        self.patches = [
+            patch('src.orchestrator.ChatGroq'),
+            patch('src.orchestrator.DocumentIndexer'),
+            patch('src.orchestrator.QueryTransformer'),
+            patch('src.orchestrator.ResponseGenerator'),
+            patch('src.orchestrator.LogicalRouter'),
+            patch('src.orchestrator.SemanticRouter'),
+        ]
+        for p in self.patches:
+            p.start()
+    
+    def teardown_method(self):
+        """Remove the component mocks."""
+        for p in self.patches:
+            p.stop()
+    
+    def _build_pipeline(self):
+        """Build a pipeline with a recording retriever."""
+        pipeline = RAGPipeline(PipelineConfig(
+            groq_api_key="test_key",
+            enable_logical_routing=False,
+            enable_semantic_routing=False
+        ))
+        
+        pipeline.retriever = Mock()
+        pipeline.retriever.retrieve_documents.side_effect = lambda q, k: [Mock(page_content=f"doc for {q}")]
+        pipeline.document_reranker = Mock()
+        pipeline.document_reranker.get_unique_union.side_effect = lambda lists: [d for docs in lists for d in docs]
+        return pipeline
+    
+    def test_step_back_retrieves_each_query_once(self):
+        """Test step-back reuses the step-back retrieval during generation."""
+        pipeline = self._build_pipeline()
+        pipeline.query_transformer.step_back_prompting.return_value = "What is the leave policy?"
+        
+        result = pipeline.run_pipeline("Can I carry forward 8 days?", {"transformation_method": "step_back"})
+        
+        searched = [c.args[0] for c in pipeline.retriever.retrieve_documents.call_args_list]
+        assert sorted(searched) == ["Can I carry forward 8 days?", "What is the leave policy?"]
+        assert result["metadata"]["vector_searches"] == 2
+    
+    def test_decomposition_retrieves_each_sub_question_once(self):
+        """Test sub-question retrievals are shared with generation."""
+        pipeline = self._build_pipeline()
+        sub_questions = ["How much annual leave?", "How much sick leave?", "How much annual leave?"]
+        pipeline.query_transformer.decomposition.return_value = sub_questions
+        
+        result = pipeline.run_pipeline("Compare leave types", {"transformation_method": "decomposition"})
+        
+        assert pipeline.retriever.retrieve_documents.call_count == 2
+        assert result["metadata"]["vector_searches"] == 2
+        assert pipeline.response_generator.generate_response_from_docs.call_count == 3
+    
+    def test_hyde_searches_by_cached_vector(self):
+        """Test HyDE searches with the passage embedding instead of re-embedding text."""
+        pipeline = self._build_pipeline()
+        pipeline.query_transformer.hyde_embedding.return_value = ("Employees get 12 sick days.", np.ones(3))
+        pipeline.retriever.retrieve_by_vector.return_value = [Mock(page_content="Sick leave is 12 days.")]
+        
+        result = pipeline.run_pipeline("How many sick days?", {"transformation_method": "hyde"})
+        
+        assert result["pipeline_stages"]["query_transformation"]["transformed_queries"] == ["Employees get 12 sick days."]
+        assert result["pipeline_stages"]["retrieval"]["num_documents"] == 1
+        assert result["metadata"]["vector_searches"] == 1
+        pipeline.retriever.retrieve_documents.assert_not_called()
+    
+    def test_hyde_falls_back_to_text_search(self):
+        """Test retrievers without by-vector search embed the passage as before."""
+        pipeline = self._build_pipeline()
+        pipeline.query_transformer.hyde_embedding.return_value = ("Employees get 12 sick days.", np.ones(3))
+        pipeline.retriever.retrieve_by_vector.return_value = None
+        
+        pipeline.run_pipeline("How many sick days?", {"transformation_method": "hyde"})
+        
+        pipeline.retriever.retrieve_documents.assert_called_once_with("Employees get 12 sick days.", 4)
+
+
+class TestCorrectiveRetrieval:
+    """The corrective method should only escalate when local grades are low."""
+    
+    TOPICS = ["leave", "salary", "laptop"]
+    
+    def setup_method(self):
+        """Replace every external component with a mock."""
+        self.patches = [
+            patch('src.orchestrator.ChatGroq'),
+            patch('src.orchestrator.DocumentIndexer'),
+            patch('src.orchestrator.QueryTransformer'),
+            patch('src.orchestrator.ResponseGenerator'),
+            patch('src.orchestrator.LogicalRouter'),
+            patch('src.orchestrator.SemanticRouter'),
+        ]
+        for p in self.patches:
+            p.start()
+    
+    def teardown_method(self):
+        """Remove the component mocks."""
+        for p in self.patches:
+            p.stop()
+    
+    def embed(self, text):
+        """Embed a text by the topic words it mentions."""
+        return [float(text.count(topic)) for topic in self.TOPICS] + [0.5]
+    
+    def _build_pipeline(self, corpus):
+        """Build a pipeline whose retriever returns ``corpus[query]``."""
+        pipeline = RAGPipeline(PipelineConfig(
+            groq_api_key="test_key",
+            enable_logical_routing=False,
+            enable_semantic_routing=False
+        ))
+        embeddings = Mock()
+        embeddings.embed_query.side_effect = self.embed
+        embeddings.embed_documents.side_effect = lambda texts: [self.embed(text) for text in texts]
+        pipeline.indexer.embeddings = embeddings
+        pipeline.relevance_grader = RelevanceGrader(embeddings, correct_threshold=0.8, incorrect_threshold=0.5)
+        
+        pipeline.retriever = Mock()
+        # A text-only retriever; the query vector is still embedded once for grading
+        pipeline.retriever.retrieve_by_vector.return_value = None
+        pipeline.retriever.retrieve_documents.side_effect = lambda q, k: [Document(page_content=t) for t in corpus[q]]
+        pipeline.retriever.retrieve_with_scores.side_effect = (
+            lambda q, k: [(Document(page_content=t), 0.0) for t in corpus["wide:" + q]]
+        )
+        return pipeline
+    
+    def test_relevant_results_take_the_fast_path(self):
+        """Test well-graded results skip rewriting and extra searches."""
+        pipeline = self._build_pipeline({"leave days": ["leave days per year", "laptop rules"]})
+        
+        result = pipeline.run_pipeline("leave days", {"transformation_method": "corrective"})
+        
+        assert result["pipeline_stages"]["correction"]["action"] == "correct"
+        assert result["metadata"]["vector_searches"] == 1
+        pipeline.indexer.embeddings.embed_query.assert_called_once_with("leave days")
+        pipeline.query_transformer.rewrite_query.assert_not_called()
+        docs = pipeline.response_generator.generate_response_from_docs.call_args.args[0]
+        assert [doc.page_content for doc in docs] == ["leave days per year"]
+    
+    def test_ambiguous_results_widen_the_search(self):
+        """Test middling grades trigger a wider search but no LLM call."""
+        pipeline = self._build_pipeline({
+            "leave salary laptop": ["salary slip"],
+            "wide:leave salary laptop": ["salary slip", "leave and salary and laptop"],
+        })
+        
+        result = pipeline.run_pipeline("leave salary laptop", {"transformation_method": "corrective"})
+        
+        correction = result["pipeline_stages"]["correction"]
+        assert (correction["action"], correction["final_action"]) == ("ambiguous", "correct")
+        assert result["metadata"]["vector_searches"] == 2
+        pipeline.query_transformer.rewrite_query.assert_not_called()
+        # The wider search repeats "salary slip", which is not embedded again
+        embedded = [text for call in pipeline.indexer.embeddings.embed_documents.call_args_list for text in call.args[0]]
+        assert embedded == ["salary slip", "leave and salary and laptop"]
+    
+    def test_chunk_embeddings_are_cached_across_requests(self):
+        """Test chunks graded by an earlier request are not embedded again."""
+        pipeline = self._build_pipeline({"leave days": ["leave days per year", "laptop rules"]})
+        
+        for _ in range(3):
+            pipeline.run_pipeline("leave days", {"transformation_method": "corrective"})
+        
+        assert pipeline.indexer.embeddings.embed_documents.call_count == 1
+        assert pipeline.relevance_grader.embedded == 2
+        assert pipeline.relevance_grader.cache_hits == 4
+    
+    def test_irrelevant_results_rewrite_the_query_once(self):
+        """Test low grades rewrite the query with one LLM call and search again."""
+        pipeline = self._build_pipeline({"time off": ["laptop rules"], "leave policy": ["leave policy details"]})
+        pipeline.query_transformer.rewrite_query.return_value = "leave policy"
+        
+        result = pipeline.run_pipeline("time off", {"transformation_method": "corrective"})
+        
+        correction = result["pipeline_stages"]["correction"]
+        assert correction["action"] == "incorrect"
+        assert correction["rewritten_query"] == "leave policy"
+        pipeline.query_transformer.rewrite_query.assert_called_once_with("time off")
+        assert result["metadata"]["vector_searches"] == 2
+
+
+class TestAutoMethodSelection:
+    """The auto method should only pay for query transformations when needed."""
+    
+    def setup_method(self):
+        """Replace every external component with a mock."""
+        self.patches = [
+            patch('src.orchestrator.ChatGroq'),
+            patch('src.orchestrator.DocumentIndexer'),
+            patch('src.orchestrator.QueryTransformer'),
+            patch('src.orchestrator.ResponseGenerator'),
+            patch('src.orchestrator.LogicalRouter'),
+            patch('src.orchestrator.SemanticRouter'),
+        ]
+        for p in self.patches:
+            p.start()
+    
+    def teardown_method(self):
+        """Remove the component mocks."""
+        for p in self.patches:
+            p.stop()
+    
+    def _build_pipeline(self, grades, sources):
+        """Build a pipeline whose basic retrieval gets the given grades."""
+        pipeline = RAGPipeline(PipelineConfig(
+            groq_api_key="test_key",
+            enable_logical_routing=False,
+            enable_semantic_routing=False
+        ))
+        pipeline.retriever = Mock()
+        pipeline.retriever.retrieve_by_vector.return_value = None
+        pipeline.retriever.retrieve_documents.side_effect = lambda q, k: [
+            Document(page_content=f"{q} {i}", metadata={"source": source}) for i, source in enumerate(sources)
+        ]
+        pipeline.relevance_grader = Mock()
+        pipeline.relevance_grader.grade.return_value = np.array(grades)
+        pipeline.document_reranker = Mock()
+        pipeline.document_reranker.get_unique_union.side_effect = lambda lists: [d for docs in lists for d in docs]
+        return pipeline
+    
+    def test_confident_retrieval_stays_basic(self):
+        """Test a clear, consistent top result skips query transformation."""
+        pipeline = self._build_pipeline([0.8, 0.6, 0.5], ["leave.txt", "leave.txt", "pay.txt"])
+        
+        result = pipeline.run_pipeline("How many sick days?", {"transformation_method": "auto"})
+        
+        selection = result["pipeline_stages"]["method_selection"]
+        assert selection["method"] == "basic" and not selection["escalated"]
+        assert selection["confidence"]["source_agreement"] == pytest.approx(0.667, abs=1e-3)
+        assert result["metadata"]["vector_searches"] == 1
+        pipeline.query_transformer.rag_fusion_generation.assert_not_called()
+        # Grading reuses the query vector embedded for retrieval
+        pipeline.indexer.embeddings.embed_query.assert_called_once_with("How many sick days?")
+        assert pipeline.relevance_grader.grade.call_args.args[2] is not None
+    
+    def test_low_confidence_escalates_to_fallback(self):
+        """Test a weak top score runs the fallback method and reuses the basic search."""
+        pipeline = self._build_pipeline([0.3, 0.29], ["leave.txt", "pay.txt"])
+        pipeline.query_transformer.rag_fusion_generation.return_value = ["time off rules", "holiday policy"]
+        
+        result = pipeline.run_pipeline("days off?", {"transformation_method": "auto"})
+        
+        selection = result["pipeline_stages"]["method_selection"]
+        assert selection["method"] == "rag_fusion" and selection["escalated"]
+        assert "low top score" in selection["reason"]
+        assert result["pipeline_stages"]["query_transformation"]["transformed_queries"][0] == "days off?"
+        assert pipeline.retriever.retrieve_documents.call_count == 3
+    
+    def test_split_sources_without_a_clear_winner_escalate(self):
+        """Test near-tied results from different files count as low confidence."""
+        pipeline = self._build_pipeline([0.7, 0.69, 0.68], ["leave.txt", "pay.txt", "wfh.txt"])
+        pipeline.query_transformer.rag_fusion_generation.return_value = ["q1"]
+        
+        result = pipeline.run_pipeline("benefits", {"transformation_method": "auto"})
+        
+        assert result["pipeline_stages"]["method_selection"]["reason"] == "results split across sources"
+
+
+class TestRequestCoalescing:
+    """Identical concurrent requests should share one pipeline run."""
+    
+    def setup_method(self):
+        """Replace every external component with a mock."""
+        self.patches = [
+            patch('src.orchestrator.ChatGroq'),
+            patch('src.orchestrator.DocumentIndexer'),
+            patch('src.orchestrator.QueryTransformer'),
+            patch('src.orchestrator.ResponseGenerator'),
+            patch('src.orchestrator.LogicalRouter'),
+            patch('src.orchestrator.SemanticRouter'),
+        ]
+        for p in self.patches:
+            p.start()
+    
+    def teardown_method(self):
+        """Remove the component mocks."""
+        for p in self.patches:
+            p.stop()
+    
+    def _run_concurrently(self, queries, coalesce=True):
+        """Run the queries at once while the first retrieval is held open."""
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        
+        pipeline = RAGPipeline(PipelineConfig(
+            groq_api_key="test_key",
+            enable_logical_routing=False,
+            enable_semantic_routing=False,
+            coalesce_requests=coalesce
+        ))
+        release = threading.Event()
+        pipeline.retriever = Mock()
+        pipeline.retriever.retrieve_documents.side_effect = (
+            lambda q, k: release.wait(5) and [Document(page_content="Sick leave is 12 days.")]
+        )
+        pipeline.response_generator.generate_response_from_docs.return_value = "12 days"
+        
+        with ThreadPoolExecutor(len(queries)) as pool:
+            futures = [pool.submit(pipeline.run_pipeline, q) for q in queries]
+            deadline = time.monotonic() + 5
+            while pipeline.retriever.retrieve_documents.call_count == 0 and time.monotonic() < deadline:
+                time.sleep(0.005)
+            if coalesce:
+                while pipeline.single_flight.stats()["coalesced"] < len(queries) - 1 and time.monotonic() < deadline:
+                    time.sleep(0.005)
+            release.set()
+            return pipeline, [f.result(5) for f in futures]
+    
+    def test_identical_queries_run_once(self):
+        """Test normalized duplicates share the leader's retrieval and answer."""
+        queries = ["How many sick days?", "how many  SICK days?", "How many sick days?"]
+        pipeline, results = self._run_concurrently(queries)
+        
+        assert pipeline.retriever.retrieve_documents.call_count == 1
+        assert pipeline.response_generator.generate_response_from_docs.call_count == 1
+        assert [r["final_answer"] for r in results] == ["12 days"] * 3
+        assert [r["query"] for r in results] == queries
+        assert sum(bool(r["metadata"].get("coalesced")) for r in results) == 2
+    
+    def test_coalescing_can_be_disabled(self):
+        """Test every request runs its own pipeline when coalescing is off."""
+        pipeline, results = self._run_concurrently(["How many sick days?"] * 2, coalesce=False)
+        
+        assert pipeline.retriever.retrieve_documents.call_count == 2
+        assert not any(r["metadata"].get("coalesced") for r in results)
+
+
+class TestRequestDeadlines:
+    """Optional stages should give way to basic RAG when the time budget runs short."""
+    
+    def setup_method(self):
+        """Replace every external component with a mock."""
+        self.patches = [
+            patch('src.orchestrator.ChatGroq'),
+            patch('src.orchestrator.DocumentIndexer'),
+            patch('src.orchestrator.QueryTransformer'),
+            patch('src.orchestrator.ResponseGenerator'),
+            patch('src.orchestrator.LogicalRouter'),
+            patch('src.orchestrator.SemanticRouter'),
+        ]
+        for p in self.patches:
+            p.start()
+    
+    def teardown_method(self):
+        """Remove the component mocks."""
+        for p in self.patches:
+            p.stop()
+    
+    def _build_pipeline(self, **config):
+        """Build a pipeline with a recording retriever and generator."""
+        config = {"enable_logical_routing": False, "enable_semantic_routing": False, **config}
+        pipeline = RAGPipeline(PipelineConfig(groq_api_key="test_key", **config))
+        pipeline.retriever = Mock()
+        pipeline.retriever.retrieve_documents.side_effect = lambda q, k: [Document(page_content=f"doc for {q}")]
+        pipeline.response_generator.generate_response_from_docs.return_value = "basic answer"
+        return pipeline
+    
+    def test_short_budget_skips_transformation(self):
+        """Test a budget inside the generation reserve answers with basic RAG."""
+        pipeline = self._build_pipeline(request_budget=2.0, generation_reserve=5.0)
+        
+        result = pipeline.run_pipeline("How many sick days?", {"transformation_method": "multi_query"})
+        
+        assert result["final_answer"] == "basic answer"
+        assert result["pipeline_stages"]["query_transformation"]["method"] == "basic"
+        assert result["pipeline_stages"]["degradation"][0]["stage"] == "query_transformation"
+        assert result["pipeline_stages"]["degradation"][0]["action"] == "skipped"
+        pipeline.query_transformer.multi_query_generation.assert_not_called()
+        pipeline.retriever.retrieve_documents.assert_called_once_with("How many sick days?", 4)
+    
+    def test_timed_out_transformation_falls_back_to_basic(self):
+        """Test a transformation cut off by the deadline is recorded and replaced by basic retrieval."""
+        from src.llm_scheduler import DeadlineExceeded
+        
+        pipeline = self._build_pipeline()
+        pipeline.query_transformer.rag_fusion_generation.side_effect = DeadlineExceeded("deadline")
+        
+        result = pipeline.run_pipeline("How many sick days?", {"transformation_method": "rag_fusion"})
+        
+        assert "error" not in result
+        assert result["pipeline_stages"]["degradation"] == [
+            {"stage": "query_transformation", "action": "cancelled", "reason": "deadline"}
+        ]
+        assert "reranking" not in result["pipeline_stages"]
+        assert result["final_answer"] == "basic answer"
+    
+    def test_timed_out_routing_is_a_degradation_not_an_error(self):
+        """Test an LLM router cut off by the deadline is recorded like other cancelled stages."""
+        from src.llm_scheduler import DeadlineExceeded
+        
+        pipeline = self._build_pipeline(enable_logical_routing=True, enable_semantic_routing=True)
+        pipeline.retriever.retrieve_by_vector.return_value = None
+        pipeline.logical_router.route_with_details.side_effect = DeadlineExceeded("deadline")
+        pipeline.semantic_router.route_query.return_value = {"template_name": "hr_template"}
+        
+        result = pipeline.run_pipeline("How many sick days?")
+        
+        assert result["pipeline_stages"]["degradation"] == [
+            {"stage": "logical_routing", "action": "cancelled", "reason": "deadline"}
+        ]
+        assert result["pipeline_stages"]["routing"] == {"semantic_routing": {"template_name": "hr_template"}}
+        assert result["final_answer"] == "basic answer"
+    
+    def test_decomposition_degrades_to_direct_answer(self):
+        """Test sub-answers that run out of time are replaced by one basic answer."""
+        from src.llm_scheduler import DeadlineExceeded
+        
+        pipeline = self._build_pipeline()
+        pipeline.query_transformer.decomposition.return_value = ["Annual leave?", "Sick leave?"]
+        pipeline.response_generator.generate_response_from_docs.side_effect = [
+            DeadlineExceeded("deadline"), "basic answer"
+        ]
+        
+        result = pipeline.run_pipeline("Compare leave types", {"transformation_method": "decomposition"})
+        
+        assert result["final_answer"] == "basic answer"
+        assert result["pipeline_stages"]["degradation"][0]["stage"] == "decomposed_generation"
+        docs, question = pipeline.response_generator.generate_response_from_docs.call_args.args
+        assert question == "Compare leave types"
+        pipeline.response_generator.generate_decomposed_response.assert_not_called()
+    
+    def test_budget_can_be_disabled_per_request(self):
+        """Test a null budget runs every stage and reports no deadline."""
+        pipeline = self._build_pipeline(request_budget=0.001)
+        pipeline.query_transformer.multi_query_generation.return_value = ["q1", "q2"]
+        pipeline.document_reranker = Mock()
+        pipeline.document_reranker.get_unique_union.side_effect = lambda lists: [d for docs in lists for d in docs]
+        
+        result = pipeline.run_pipeline(
+            "How many sick days?",
+            {"transformation_method": "multi_query", "request_budget": None}
+        )
+        
+        assert "degradation" not in result["pipeline_stages"]
+        assert "time_remaining" not in result["metadata"]
+        assert result["pipeline_stages"]["query_transformation"]["transformed_queries"] == ["q1", "q2"]
+
+
+class TestQueryEmbeddingReuse:
+    """Retrieval and routing should share one embedding of the user's query."""
+    
+    def test_query_is_embedded_once_per_request(self):
+        """Test routing reuses the vector retrieval searched with."""
+        with patch('src.orchestrator.ChatGroq'), \
+             patch('src.orchestrator.DocumentIndexer'), \
+             patch('src.orchestrator.ResponseGenerator'), \
+             patch('src.orchestrator.LogicalRouter'), \
+             patch('src.orchestrator.SemanticRouter'):
+            pipeline = RAGPipeline(PipelineConfig(
+                groq_api_key="test_key",
+                enable_logical_routing=True,
+                enable_semantic_routing=True
+            ))
+            pipeline.indexer.embeddings.embed_query.return_value = [0.6, 0.8]
+            pipeline.retriever = Mock()
+            pipeline.retriever.retrieve_by_vector.return_value = [Document(page_content="Sick leave is 10 days.")]
+            pipeline.logical_router.route_with_details.return_value = {"datasource": "leave_policy.txt"}
+            pipeline.semantic_router.route_query.return_value = {"template_name": "hr_template"}
+            
+            result = pipeline.run_pipeline("How many sick days?")
+            
+            assert "error" not in result
+            pipeline.indexer.embeddings.embed_query.assert_called_once_with("How many sick days?")
+            pipeline.retriever.retrieve_documents.assert_not_called()
+            vector = pipeline.retriever.retrieve_by_vector.call_args.args[0]
+            assert pipeline.logical_router.route_with_details.call_args.args[1] is vector
+            assert pipeline.semantic_router.route_query.call_args.args[1] is vector
+
+
+class TestCoalescingBeforeAdmission:
+    """Identical API requests should share one admission instead of being shed."""
+    
+    def test_identical_burst_is_not_shed(self):
+        """Test K identical concurrent queries with capacity below K all succeed on one run."""
+        import asyncio
+        import app as api
+        from src.admission import AdmissionController
+        
+        with patch('src.orchestrator.ChatGroq'):
+            pipeline = RAGPipeline(PipelineConfig(groq_api_key="test_key"))
+        
+        def slow_run(query, config_override=None):
+            time.sleep(0.2)
+            return {
+                "query": query,
+                "final_answer": "10 days",
+                "execution_time": 0.2,
+                "pipeline_stages": {},
+                "metadata": {}
+            }
+        
+        async def burst():
+            questions = ["How many sick days?", "how many  sick days?"] * 3
+            return await asyncio.gather(
+                *(api.process_query(api.QueryRequest(query=q)) for q in questions),
+                return_exceptions=True
+            )
+        
+        admission = AdmissionController(capacity=1, max_queue=0, queue_timeout=0.1)
+        with patch.object(pipeline, "_run_pipeline", side_effect=slow_run) as run, \
+             patch.object(api, "pipeline", pipeline), \
+             patch.object(api, "admission", admission):
+            responses = asyncio.run(burst())
+        
+        assert all(isinstance(response, api.QueryResponse) for response in responses), responses
+        assert [response.final_answer for response in responses] == ["10 days"] * 6
+        assert responses[1].query == "how many  sick days?"
+        run.assert_called_once()
+        assert admission.stats()["admitted"] == 1
+        assert admission.stats()["rejected_queue_full"] == 0
+        assert api.in_flight == {}
+
+
+class TestLLMSchedulerStubServer:
+    """The scheduler should ride out 429s and slow responses from a real HTTP server."""
+    
+    def _client(self, stub, timeout=5):
+        langchain_groq = pytest.importorskip("langchain_groq")
+        return langchain_groq.ChatGroq(
+            model="stub-model",
+            api_key="test_key",
+            base_url=stub.url,
+            max_retries=0,
+            timeout=timeout
+        )
+    
+    def test_rate_limits_are_retried(self):
+        """Test 429 responses are retried until the stub answers."""
+        from benchmarks.stub_llm_server import StubLLMServer
+        from src.llm_scheduler import LLMScheduler, ScheduledLLM
+        
+        with StubLLMServer(rate_limit_first=2, retry_after=0) as stub:
+            scheduler = LLMScheduler(backoff_base=0.01)
+            answer = ScheduledLLM(self._client(stub), scheduler).invoke("How many sick days?")
+        
+        assert answer.content == "stub answer"
+        assert stub.requests == 3
+        assert scheduler.stats()["rate_limited"] == 2
+    
+    def test_slow_responses_are_hedged(self):
+        """Test a slow first response is beaten by a hedged request."""
+        from benchmarks.stub_llm_server import StubLLMServer
+        from src.llm_scheduler import LLMScheduler, ScheduledLLM
+        
+        with StubLLMServer(delays=[2.0]) as stub:
+            scheduler = LLMScheduler(hedge_after=0.1, call_timeout=5)
+            start = time.monotonic()
+            answer = ScheduledLLM(self._client(stub), scheduler).invoke("How many sick days?")
+            elapsed = time.monotonic() - start
+        
+        assert answer.content == "stub answer"
+        assert elapsed < 1.5
+        assert scheduler.stats()["hedge_wins"] == 1
+    
+    def test_stalled_responses_time_out(self):
+        """Test an attempt that never answers in time fails instead of hanging."""
+        from benchmarks.stub_llm_server import StubLLMServer
+        from src.llm_scheduler import LLMScheduler, LLMTimeout, ScheduledLLM
+        
+        with StubLLMServer(delay=1.0) as stub:
+            scheduler = LLMScheduler(call_timeout=0.2, max_retries=1, backoff_base=0.01)
+            with pytest.raises(LLMTimeout):
+                ScheduledLLM(self._client(stub, timeout=0.2), scheduler).invoke("How many sick days?")
+        
+        assert scheduler.stats()["timeouts"] == 2
+
+
+class TestHTTPConnectionPool:
+    """LLM clients should share warm connections instead of opening new ones."""
+    
+    def test_pipelines_share_pool_clients(self):
+        """Test every pipeline hands the same pooled httpx clients to ChatGroq."""
+        with patch('src.orchestrator.ChatGroq') as mock_chatgroq:
+            first = RAGPipeline(PipelineConfig(groq_api_key="test_key"))
+            second = RAGPipeline(PipelineConfig(groq_api_key="test_key", llm_scheduler=False))
+            first.llm, second.llm
+        
+        assert first.http_pool is second.http_pool
+        for call in mock_chatgroq.call_args_list:
+            assert call.kwargs["http_client"] is first.http_pool.sync_client
+            assert call.kwargs["http_async_client"] is first.http_pool.async_client
+        
+    def test_concurrent_fan_out_reuses_connections(self):
+        """Test concurrent calls through the pool open at most one connection per call in flight."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        langchain_groq = pytest.importorskip("langchain_groq")
+        from benchmarks.stub_llm_server import StubLLMServer
+        from src.http_pool import HTTPClientPool
+        
+        pool = HTTPClientPool(max_connections=4, max_keepalive_connections=4)
+        with StubLLMServer(delay=0.01) as stub:
+            llm = langchain_groq.ChatGroq(
+                model="stub-model",
+                api_key="test_key",
+                base_url=stub.url,
+                max_retries=0,
+                http_client=pool.sync_client
+            )
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                answers = list(executor.map(lambda i: llm.invoke(f"sub-question {i}").content, range(20)))
+            open_connections = pool.stats()["open_connections"]
+            pool.close()
+        
+        stats = pool.stats()
+        assert answers == ["stub answer"] * 20
+        assert stub.requests == stats["requests"] == 20
+        assert stub.connections == stats["connections_opened"] <= 4
+        assert 0 < open_connections <= 4
+        assert stats["reuse_rate"] >= 0.8
+
+
+class TestLazyInitialization:
+    """Components should be built on first use or by warm-up, not in __init__."""
+    
+    def test_init_builds_nothing(self):
+        """Test constructing the pipeline does not touch heavy components."""
+        with patch('src.orchestrator.ChatGroq') as mock_chatgroq, \
+             patch('src.orchestrator.DocumentIndexer') as mock_indexer:
+            pipeline = RAGPipeline(PipelineConfig(groq_api_key="test_key", enable_semantic_routing=False))
+            
+            mock_chatgroq.assert_not_called()
+            mock_indexer.assert_not_called()
+            status = pipeline.component_status()
+            assert status["llm"] == "not_loaded"
+            assert status["semantic_router"] == "disabled"
+            
+            assert pipeline.indexer is mock_indexer.return_value
+            assert pipeline.indexer is mock_indexer.return_value
+            mock_indexer.assert_called_once()
+            assert pipeline.component_status()["indexer"] == "ready"
+    
+    def test_warm_up_reports_readiness(self):
+        """Test warm-up builds enabled components and records failures."""
+        with patch('src.orchestrator.ChatGroq'), \
+             patch('src.orchestrator.DocumentIndexer'), \
+             patch('src.orchestrator.QueryTransformer'), \
+             patch('src.orchestrator.LogicalRouter'), \
+             patch('src.orchestrator.ResponseGenerator', side_effect=RuntimeError("hub offline")):
+            pipeline = RAGPipeline(PipelineConfig(groq_api_key="test_key", enable_semantic_routing=False))
+            
+            status = pipeline.warm_up()
+        
+        assert status["llm"] == "ready"
+        assert status["retriever"] == "ready"
+        assert status["logical_router"] == "ready"
+        assert status["semantic_router"] == "disabled"
+        assert status["response_generator"] == "failed: hub offline"
+    
+    def test_preload_maps_index_without_building(self):
+        """Test preloading (before fork) never builds the index."""
+        with patch('src.orchestrator.ChatGroq'), \
+             patch('src.orchestrator.DocumentIndexer') as mock_indexer:
+            pipeline = RAGPipeline(PipelineConfig(groq_api_key="test_key"))
+            mock_indexer.return_value.load_vectorstore.return_value = None
+            
+            status = pipeline.preload()
+            
+            mock_indexer.return_value.create_vectorstore.assert_not_called()
+            mock_indexer.return_value.get_retriever.assert_not_called()
+            assert status["indexer"] == "ready"
+            assert status["retriever"] == "not_loaded"
+            
+            mock_indexer.return_value.load_vectorstore.return_value = Mock()
+            assert pipeline.preload()["retriever"] == "ready"
+            mock_indexer.return_value.create_vectorstore.assert_not_called()
+    
+    def test_unknown_attribute_raises(self):
+        """Test non-component attributes still raise AttributeError."""
+        pipeline = RAGPipeline(PipelineConfig(groq_api_key="test_key"))
+        with pytest.raises(AttributeError):
+            pipeline.not_a_component
+
+
 class TestAPIIntegration:
     """Integration tests for the FastAPI application."""
     